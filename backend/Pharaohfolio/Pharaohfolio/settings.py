@@ -93,6 +93,8 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Refreshed access tokens carry the user's current profile claims
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.authentication.ClaimsTokenRefreshSerializer',
 }
 
 
@@ -137,6 +139,33 @@ WSGI_APPLICATION = 'Pharaohfolio.wsgi.application'
 
 AUTH_USER_MODEL = 'accounts.User'
 
+# Login accepts a username or an email address, see accounts/backends.py
+AUTHENTICATION_BACKENDS = ['accounts.backends.UsernameOrEmailBackend']
+
+# Served through asgi.py, login, register, change-password and password reset
+# confirm run in a bounded thread pool; requests beyond the workers plus the
+# queue get a 503
+AUTH_ASYNC_VIEWS = config('AUTH_ASYNC_VIEWS', default=False, cast=bool)
+AUTH_HASHING_POOL_WORKERS = config('AUTH_HASHING_POOL_WORKERS', default=os.cpu_count() or 1, cast=int)
+AUTH_HASHING_POOL_MAX_QUEUE = config('AUTH_HASHING_POOL_MAX_QUEUE', default=32, cast=int)
+
+# Seconds a user loaded by ClaimsJWTAuthentication is reused within a process
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=30, cast=int)
+# Users kept in that cache; the oldest are dropped beyond it
+AUTH_USER_CACHE_MAX_ENTRIES = config('AUTH_USER_CACHE_MAX_ENTRIES', default=10000, cast=int)
+
+# Refresh and logout check a per-process Bloom filter of blacklisted tokens,
+# see accounts/blacklist.py. Blacklisting in another process is seen within
+# AUTH_BLACKLIST_CACHE_SYNC_SECONDS; 0 checks the table for new rows each time.
+AUTH_BLACKLIST_CACHE_SYNC_SECONDS = config('AUTH_BLACKLIST_CACHE_SYNC_SECONDS', default=5.0, cast=float)
+AUTH_BLACKLIST_CACHE_REBUILD_SECONDS = config('AUTH_BLACKLIST_CACHE_REBUILD_SECONDS', default=3600, cast=int)
+AUTH_BLACKLIST_CACHE_CAPACITY = config('AUTH_BLACKLIST_CACHE_CAPACITY', default=100000, cast=int)
+AUTH_BLACKLIST_CACHE_ERROR_RATE = config('AUTH_BLACKLIST_CACHE_ERROR_RATE', default=0.001, cast=float)
+# Expired outstanding and blacklisted tokens are deleted this often by
+# compact_token_tables, this many per batch
+AUTH_TOKEN_COMPACTION_SECONDS = config('AUTH_TOKEN_COMPACTION_SECONDS', default=3600, cast=int)
+AUTH_TOKEN_COMPACTION_BATCH_SIZE = config('AUTH_TOKEN_COMPACTION_BATCH_SIZE', default=1000, cast=int)
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -253,10 +282,140 @@ LOGGING = {
     },
 }
 
+# Caches: the sanitizer cache is content-addressed and evicts least recently
+# used entries one at a time once MAX_ENTRIES is reached or its results
+# would take more than PORTFOLIO_SANITIZER_CACHE_MAX_TOTAL_BYTES per process
+PORTFOLIO_SANITIZER_CACHE_MAX_ENTRIES = config('PORTFOLIO_SANITIZER_CACHE_MAX_ENTRIES', default=256, cast=int)
+PORTFOLIO_SANITIZER_CACHE_MAX_TOTAL_BYTES = config('PORTFOLIO_SANITIZER_CACHE_MAX_TOTAL_BYTES', default=32 * 1024 * 1024, cast=int)
+# The public portfolio cache holds each payload with its compressed variants,
+# in two formats per user. By default it is bounded the same way, by
+# PORTFOLIO_PUBLIC_CACHE_MAX_TOTAL_BYTES per process, and with any backend
+# payloads over PORTFOLIO_PUBLIC_CACHE_MAX_PAYLOAD_BYTES are served uncached
+PORTFOLIO_PUBLIC_CACHE_BACKEND = config('PORTFOLIO_PUBLIC_CACHE_BACKEND', default='portfolio.sanitization.cache.SizeBoundedLocMemCache')
+PORTFOLIO_PUBLIC_CACHE_MAX_TOTAL_BYTES = config('PORTFOLIO_PUBLIC_CACHE_MAX_TOTAL_BYTES', default=64 * 1024 * 1024, cast=int)
+PORTFOLIO_PUBLIC_CACHE_MAX_PAYLOAD_BYTES = config('PORTFOLIO_PUBLIC_CACHE_MAX_PAYLOAD_BYTES', default=1024 * 1024, cast=int)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sanitizer': {
+        'BACKEND': 'portfolio.sanitization.cache.SizeBoundedLocMemCache',
+        'LOCATION': 'pharaohfolio-sanitizer',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': PORTFOLIO_SANITIZER_CACHE_MAX_ENTRIES,
+            'CULL_FREQUENCY': PORTFOLIO_SANITIZER_CACHE_MAX_ENTRIES,
+            'MAX_BYTES': PORTFOLIO_SANITIZER_CACHE_MAX_TOTAL_BYTES,
+        },
+    },
+    # Rendered public portfolio payloads. Invalidation is explicit, but a
+    # per-process backend such as locmem only drops its own copy, so with
+    # several workers use a shared one (e.g. FileBasedCache) or keep the
+    # timeout short
+    'public_portfolios': {
+        'BACKEND': PORTFOLIO_PUBLIC_CACHE_BACKEND,
+        'LOCATION': config('PORTFOLIO_PUBLIC_CACHE_LOCATION', default='pharaohfolio-public'),
+        'TIMEOUT': config('PORTFOLIO_PUBLIC_CACHE_TIMEOUT', default=300, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('PORTFOLIO_PUBLIC_CACHE_MAX_ENTRIES', default=1000, cast=int),
+            # Only understood by SizeBoundedLocMemCache
+            **({'MAX_BYTES': PORTFOLIO_PUBLIC_CACHE_MAX_TOTAL_BYTES}
+               if PORTFOLIO_PUBLIC_CACHE_BACKEND.endswith('.SizeBoundedLocMemCache') else {}),
+        },
+    },
+    # Markers of recent user changes, read on every request authenticated by
+    # ClaimsJWTAuthentication. Must be shared between processes for a change
+    # to reach other workers before their tokens expire
+    'auth': {
+        'BACKEND': config('AUTH_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('AUTH_CACHE_LOCATION', default='pharaohfolio-auth'),
+    },
+}
+
+# Submissions larger than this are sanitized but not cached
+PORTFOLIO_SANITIZER_CACHE_MAX_BYTES = config('PORTFOLIO_SANITIZER_CACHE_MAX_BYTES', default=2 * 1024 * 1024, cast=int)
+
+# Portfolio sanitizer engine: 'regex' (one pass per rule) or 'tokenizer' (single pass)
+PORTFOLIO_SANITIZER_ENGINE = config('PORTFOLIO_SANITIZER_ENGINE', default='regex')
+
+# Wall-clock seconds one sanitization may take before the save is rejected
+PORTFOLIO_SANITIZER_TIME_BUDGET = config('PORTFOLIO_SANITIZER_TIME_BUDGET', default=5.0, cast=float)
+
+# Process pool for large sanitizations; smaller saves are sanitized inline
+PORTFOLIO_SANITIZER_POOL_ENABLED = config('PORTFOLIO_SANITIZER_POOL_ENABLED', default=False, cast=bool)
+PORTFOLIO_SANITIZER_POOL_THRESHOLD = config('PORTFOLIO_SANITIZER_POOL_THRESHOLD', default=512 * 1024, cast=int)
+PORTFOLIO_SANITIZER_POOL_WORKERS = config('PORTFOLIO_SANITIZER_POOL_WORKERS', default=2, cast=int)
+PORTFOLIO_SANITIZER_POOL_TIMEOUT = config('PORTFOLIO_SANITIZER_POOL_TIMEOUT', default=10.0, cast=float)
+PORTFOLIO_SANITIZER_POOL_MEMORY_LIMIT = config('PORTFOLIO_SANITIZER_POOL_MEMORY_LIMIT', default=1024 * 1024 * 1024, cast=int)
+PORTFOLIO_SANITIZER_POOL_START_METHOD = config('PORTFOLIO_SANITIZER_POOL_START_METHOD', default='spawn')
+
+# Re-sanitize portfolios stored under an older sanitization policy when they are read;
+# otherwise stale rows are reprocessed by manage.py resanitize_portfolios
+PORTFOLIO_RESANITIZE_ON_READ = config('PORTFOLIO_RESANITIZE_ON_READ', default=False, cast=bool)
+
+# Sanitization events: how many get_code lists, and what
+# manage.py compact_sanitization_events keeps
+PORTFOLIO_SANITIZATION_EVENTS_LISTED = config('PORTFOLIO_SANITIZATION_EVENTS_LISTED', default=20, cast=int)
+PORTFOLIO_SANITIZATION_EVENTS_RETENTION_DAYS = config('PORTFOLIO_SANITIZATION_EVENTS_RETENTION_DAYS', default=90, cast=int)
+PORTFOLIO_SANITIZATION_EVENTS_MAX_PER_PORTFOLIO = config('PORTFOLIO_SANITIZATION_EVENTS_MAX_PER_PORTFOLIO', default=100, cast=int)
+
+# Seconds after a portfolio write during which further saves from the same
+# user are collapsed into one trailing write; 0 turns coalescing off
+PORTFOLIO_SAVE_COALESCE_WINDOW = config('PORTFOLIO_SAVE_COALESCE_WINDOW', default=0.0, cast=float)
+
+# Public payloads are gzipped and brotli-compressed at save time. Payloads
+# smaller than this are stored as they are
+PORTFOLIO_COMPRESSION_MIN_BYTES = config('PORTFOLIO_COMPRESSION_MIN_BYTES', default=1024, cast=int)
+# Brotli runs on the save request, for two formats of bodies up to the code
+# size limit: 11 takes many times the CPU of 5 for output only about a tenth smaller
+PORTFOLIO_BROTLI_QUALITY = config('PORTFOLIO_BROTLI_QUALITY', default=5, cast=int)
+
+# Static export of published portfolios to a content-addressed file store,
+# for serving public traffic from the web server or CDN. The backend is a
+# StaticExportBackend subclass, built with the root below
+PORTFOLIO_STATIC_EXPORT_ENABLED = config('PORTFOLIO_STATIC_EXPORT_ENABLED', default=False, cast=bool)
+PORTFOLIO_STATIC_EXPORT_BACKEND = config('PORTFOLIO_STATIC_EXPORT_BACKEND', default='portfolio.publish.backends.LocalDirectoryBackend')
+PORTFOLIO_STATIC_EXPORT_ROOT = config('PORTFOLIO_STATIC_EXPORT_ROOT', default=str(BASE_DIR / 'static_portfolios'))
+# Unreferenced objects written or republished more recently than this are
+# not pruned, as a concurrent publish may be about to point at them
+PORTFOLIO_STATIC_EXPORT_PRUNE_GRACE_SECONDS = config('PORTFOLIO_STATIC_EXPORT_PRUNE_GRACE_SECONDS', default=3600, cast=int)
+
+# In-process Bloom filter of published usernames; public portfolio lookups
+# for names certainly not in it never reach the database. Publishes from
+# other processes are only seen before the next rebuild when the
+# public_portfolios cache is shared
+PORTFOLIO_USERNAME_FILTER_ENABLED = config('PORTFOLIO_USERNAME_FILTER_ENABLED', default=False, cast=bool)
+PORTFOLIO_USERNAME_FILTER_CAPACITY = config('PORTFOLIO_USERNAME_FILTER_CAPACITY', default=100000, cast=int)
+PORTFOLIO_USERNAME_FILTER_ERROR_RATE = config('PORTFOLIO_USERNAME_FILTER_ERROR_RATE', default=0.01, cast=float)
+PORTFOLIO_USERNAME_FILTER_REBUILD_SECONDS = config('PORTFOLIO_USERNAME_FILTER_REBUILD_SECONDS', default=300, cast=int)
+
+# Public portfolio views are counted in memory by each worker and written
+# as daily totals at most this many seconds later
+PORTFOLIO_VIEW_COUNT_FLUSH_SECONDS = config('PORTFOLIO_VIEW_COUNT_FLUSH_SECONDS', default=30.0, cast=float)
+PORTFOLIO_VIEW_COUNT_DAYS_LISTED = config('PORTFOLIO_VIEW_COUNT_DAYS_LISTED', default=30, cast=int)
+
+# Public gallery page sizes
+PORTFOLIO_GALLERY_PAGE_SIZE = config('PORTFOLIO_GALLERY_PAGE_SIZE', default=24, cast=int)
+PORTFOLIO_GALLERY_MAX_PAGE_SIZE = config('PORTFOLIO_GALLERY_MAX_PAGE_SIZE', default=100, cast=int)
+
 # Add this configuration for Google OAuth
 GOOGLE_OAUTH2_CLIENT_ID = config('GOOGLE_CLIENT_ID', default='')
 GOOGLE_OAUTH2_CLIENT_SECRET = config('GOOGLE_CLIENT_SECRET', default='')
 
+# Calls to Google share one pooled session, see accounts/auth/google_client.py
+GOOGLE_OAUTH2_TOKEN_URL = config('GOOGLE_OAUTH2_TOKEN_URL', default='https://oauth2.googleapis.com/token')
+GOOGLE_OAUTH2_USERINFO_URL = config('GOOGLE_OAUTH2_USERINFO_URL', default='https://www.googleapis.com/oauth2/v3/userinfo')
+GOOGLE_OAUTH2_JWKS_URL = config('GOOGLE_OAUTH2_JWKS_URL', default='https://www.googleapis.com/oauth2/v3/certs')
+GOOGLE_OAUTH2_CONNECT_TIMEOUT = config('GOOGLE_OAUTH2_CONNECT_TIMEOUT', default=3.05, cast=float)
+GOOGLE_OAUTH2_READ_TIMEOUT = config('GOOGLE_OAUTH2_READ_TIMEOUT', default=10.0, cast=float)
+GOOGLE_OAUTH2_RETRIES = config('GOOGLE_OAUTH2_RETRIES', default=2, cast=int)
+GOOGLE_OAUTH2_POOL_SIZE = config('GOOGLE_OAUTH2_POOL_SIZE', default=10, cast=int)
+# Signing keys are cached for the certs response's max-age, or this long without one
+GOOGLE_OAUTH2_JWKS_CACHE_SECONDS = config('GOOGLE_OAUTH2_JWKS_CACHE_SECONDS', default=3600, cast=int)
+GOOGLE_OAUTH2_JWKS_MIN_REFETCH_SECONDS = config('GOOGLE_OAUTH2_JWKS_MIN_REFETCH_SECONDS', default=60, cast=int)
+GOOGLE_OAUTH2_CLOCK_SKEW_SECONDS = config('GOOGLE_OAUTH2_CLOCK_SKEW_SECONDS', default=30, cast=int)
+
 # Update SOCIALACCOUNT_PROVIDERS configuration
 SOCIALACCOUNT_PROVIDERS = {
     'google': {
@@ -308,6 +467,23 @@ CONTENT_SECURITY_POLICY = {
     }
 }
 
+# Directives replaced for the bare portfolio documents served to the public
+# iframe: sandboxed into an opaque origin with scripts allowed, and frameable
+# by the frontend only. The sandbox is what isolates user code, so within it
+# portfolios may load scripts, styles, images and fonts from any https host,
+# as the editor preview lets them, instead of the site's own allowlist
+_PUBLIC_PORTFOLIO_SOURCES = ("https:", "data:", "blob:")
+PUBLIC_PORTFOLIO_CSP_REPLACE = {
+    "default-src": _PUBLIC_PORTFOLIO_SOURCES,
+    "script-src": ("'unsafe-inline'", "'unsafe-eval'") + _PUBLIC_PORTFOLIO_SOURCES,
+    "style-src": ("'unsafe-inline'",) + _PUBLIC_PORTFOLIO_SOURCES,
+    "img-src": _PUBLIC_PORTFOLIO_SOURCES,
+    "font-src": _PUBLIC_PORTFOLIO_SOURCES,
+    "connect-src": ("https:",),
+    "sandbox": ("allow-scripts",),
+    "frame-ancestors": ("'self'", frontend_url),
+}
+
 # Use report-only mode in development
 if DEBUG:
     CONTENT_SECURITY_POLICY_REPORT_ONLY = CONTENT_SECURITY_POLICY
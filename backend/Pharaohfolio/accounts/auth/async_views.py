@@ -0,0 +1,42 @@
+from functools import wraps
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from . import forget_password, login, profile, register
+from .offload import AuthPoolSaturated, auth_pool
+
+# Seconds a client is asked to wait before retrying a refused request
+BUSY_RETRY_AFTER = 1
+
+
+def offloaded(view):
+    """
+    Async variant of a sync auth view: the whole view, with its password hash
+    or check, runs in auth_pool, and is refused with a 503 when the pool's
+    queue is full.
+    """
+    @csrf_exempt
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        try:
+            return await auth_pool.run(view, request, *args, **kwargs)
+        except AuthPoolSaturated:
+            response = JsonResponse({'error': 'Server is busy, please try again shortly'}, status=503)
+            response['Retry-After'] = str(BUSY_RETRY_AFTER)
+            return response
+    return async_view
+
+
+login_view = offloaded(login.login_view)
+register_view = offloaded(register.register_view)
+change_password = offloaded(profile.change_password)
+password_reset_confirm = offloaded(forget_password.password_reset_confirm)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def auth_pool_stats(request):
+    """Queue depth, waits and refusals of this process's password hashing pool"""
+    return Response(auth_pool.get_stats())
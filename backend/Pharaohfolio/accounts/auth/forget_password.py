@@ -107,7 +107,7 @@ def password_reset_request(request):
         
         # Check if user exists with this email
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.filter_by_email(email).get()
         except User.DoesNotExist:
             # Return success even if user doesn't exist for security
             return Response(
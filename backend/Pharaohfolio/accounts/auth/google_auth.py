@@ -1,11 +1,13 @@
 #all of the auth related function
+import logging
 from django.shortcuts import redirect
 from ..models import User
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from ..authentication import ClaimsRefreshToken
+from . import google_client
 import requests
 from django.conf import settings
 from Pharaohfolio.settings import SITE_DOMAIN, GOOGLE_OAUTH2_CLIENT_ID, GOOGLE_OAUTH2_CLIENT_SECRET, frontend_url
@@ -13,6 +15,8 @@ from decouple import config
 from django.template.loader import render_to_string
 from django.core.mail import send_mail
 
+logger = logging.getLogger(__name__)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def google_login_url(request):
@@ -42,50 +46,33 @@ def google_auth(request):
             )
 
         redirect_uri = config('GOOGLE_REDIRECT_URI', default=f'{SITE_DOMAIN}/api/auth/google/callback/')
-        
-        # Exchange code for access token
-        token_url = 'https://oauth2.googleapis.com/token'
-        token_payload = {
-            'client_id': GOOGLE_OAUTH2_CLIENT_ID,
-            'client_secret': GOOGLE_OAUTH2_CLIENT_SECRET,
-            'code': code,
-            'redirect_uri': redirect_uri,
-            'grant_type': 'authorization_code'
-        }
 
-        token_response = requests.post(token_url, data=token_payload)
-        
-        if token_response.status_code != 200:
+        try:
+            token_data = google_client.exchange_code(code, redirect_uri)
+            user_info = google_client.get_user_info(token_data)
+        except google_client.GoogleAuthError as e:
+            logger.warning(f"Google authentication refused: {e}")
             return Response(
-                {'error': 'Failed to exchange code for token'}, 
+                {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
-            
-        token_data = token_response.json()
-
-        # Get user info using access token
-        userinfo_url = 'https://www.googleapis.com/oauth2/v3/userinfo'
-        headers = {'Authorization': f'Bearer {token_data["access_token"]}'}
-        userinfo_response = requests.get(userinfo_url, headers=headers)
-        
-        if userinfo_response.status_code != 200:
+        except requests.RequestException as e:
+            logger.warning(f"Request to Google failed: {e}")
             return Response(
-                {'error': 'Failed to get user info from Google'}, 
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': 'Google did not respond, please try again'},
+                status=status.HTTP_502_BAD_GATEWAY
             )
-            
-        user_info = userinfo_response.json()
 
         email = user_info['email']
         first_name = user_info.get('given_name', '')
         last_name = user_info.get('family_name', '')
         
         # Check if user exists
-        user = User.objects.filter(email=email).first()
+        user = User.objects.filter_by_email(email).first()
         
         if user:
             # User exists, generate tokens and return
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -133,7 +120,7 @@ def google_auth(request):
                 print(f"Failed to send welcome email: {str(email_error)}")
 
             # Generate tokens and return
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
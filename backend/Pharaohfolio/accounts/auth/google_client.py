@@ -0,0 +1,173 @@
+import logging
+import re
+import threading
+import time
+import jwt
+import requests
+from django.conf import settings
+from jwt.algorithms import has_crypto
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Values of the iss claim Google signs id_tokens with
+GOOGLE_ISSUERS = ('https://accounts.google.com', 'accounts.google.com')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class GoogleAuthError(Exception):
+    """Google refused the code or returned something that cannot be trusted"""
+
+
+def get_session():
+    """
+    Shared requests session for calls to Google, built on first use. Connections
+    are kept alive and reused across requests. Failed connections are retried
+    for every method; 5xx answers and read errors only for GET, since the token
+    exchange spends a single-use code.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=settings.GOOGLE_OAUTH2_RETRIES,
+                    backoff_factor=0.2,
+                    status_forcelist=(500, 502, 503, 504),
+                    allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_maxsize=settings.GOOGLE_OAUTH2_POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def reset_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def _timeout():
+    return (settings.GOOGLE_OAUTH2_CONNECT_TIMEOUT, settings.GOOGLE_OAUTH2_READ_TIMEOUT)
+
+
+def _max_age(response):
+    match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+    return int(match.group(1)) if match else settings.GOOGLE_OAUTH2_JWKS_CACHE_SECONDS
+
+
+class JWKSCache:
+    """
+    Google's signing keys, kept for as long as the certs response says they
+    may be cached. An unknown key id fetches them again, since Google rotates
+    keys, but not more often than GOOGLE_OAUTH2_JWKS_MIN_REFETCH_SECONDS so
+    forged key ids cannot make every sign-in fetch the keys.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._expires_at = 0.0
+        self._fetched_at = None
+        self.fetches = 0
+
+    def _fetch(self):
+        response = get_session().get(settings.GOOGLE_OAUTH2_JWKS_URL, timeout=_timeout())
+        response.raise_for_status()
+        keys = {}
+        for data in response.json().get('keys', []):
+            try:
+                key = jwt.PyJWK(data)
+            except jwt.PyJWKError:
+                continue
+            keys[key.key_id] = key
+        now = time.monotonic()
+        self._keys = keys
+        self._expires_at = now + _max_age(response)
+        self._fetched_at = now
+        self.fetches += 1
+
+    def get_key(self, kid):
+        with self._lock:
+            now = time.monotonic()
+            stale = now >= self._expires_at
+            unknown = kid not in self._keys and (
+                self._fetched_at is None
+                or now - self._fetched_at >= settings.GOOGLE_OAUTH2_JWKS_MIN_REFETCH_SECONDS
+            )
+            if stale or unknown:
+                self._fetch()
+            key = self._keys.get(kid)
+        if key is None:
+            raise GoogleAuthError(f'Unknown signing key {kid!r}')
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._expires_at = 0.0
+            self._fetched_at = None
+            self.fetches = 0
+
+
+jwks_cache = JWKSCache()
+
+
+def exchange_code(code, redirect_uri):
+    """Trade an authorization code for Google's token response"""
+    response = get_session().post(settings.GOOGLE_OAUTH2_TOKEN_URL, data={
+        'client_id': settings.GOOGLE_OAUTH2_CLIENT_ID,
+        'client_secret': settings.GOOGLE_OAUTH2_CLIENT_SECRET,
+        'code': code,
+        'redirect_uri': redirect_uri,
+        'grant_type': 'authorization_code',
+    }, timeout=_timeout())
+    if response.status_code != 200:
+        raise GoogleAuthError('Failed to exchange code for token')
+    return response.json()
+
+
+def verify_id_token(id_token):
+    """Claims of an id_token, checked against Google's keys, our client id and its expiry"""
+    try:
+        kid = jwt.get_unverified_header(id_token).get('kid')
+        key = jwks_cache.get_key(kid)
+        return jwt.decode(
+            id_token, key.key, algorithms=['RS256'],
+            audience=settings.GOOGLE_OAUTH2_CLIENT_ID, issuer=GOOGLE_ISSUERS,
+            leeway=settings.GOOGLE_OAUTH2_CLOCK_SKEW_SECONDS,
+        )
+    except jwt.PyJWTError as e:
+        raise GoogleAuthError(f'Invalid id_token: {e}')
+
+
+def get_user_info(token_data):
+    """
+    Email and names of the signed-in user. Read from the id_token in the token
+    response when it can be verified here, which saves a round trip to the
+    userinfo endpoint; that endpoint is only used without an id_token or
+    without the cryptography package RS256 needs.
+    """
+    if token_data.get('id_token') and has_crypto:
+        user_info = verify_id_token(token_data['id_token'])
+    else:
+        response = get_session().get(
+            settings.GOOGLE_OAUTH2_USERINFO_URL,
+            headers={'Authorization': f'Bearer {token_data["access_token"]}'},
+            timeout=_timeout(),
+        )
+        if response.status_code != 200:
+            raise GoogleAuthError('Failed to get user info from Google')
+        user_info = response.json()
+    if not user_info.get('email') or user_info.get('email_verified') is False:
+        raise GoogleAuthError('Google account has no verified email')
+    return user_info
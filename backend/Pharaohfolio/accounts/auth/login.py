@@ -1,10 +1,9 @@
 from django.contrib.auth import authenticate
-from ..models import User
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from ..authentication import ClaimsRefreshToken
 from django.core.mail import send_mail
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
@@ -28,27 +27,18 @@ def login_view(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        user = None
-
-        # Check if the input is a username or email
-        if '@' not in user_username_mail:
-            # Authenticate using username
-            user = authenticate(username=user_username_mail, password=password)
-        else:
-            # Authenticate using email - first find user by email, then authenticate with username
-            try:
-                user_obj = User.objects.filter(email=user_username_mail).first()
-                if user_obj:
-                    user = authenticate(username=user_obj.username, password=password)
-            except Exception as e:
-                return Response(
-                    {'error': 'Database error occurred'}, 
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        # UsernameOrEmailBackend resolves either identifier in one query
+        try:
+            user = authenticate(request, username=user_username_mail, password=password)
+        except Exception as e:
+            return Response(
+                {'error': 'Database error occurred'}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
         if user:
             if user.email_verify == True:
-                refresh = RefreshToken.for_user(user)
+                refresh = ClaimsRefreshToken.for_user(user)
                 return Response({
                     'refresh': str(refresh),
                     'access': str(refresh.access_token),
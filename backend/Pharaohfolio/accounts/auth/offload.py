@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class AuthPoolSaturated(Exception):
+    """More password work is waiting than the pool is allowed to queue"""
+
+
+class AuthWorkPool:
+    """
+    Bounded thread pool for password hashing and verification.
+
+    PBKDF2 in hashlib releases the GIL, so hashes run in parallel across
+    cores while the event loop, and the single thread Django runs sync views
+    on under ASGI, stay free for cheap requests. At most `workers` tasks run
+    at once and `max_queue` more may wait; beyond that submit() refuses work
+    straight away, so a login burst is answered with 503s instead of every
+    request's latency growing with the queue.
+    """
+
+    def __init__(self, workers, max_queue):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self._running = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'max_queued': 0, 'wait_seconds': 0.0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='auth-hash')
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs); raises AuthPoolSaturated when the queue is full"""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.stats['rejected'] += 1
+                raise AuthPoolSaturated(f"{self._pending} password tasks pending")
+            self._pending += 1
+            self.stats['submitted'] += 1
+            self.stats['max_queued'] = max(self.stats['max_queued'], self._pending - self._running)
+            future = self._get_executor().submit(self._run, time.monotonic(), fn, args, kwargs)
+        # Also called for tasks cancelled before they started
+        future.add_done_callback(self._done)
+        return future
+
+    def _run(self, enqueued_at, fn, args, kwargs):
+        with self._lock:
+            self._running += 1
+            self.stats['wait_seconds'] += time.monotonic() - enqueued_at
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._running -= 1
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+            self.stats['completed'] += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) in the pool"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['running'] = self._running
+            stats['queued'] = self._pending - self._running
+        started = stats['completed'] + stats['running']
+        stats['avg_wait_ms'] = round(stats.pop('wait_seconds') / started * 1000, 3) if started else None
+        stats['workers'] = self.workers
+        stats['max_queue'] = self.max_queue
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+auth_pool = AuthWorkPool(settings.AUTH_HASHING_POOL_WORKERS, settings.AUTH_HASHING_POOL_MAX_QUEUE)
@@ -1,7 +1,8 @@
 from django.shortcuts import redirect
 from ..models import User
+from ..authentication import ClaimsJWTAuthentication
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.core.mail import send_mail
@@ -12,8 +13,13 @@ from django.contrib.auth.tokens import default_token_generator
 from Pharaohfolio.settings import SITE_DOMAIN, frontend_url
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.conf import settings
+from portfolio.public_cache import invalidate_public_portfolio
+from portfolio.publish.exporter import rename_export
+from portfolio.username_filter import username_filter
 
 @api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def get_profile(request):
     """Get current user profile information"""
@@ -41,6 +47,7 @@ def update_profile(request):
 
         messages = []
         errors = []
+        old_username = user.username
 
         # Update first name and last name directly
         if first_name != user.first_name:
@@ -71,7 +78,7 @@ def update_profile(request):
                 errors.append("Email must contain @")
             else:
                 # Check if email already exists
-                if User.objects.filter(email=email).exclude(id=user.id).exists():
+                if User.objects.filter_by_email(email).exclude(id=user.id).exists():
                     errors.append('Email already taken, please choose another one!')
                 else:
                     # Send verification email for new email
@@ -114,6 +121,13 @@ def update_profile(request):
         # Save user if there are no errors
         if not errors:
             user.save()
+            if user.username != old_username:
+                # The public portfolio moved to the new username
+                invalidate_public_portfolio(old_username)
+                if settings.PORTFOLIO_STATIC_EXPORT_ENABLED:
+                    rename_export(old_username, user.username)
+                if settings.PORTFOLIO_USERNAME_FILTER_ENABLED:
+                    username_filter.add(user.username)
             if not messages:
                 messages.append("Profile updated successfully!")
 
@@ -224,7 +238,7 @@ def verify_email_change(request):
         # Check if the token is valid
         if default_token_generator.check_token(user, token):
             # Check if the new email is already taken by another user
-            if User.objects.filter(email=new_email).exclude(id=user.id).exists():
+            if User.objects.filter_by_email(new_email).exclude(id=user.id).exists():
                 return Response(
                     {'error': 'This email address is already in use by another account'}, 
                     status=status.HTTP_400_BAD_REQUEST
@@ -65,7 +65,7 @@ def register_view(request):
         
         # Check if email already exists
         try:
-            if User.objects.filter(email=email).exists():
+            if User.objects.filter_by_email(email).exists():
                 return Response(
                     {'error': 'Email already exists'}, 
                     status=status.HTTP_400_BAD_REQUEST
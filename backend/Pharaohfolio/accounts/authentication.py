@@ -0,0 +1,178 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .blacklist import CachedRefreshToken
+from .models import User
+
+AUTH_CACHE_ALIAS = 'auth'
+
+# Profile fields carried in access tokens, enough for the read-only views
+USER_CLAIMS = ('username', 'email', 'email_verify', 'first_name', 'last_name', 'date_joined')
+
+# When the claims above were read from the database, in epoch seconds
+CLAIMS_AT = 'claims_at'
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    # Rendered the way the views' responses render it
+    token['date_joined'] = serializers.DateTimeField().to_representation(user.date_joined)
+    token[CLAIMS_AT] = time.time()
+    return token
+
+
+class ClaimsRefreshToken(CachedRefreshToken):
+    """
+    Refresh token whose access tokens carry USER_CLAIMS. Parsed from a client's
+    token on refresh, the claims are re-read from the database, so each new
+    access token reflects the user as it is now.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+    def __init__(self, token=None, verify=True):
+        super().__init__(token, verify)
+        if token is not None:
+            user = User.objects.filter(pk=self[api_settings.USER_ID_CLAIM]).first()
+            if user is None or not user.is_active:
+                raise TokenError(_('User not found or inactive'))
+            add_user_claims(self, user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsUser(TokenUser):
+    """
+    request.user built from an access token's claims, without a query.
+    Model fields not in the claims are read from `instance`.
+    """
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        if attr in USER_CLAIMS:
+            return self.token.get(attr)
+        return getattr(self.instance, attr)
+
+    @cached_property
+    def instance(self):
+        user = user_cache.get(self.id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        return user
+
+
+class UserCache:
+    """
+    Per-process cache of User rows for ClaimsJWTAuthentication, kept for
+    AUTH_USER_CACHE_TTL seconds or until the user changes, and at most
+    AUTH_USER_CACHE_MAX_ENTRIES of them. Callers get a copy, so a view
+    changing its user never affects another request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Oldest first: entries share one TTL, so this is also expiry order
+        self._entries = OrderedDict()
+
+    def get(self, user_id, changed_at=None):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] <= now:
+                del self._entries[user_id]
+                entry = None
+        if entry and (changed_at is None or entry[1] > changed_at):
+            return copy.copy(entry[2])
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            with self._lock:
+                self._entries[user_id] = (now + settings.AUTH_USER_CACHE_TTL, now, user)
+                self._entries.move_to_end(user_id)
+                self._evict(now)
+            user = copy.copy(user)
+        return user
+
+    def _evict(self, now):
+        # Called with the lock held
+        while self._entries:
+            expires_at = next(iter(self._entries.values()))[0]
+            if expires_at > now and len(self._entries) <= settings.AUTH_USER_CACHE_MAX_ENTRIES:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def user_changed_key(user_id):
+    return f'user-changed:{user_id}'
+
+
+def user_changed_at(user_id):
+    return caches[AUTH_CACHE_ALIAS].get(user_changed_key(user_id))
+
+
+def invalidate_user(user_id):
+    """
+    Stop trusting the claims of access tokens issued before now, here and,
+    through the auth cache, in other processes.
+    """
+    user_cache.invalidate(user_id)
+    timeout = api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+    caches[AUTH_CACHE_ALIAS].set(user_changed_key(user_id), time.time(), timeout)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication for read-only views that builds request.user from the
+    token's claims instead of querying accounts_user. Tokens without claims,
+    or issued before the user last changed, get a full User from user_cache.
+    Views that write to the user must keep JWTAuthentication.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        changed_at = user_changed_at(user_id)
+        claims_at = validated_token.get(CLAIMS_AT)
+        if claims_at is not None and (changed_at is None or claims_at > changed_at):
+            return ClaimsUser(validated_token)
+
+        user = user_cache.get(user_id, changed_at)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -0,0 +1,27 @@
+from django.contrib.auth.backends import ModelBackend
+from .models import User
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """
+    Authenticates with either a username or an email address in one indexed
+    query: identifiers containing '@' are emails, which usernames never contain,
+    matched case-insensitively; anything else is an exact username.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        if '@' in username:
+            user = User.objects.filter_by_email(username).first()
+        else:
+            user = User.objects.filter(username=username).first()
+        if user is None:
+            # Run the hasher anyway so response time doesn't tell whether the account exists
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,174 @@
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from portfolio.username_filter import BloomFilter
+
+# Longer than any transaction that blacklists a token, plus clock skew between
+# app servers. A row blacklisted longer ago than this is committed, and so is
+# every row with a lower id.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BlacklistCache:
+    """
+    In-process Bloom filter of blacklisted refresh token ids, so refreshing
+    and logging out do not join the token blacklist tables on every request.
+    A negative answer is definite as of the last sync; a positive one is
+    confirmed with the database, so a false positive never rejects a token.
+
+    The filter is built from unexpired blacklist rows on first use and
+    rebuilt every AUTH_BLACKLIST_CACHE_REBUILD_SECONDS, which drops expired
+    ids. In between, rows added by other processes are pulled at most
+    every AUTH_BLACKLIST_CACHE_SYNC_SECONDS, so a token blacklisted elsewhere
+    may still be accepted here for that long; 0 syncs before every check.
+    Tokens blacklisted in this process are added directly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._capacity = 0
+        # Every row with an id up to _floor_id is in the filter; rows above it
+        # already added are kept in _recent_ids, with when they were blacklisted
+        self._floor_id = 0
+        self._recent_ids = {}
+        self._built_at = 0.0
+        self._synced_at = 0.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'checks': 0, 'blacklisted': 0, 'false_positives': 0, 'syncs': 0, 'rebuilds': 0}
+
+    def _build(self):
+        rows = (
+            BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).order_by()
+            .values_list('id', 'blacklisted_at', 'token__jti').iterator(chunk_size=2000)
+        )
+        jtis = []
+        self._floor_id = 0
+        self._recent_ids = {}
+        for row_id, blacklisted_at, jti in rows:
+            jtis.append(jti)
+            self._recent_ids[row_id] = blacklisted_at
+        self._advance_floor()
+        # Leave room to grow until the next rebuild
+        self._capacity = max(settings.AUTH_BLACKLIST_CACHE_CAPACITY, 2 * len(jtis))
+        bloom = BloomFilter(self._capacity, settings.AUTH_BLACKLIST_CACHE_ERROR_RATE)
+        for jti in jtis:
+            bloom.add(jti)
+        self._bloom = bloom
+        self.stats['rebuilds'] += 1
+
+    def _sync(self):
+        # Ids are assigned in insert order but may commit out of it, so rows
+        # above the floor are read again until they are old enough to pass it
+        rows = BlacklistedToken.objects.filter(id__gt=self._floor_id).values_list('id', 'blacklisted_at', 'token__jti')
+        for row_id, blacklisted_at, jti in rows:
+            if row_id not in self._recent_ids:
+                self._bloom.add(jti)
+                self._recent_ids[row_id] = blacklisted_at
+        self._advance_floor()
+        self.stats['syncs'] += 1
+
+    def _advance_floor(self):
+        settled_before = timezone.now() - SYNC_OVERLAP
+        self._floor_id = max(
+            (row_id for row_id, blacklisted_at in self._recent_ids.items() if blacklisted_at < settled_before),
+            default=self._floor_id,
+        )
+        self._recent_ids = {
+            row_id: blacklisted_at for row_id, blacklisted_at in self._recent_ids.items() if row_id > self._floor_id
+        }
+
+    def _current(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._bloom is None or self._bloom.count > self._capacity \
+                    or now - self._built_at >= settings.AUTH_BLACKLIST_CACHE_REBUILD_SECONDS:
+                self._build()
+                self._built_at = self._synced_at = now
+            elif now - self._synced_at >= settings.AUTH_BLACKLIST_CACHE_SYNC_SECONDS:
+                self._sync()
+                self._synced_at = now
+            return self._bloom
+
+    def is_blacklisted(self, jti):
+        self.stats['checks'] += 1
+        if jti not in self._current():
+            return False
+        if BlacklistedToken.objects.filter(token__jti=jti).exists():
+            self.stats['blacklisted'] += 1
+            return True
+        self.stats['false_positives'] += 1
+        return False
+
+    def add(self, jti):
+        """Record a token blacklisted by this process"""
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+    def invalidate(self):
+        """Drop the filter so the next check rebuilds it"""
+        with self._lock:
+            self._bloom = None
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        bloom = self._bloom
+        if bloom is not None:
+            stats['size_bits'] = bloom.size
+            stats['tokens'] = bloom.count
+        return stats
+
+
+blacklist_cache = BlacklistCache()
+
+
+class CachedRefreshToken(RefreshToken):
+    """Refresh token checked against blacklist_cache instead of the blacklist tables"""
+
+    def check_blacklist(self):
+        if blacklist_cache.is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        blacklist_cache.add(self.payload[api_settings.JTI_CLAIM])
+        return blacklisted
+
+
+def compact_token_tables(batch_size=1000, dry_run=False):
+    """
+    Delete outstanding tokens that have expired, and their blacklist rows, in
+    batches of batch_size walking up the primary key. An expired token is
+    rejected on its exp claim alone, so neither row is needed any more.
+    Returns (outstanding, blacklisted) counts deleted, or that would be.
+    """
+    now = timezone.now()
+    last_id = 0
+    outstanding = blacklisted = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(id__gt=last_id, expires_at__lte=now)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        last_id = ids[-1]
+        if dry_run:
+            outstanding += len(ids)
+            blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).count()
+            continue
+        # Blacklist rows go with their token through the cascade
+        _, deleted = OutstandingToken.objects.filter(id__in=ids).delete()
+        outstanding += deleted.get(OutstandingToken._meta.label, 0)
+        blacklisted += deleted.get(BlacklistedToken._meta.label, 0)
+    return outstanding, blacklisted
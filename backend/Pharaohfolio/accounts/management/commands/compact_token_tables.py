@@ -0,0 +1,41 @@
+import logging
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from accounts.blacklist import compact_token_tables
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding and blacklisted refresh tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.AUTH_TOKEN_COMPACTION_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, compacting every AUTH_TOKEN_COMPACTION_SECONDS')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        while True:
+            if not options['loop']:
+                self.compact(options['batch_size'], options['dry_run'])
+                return
+            try:
+                self.compact(options['batch_size'], options['dry_run'])
+            except Exception as e:
+                # A lost connection or a lock timeout must not end the loop;
+                # the next pass starts over from the lowest expired token
+                logger.exception(f"Failed to compact token tables: {str(e)}")
+            close_old_connections()
+            time.sleep(settings.AUTH_TOKEN_COMPACTION_SECONDS)
+
+    def compact(self, batch_size, dry_run):
+        outstanding, blacklisted = compact_token_tables(batch_size, dry_run)
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {outstanding} expired outstanding tokens and {blacklisted} blacklisted tokens"
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.db.models.functions import Lower
+from accounts.models import User
+
+
+def duplicate_emails():
+    """Lowercased emails used by more than one account"""
+    return list(
+        User.objects.exclude(email='').annotate(email_lower=Lower('email'))
+        .values('email_lower').annotate(total=Count('id')).filter(total__gt=1)
+        .values_list('email_lower', flat=True)
+    )
+
+
+class Command(BaseCommand):
+    help = ('List accounts whose emails differ only in case, failing if there are any. They must be '
+            'merged or changed by hand before the unique lower(email) constraint can be applied')
+
+    def handle(self, *args, **options):
+        if User._meta.db_table not in connection.introspection.table_names():
+            self.stdout.write('No user table yet; nothing to check')
+            return
+
+        duplicated = duplicate_emails()
+        for email in duplicated:
+            accounts = User.objects.filter_by_email(email).order_by('id').values_list('id', 'username', 'email')
+            self.stderr.write(f"{email}: " + ', '.join(f"#{id} {username} <{address}>" for id, username, address in accounts))
+
+        if duplicated:
+            # Exits non-zero, so deploys stop before migrate fails on the constraint
+            raise CommandError(f"{len(duplicated)} emails are shared by several accounts")
+        self.stdout.write(self.style.SUCCESS('No duplicate emails'))
@@ -1,18 +1,36 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as DjangoUserManager
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 
 # Create your models here.
 
+class UserManager(DjangoUserManager):
+
+    def filter_by_email(self, email):
+        """Users whose email matches case-insensitively, through the unique lower(email) index"""
+        return self.alias(email_lower=Lower('email')).filter(email_lower=email.lower()).exclude(email='')
+
 class User(AbstractUser):
     """
     Base user model for all user types in the system
     """
     
     email_verify = models.BooleanField(default=False, verbose_name="Email Verified")
+
+    objects = UserManager()
     
     def __str__(self):
         return f"{self.username} ({self.email})"
     
     class Meta:
         verbose_name = "User"
-        verbose_name_plural = "Users"
\ No newline at end of file
+        verbose_name_plural = "Users"
+        indexes = [
+            # Case-insensitive username slug lookups for public portfolio URLs
+            models.Index(Lower('username'), name='user_username_lower_idx'),
+        ]
+        constraints = [
+            # One account per email whatever its casing; also serves login by email
+            models.UniqueConstraint(Lower('email'), condition=~Q(email=''), name='user_email_lower_unique'),
+        ]
\ No newline at end of file
@@ -1,3 +1,464 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.contrib.auth import authenticate
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, transaction
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+import json
+import threading
+import time
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from rest_framework import serializers, status
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.test import APIClient
+from .auth import async_views, google_client
+from .authentication import ClaimsRefreshToken, user_cache
+from .blacklist import CachedRefreshToken, blacklist_cache
+from .auth.offload import AuthPoolSaturated, AuthWorkPool
+from .models import User
 
-# Create your tests here.
+
+class UsernameOrEmailBackendTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='khufu', email='Khufu@Giza.example', password='testpass123', email_verify=True
+        )
+
+    def test_username_login_is_one_query(self):
+        """Test that logging in by username reads the user once"""
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username='khufu', password='testpass123'), self.user)
+
+    def test_email_login_is_one_query(self):
+        """Test that logging in by email reads the user once, ignoring case"""
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username='khufu@giza.EXAMPLE', password='testpass123'), self.user)
+
+    def test_wrong_password_or_unknown_user(self):
+        """Test that bad credentials and unknown identifiers are refused"""
+        self.assertIsNone(authenticate(username='khufu', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody@giza.example', password='testpass123'))
+        self.assertIsNone(authenticate(username='Khufu', password='testpass123'))
+
+    def test_inactive_user_refused(self):
+        """Test that inactive accounts cannot log in"""
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(authenticate(username='khufu', password='testpass123'))
+
+    def test_email_unique_ignoring_case(self):
+        """Test that a second account cannot reuse an email in another casing"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='other', email='KHUFU@giza.example', password='testpass123')
+        # Accounts without an email don't collide
+        User.objects.create_user(username='first', email='', password='testpass123')
+        User.objects.create_user(username='second', email='', password='testpass123')
+
+    def test_login_view_accepts_email(self):
+        """Test that the login route accepts an email in any casing"""
+        response = APIClient().post('/api/auth/login/', {'username': 'KHUFU@giza.example', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], 'khufu')
+
+    def test_register_rejects_email_in_other_case(self):
+        """Test that registration treats emails case-insensitively"""
+        response = APIClient().post('/api/auth/register/', {
+            'username': 'khafre', 'email': 'khufu@GIZA.example', 'password': 'Str0ng-pass!', 'password2': 'Str0ng-pass!',
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Email already exists')
+
+    def test_find_duplicate_emails(self):
+        """Test that the pre-migration check reports no duplicates"""
+        out = StringIO()
+        call_command('find_duplicate_emails', stdout=out)
+        self.assertIn('No duplicate emails', out.getvalue())
+
+    def test_find_duplicate_emails_fails_on_duplicates(self):
+        """Test that the pre-migration check fails when emails are shared"""
+        from accounts.management.commands import find_duplicate_emails
+        err = StringIO()
+        with mock.patch.object(find_duplicate_emails, 'duplicate_emails', return_value=['khufu@giza.example']):
+            with self.assertRaises(CommandError):
+                call_command('find_duplicate_emails', stdout=StringIO(), stderr=err)
+        self.assertIn('khufu <Khufu@giza.example>', err.getvalue())
+
+
+class AuthWorkPoolTestCase(TestCase):
+    def setUp(self):
+        self.pool = AuthWorkPool(workers=1, max_queue=1)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_saturated_pool_refuses_work(self):
+        """Test that work beyond the workers and queue is refused at once"""
+        started, release = threading.Event(), threading.Event()
+        running = self.pool.submit(lambda: started.set() or release.wait(5))
+        started.wait(5)
+        queued = self.pool.submit(lambda: 'done')
+        with self.assertRaises(AuthPoolSaturated):
+            self.pool.submit(lambda: 'refused')
+        stats = self.pool.get_stats()
+        self.assertEqual((stats['running'], stats['queued'], stats['rejected']), (1, 1, 1))
+        release.set()
+        self.assertTrue(running.result(5))
+        self.assertEqual(queued.result(5), 'done')
+        self.pool.submit(lambda: None).result(5)
+        self.assertEqual(self.pool.get_stats()['completed'], 3)
+
+    def test_busy_async_view_returns_503(self):
+        """Test that an async auth view answers 503 when the pool is full"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.pool.submit(release.wait, 5)
+        self.pool.submit(release.wait, 5)
+        request = AsyncRequestFactory().post('/api/auth/login/', {'username': 'khufu', 'password': 'x'})
+        with mock.patch.object(async_views, 'auth_pool', self.pool):
+            response = async_to_sync(async_views.login_view)(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_stats_endpoint_is_admin_only(self):
+        """Test that pool metrics are exposed to staff only"""
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='scribe', email='scribe@example.com', password='x'))
+        self.assertEqual(client.get('/api/auth/pool/stats/').status_code, status.HTTP_403_FORBIDDEN)
+        client.force_authenticate(User.objects.create_user(username='vizier', email='vizier@example.com', password='x', is_staff=True))
+        response = client.get('/api/auth/pool/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('queued', response.data)
+
+
+class AsyncLoginTestCase(TransactionTestCase):
+    """Runs on committed data: the view executes on a pool thread with its own connection"""
+
+    def setUp(self):
+        User.objects.create_user(username='hatshepsut', email='hatshepsut@example.com', password='testpass123', email_verify=True)
+
+    def test_async_login(self):
+        """Test that the async login view authenticates in the pool"""
+        request = AsyncRequestFactory().post(
+            '/api/auth/login/', {'username': 'hatshepsut@example.com', 'password': 'testpass123'},
+            content_type='application/json',
+        )
+        response = async_to_sync(async_views.login_view)(request)
+        response.render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', json.loads(response.content))
+
+
+class ClaimsJWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        caches['auth'].clear()
+        user_cache.clear()
+        self.user = User.objects.create_user(
+            username='thutmose', email='thutmose@example.com', password='testpass123',
+            first_name='Thutmose', email_verify=True,
+        )
+        self.refresh = ClaimsRefreshToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+    def test_read_only_views_skip_user_query(self):
+        """Test that the profile is served from token claims alone"""
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/user-data/')
+        self.assertEqual(response.data['username'], 'thutmose')
+        self.assertTrue(response.data['email_verify'])
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.data['first_name'], 'Thutmose')
+        self.assertEqual(response.data['date_joined'], serializers.DateTimeField().to_representation(self.user.date_joined))
+
+    def test_get_code_with_claims_user(self):
+        """Test that the editor loads the portfolio without a user query"""
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/portfolio/my/get/')
+        self.assertFalse(response.data['user_code_status'])
+
+    def test_change_falls_back_to_cached_user(self):
+        """Test that claims issued before a change are not trusted"""
+        self.user.first_name = 'Menkheperre'
+        self.user.save()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.data['first_name'], 'Menkheperre')
+        # Reused from the per-process cache until it expires or the user changes
+        with self.assertNumQueries(0):
+            self.client.get('/api/profile/')
+
+    def test_deactivated_user_rejected(self):
+        """Test that deactivation takes effect before the token expires"""
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/user-data/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_without_claims(self):
+        """Test that tokens issued without claims still authenticate"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/user-data/')
+        self.assertEqual(response.data['email'], 'thutmose@example.com')
+
+    def test_refresh_restamps_claims(self):
+        """Test that a refreshed access token carries the current profile"""
+        self.user.username = 'thutmose3'
+        self.user.save()
+        response = APIClient().post('/api/auth/token/refresh/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/user-data/').data['username'], 'thutmose3')
+
+
+    @override_settings(AUTH_USER_CACHE_MAX_ENTRIES=2)
+    def test_user_cache_evicts_expired_and_oldest(self):
+        """Test that the user cache drops expired entries and stays within its size"""
+        others = [
+            User.objects.create_user(username=f'scribe{i}', email=f'scribe{i}@example.com', password='testpass123')
+            for i in range(3)
+        ]
+        for other in others:
+            user_cache.get(other.id)
+        self.assertEqual(len(user_cache), 2)
+        with self.assertNumQueries(1):
+            user_cache.get(others[0].id)
+        with self.assertNumQueries(0):
+            user_cache.get(others[0].id)
+        later = time.time() + 60
+        with mock.patch('accounts.authentication.time.time', return_value=later):
+            with self.assertNumQueries(1):
+                user_cache.get(others[0].id)
+        self.assertEqual(len(user_cache), 1)
+
+class TokenBlacklistCacheTestCase(TestCase):
+    def setUp(self):
+        blacklist_cache.invalidate()
+        blacklist_cache.reset_stats()
+        self.user = User.objects.create_user(username='ahmose', email='ahmose@example.com', password='testpass123')
+        self.refresh = ClaimsRefreshToken.for_user(self.user)
+
+    def refresh_with(self, token):
+        return APIClient().post('/api/auth/token/refresh/', {'refresh': str(token)})
+
+    def test_rotated_token_rejected(self):
+        """Test that a refresh token cannot be used twice"""
+        self.assertEqual(self.refresh_with(self.refresh).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.refresh_with(self.refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_blacklists(self):
+        """Test that a refresh token is refused after logging out with it"""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        response = client.post('/api/auth/logout/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.refresh_with(self.refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_BLACKLIST_CACHE_SYNC_SECONDS=3600)
+    def test_check_skips_blacklist_tables(self):
+        """Test that a token not in the filter is checked without a query"""
+        blacklist_cache.is_blacklisted('warm-up')
+        with self.assertNumQueries(0):
+            CachedRefreshToken(str(self.refresh))
+
+    @override_settings(AUTH_BLACKLIST_CACHE_SYNC_SECONDS=0)
+    def test_sync_sees_other_processes(self):
+        """Test that rows blacklisted elsewhere are picked up by the next sync"""
+        CachedRefreshToken(str(self.refresh))
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=self.refresh['jti']))
+        with self.assertRaises(TokenError):
+            CachedRefreshToken(str(self.refresh))
+
+    def test_false_positive_confirmed(self):
+        """Test that a filter hit without a blacklist row accepts the token"""
+        blacklist_cache.is_blacklisted('warm-up')
+        blacklist_cache.add(self.refresh['jti'])
+        CachedRefreshToken(str(self.refresh))
+        self.assertEqual(blacklist_cache.get_stats()['false_positives'], 1)
+
+    def test_compaction_deletes_expired_tokens(self):
+        """Test that only expired tokens and their blacklist rows are deleted"""
+        now = timezone.now()
+        for i in range(5):
+            expired = OutstandingToken.objects.create(
+                user=self.user, jti=f'expired-{i}', token='x', expires_at=now - timedelta(days=1)
+            )
+            if i % 2 == 0:
+                BlacklistedToken.objects.create(token=expired)
+        live = OutstandingToken.objects.get(jti=self.refresh['jti'])
+        BlacklistedToken.objects.create(token=live)
+
+        out = StringIO()
+        call_command('compact_token_tables', batch_size=2, stdout=out)
+        self.assertIn('Deleted 5 expired outstanding tokens and 3 blacklisted tokens', out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [self.refresh['jti']])
+        self.assertEqual(BlacklistedToken.objects.get().token, live)
+
+    def test_compaction_loop_survives_errors(self):
+        """Test that a failed pass is logged and the loop keeps going"""
+        from accounts.management.commands import compact_token_tables
+        passes = mock.Mock(side_effect=[RuntimeError('connection lost'), (2, 1)])
+        # The second sleep ends the loop
+        sleeps = mock.Mock(side_effect=[None, KeyboardInterrupt])
+        out = StringIO()
+        with mock.patch.object(compact_token_tables, 'compact_token_tables', passes), \
+                mock.patch.object(compact_token_tables.time, 'sleep', sleeps), \
+                self.assertLogs('accounts.management.commands.compact_token_tables', 'ERROR') as logs:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('compact_token_tables', loop=True, stdout=out)
+        self.assertEqual(passes.call_count, 2)
+        self.assertIn('connection lost', logs.output[0])
+        self.assertIn('Deleted 2 expired outstanding tokens', out.getvalue())
+
+
+class FakeGoogle(BaseHTTPRequestHandler):
+    """Stand-in for Google's token, certs and userinfo endpoints"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status_code, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        server.hits.append(self.path)
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(server.delay)
+        try:
+            if server.token_status != 200:
+                return self.send_json(server.token_status, {'error': 'invalid_grant'})
+            self.send_json(200, {'access_token': 'access', 'id_token': server.id_token()})
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting
+            pass
+
+    def do_GET(self):
+        server = self.server
+        server.hits.append(self.path)
+        if self.path == '/certs':
+            if server.certs_failures:
+                server.certs_failures -= 1
+                return self.send_json(503, {})
+            return self.send_json(200, {'keys': server.jwks}, {'Cache-Control': 'public, max-age=600'})
+        self.send_json(200, {'email': 'nefertari@example.com', 'email_verified': True, 'given_name': 'Nefertari'})
+
+
+class GoogleClientTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGoogle)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        cls.settings = override_settings(
+            GOOGLE_OAUTH2_CLIENT_ID='client-id',
+            GOOGLE_OAUTH2_TOKEN_URL=f'{base}/token',
+            GOOGLE_OAUTH2_JWKS_URL=f'{base}/certs',
+            GOOGLE_OAUTH2_USERINFO_URL=f'{base}/userinfo',
+            GOOGLE_OAUTH2_READ_TIMEOUT=0.5,
+        )
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        google_client.reset_session()
+        google_client.jwks_cache.clear()
+        self.server.hits = []
+        self.server.delay = 0
+        self.server.token_status = 200
+        self.server.certs_failures = 0
+        self.set_signing_key('key-1')
+        self.claims = {
+            'iss': 'https://accounts.google.com', 'aud': 'client-id', 'email': 'nefertari@example.com',
+            'email_verified': True, 'given_name': 'Nefertari', 'family_name': 'Merytmut',
+        }
+        self.server.id_token = lambda: jwt.encode(
+            {**self.claims, 'exp': int(time.time()) + 300}, self.private_key, algorithm='RS256',
+            headers={'kid': self.kid},
+        )
+
+    def set_signing_key(self, kid):
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        self.server.jwks = [{**jwk, 'kid': kid, 'alg': 'RS256', 'use': 'sig'}]
+
+    def sign_in(self):
+        return APIClient().post('/api/auth/google/authenticate/', {'code': 'auth-code'})
+
+    def test_id_token_skips_userinfo(self):
+        """Test that the user is read from the verified id_token"""
+        response = self.sign_in()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_new_user'])
+        self.assertEqual(User.objects.get(email='nefertari@example.com').last_name, 'Merytmut')
+        self.assertEqual(self.server.hits, ['/token', '/certs'])
+
+    def test_keys_cached_until_rotated(self):
+        """Test that keys are fetched once and again for an unknown key id"""
+        self.sign_in()
+        self.sign_in()
+        self.assertEqual(self.server.hits.count('/certs'), 1)
+        self.set_signing_key('key-2')
+        with override_settings(GOOGLE_OAUTH2_JWKS_MIN_REFETCH_SECONDS=0):
+            self.assertEqual(self.sign_in().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.server.hits.count('/certs'), 2)
+
+    def test_wrong_audience_rejected(self):
+        """Test that an id_token issued to another client is refused"""
+        self.claims['aud'] = 'someone-else'
+        self.assertEqual(self.sign_in().status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(User.objects.filter(email='nefertari@example.com').exists())
+
+    def test_unverified_email_rejected(self):
+        """Test that an account without a verified email cannot sign in"""
+        self.claims['email_verified'] = False
+        self.assertEqual(self.sign_in().status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refused_code(self):
+        """Test that a code Google refuses is a 400, tried once"""
+        self.server.token_status = 400
+        self.assertEqual(self.sign_in().status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.server.hits, ['/token'])
+
+    def test_slow_google_times_out(self):
+        """Test that a slow token exchange gives up after the read timeout, without retrying"""
+        self.server.delay = 1
+        started = time.monotonic()
+        self.assertEqual(self.sign_in().status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(self.server.hits, ['/token'])
+
+    def test_certs_retried(self):
+        """Test that a failed keys fetch is retried on the pooled session"""
+        self.server.certs_failures = 1
+        self.assertEqual(self.sign_in().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.server.hits, ['/token', '/certs', '/certs'])
+
+    def test_userinfo_without_id_token(self):
+        """Test that a token response without an id_token falls back to userinfo"""
+        self.server.id_token = lambda: None
+        self.assertEqual(self.sign_in().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.server.hits, ['/token', '/userinfo'])
@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path
-from .auth import login, register, logout, google_auth, forget_password, profile
+from .auth import login, register, logout, google_auth, forget_password, profile, async_views
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import (
@@ -8,21 +9,30 @@ from rest_framework_simplejwt.views import (
 )
 from . import views
 
+# Views that hash or check passwords; under ASGI they can run in a bounded thread pool
+if settings.AUTH_ASYNC_VIEWS:
+    login_view, register_view = async_views.login_view, async_views.register_view
+    change_password, password_reset_confirm = async_views.change_password, async_views.password_reset_confirm
+else:
+    login_view, register_view = login.login_view, register.register_view
+    change_password, password_reset_confirm = profile.change_password, forget_password.password_reset_confirm
+
 urlpatterns = [
 
     path('user-data/', views.user_view, name='user_data'),
 
     # Authentication endpoints
-    path('auth/login/', login.login_view, name='login'),
+    path('auth/login/', login_view, name='login'),
     path('auth/logout/', logout.logout_view, name='logout'),
-    path('auth/register/', register.register_view, name='register'),
+    path('auth/register/', register_view, name='register'),
     path('auth/verify-email/', register.verify_email, name='verify_email'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('auth/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
+    path('auth/pool/stats/', async_views.auth_pool_stats, name='auth_pool_stats'),
     
     #Password Reset endpoints
     path('auth/password-reset/', forget_password.password_reset_request, name='password_reset_request'),
-    path('auth/password-reset/confirm/', forget_password.password_reset_confirm, name='password_reset_confirm'),
+    path('auth/password-reset/confirm/', password_reset_confirm, name='password_reset_confirm'),
     path('auth/password-reset/validate/', forget_password.password_reset_validate, name='password_reset_validate'),
 
     #Google OAuth endpoints
@@ -33,6 +43,6 @@ urlpatterns = [
     #Profile endpoints
     path('profile/', profile.get_profile, name='get_profile'),
     path('profile/update/', profile.update_profile, name='update_profile'),
-    path('profile/change-password/', profile.change_password, name='change_password'),
+    path('profile/change-password/', change_password, name='change_password'),
     path('profile/verify-email-change/', profile.verify_email_change, name='verify_email_change'),
 ]
@@ -1,9 +1,23 @@
 from django.contrib import admin
-from .models import Portfolio
+from .models import Portfolio, PortfolioViewCount, SanitizationEvent
 
 @admin.register(Portfolio)
 class PortfolioAdmin(admin.ModelAdmin):
-    list_display = ('user', 'created_at', 'updated_at')
+    list_display = ('user', 'sanitizer_version', 'created_at', 'updated_at')
     search_fields = ('user__username', 'user__email')
     list_filter = ('created_at', 'updated_at')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('sanitizer_version', 'created_at', 'updated_at')
+
+@admin.register(SanitizationEvent)
+class SanitizationEventAdmin(admin.ModelAdmin):
+    list_display = ('portfolio', 'action', 'count', 'created_at')
+    search_fields = ('portfolio__user__username', 'fingerprint')
+    list_filter = ('action', 'created_at')
+    readonly_fields = ('portfolio', 'action', 'count', 'fingerprint', 'excerpts', 'created_at')
+
+@admin.register(PortfolioViewCount)
+class PortfolioViewCountAdmin(admin.ModelAdmin):
+    list_display = ('portfolio', 'day', 'count')
+    search_fields = ('portfolio__user__username',)
+    list_filter = ('day',)
+    readonly_fields = ('portfolio', 'day', 'count')
@@ -0,0 +1,122 @@
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Portfolios per UPDATE ... CASE statement
+FLUSH_CHUNK_SIZE = 500
+
+
+def write_view_counts(counts):
+    """
+    Add {(portfolio_id, day): views} to the daily buckets: one bulk insert of
+    missing buckets and one aggregated count = count + n UPDATE per day and
+    chunk of portfolios. Views of portfolios deleted meanwhile are dropped.
+    """
+    # Imported here: models are not ready when this module is imported
+    from .models import Portfolio, PortfolioViewCount
+    existing = set(
+        Portfolio.objects.filter(id__in={portfolio_id for portfolio_id, _ in counts})
+        .values_list('id', flat=True)
+    )
+    by_day = defaultdict(dict)
+    for (portfolio_id, day), views in counts.items():
+        if portfolio_id in existing:
+            by_day[day][portfolio_id] = views
+    with transaction.atomic():
+        for day, views in by_day.items():
+            portfolio_ids = list(views)
+            for start in range(0, len(portfolio_ids), FLUSH_CHUNK_SIZE):
+                chunk = portfolio_ids[start:start + FLUSH_CHUNK_SIZE]
+                PortfolioViewCount.objects.bulk_create(
+                    [PortfolioViewCount(portfolio_id=portfolio_id, day=day) for portfolio_id in chunk],
+                    ignore_conflicts=True,
+                )
+                increment = Case(
+                    *(When(portfolio_id=portfolio_id, then=Value(views[portfolio_id])) for portfolio_id in chunk),
+                    default=Value(0),
+                    output_field=models.PositiveIntegerField(),
+                )
+                PortfolioViewCount.objects.filter(day=day, portfolio_id__in=chunk).update(count=F('count') + increment)
+
+
+class ViewCounter:
+    """
+    Per-process tally of public portfolio views, written in batches so the
+    hot read path never touches the database for analytics.
+
+    record() only increments a dict entry under a lock. The first view after
+    a flush starts a timer that writes everything tallied so far once
+    PORTFOLIO_VIEW_COUNT_FLUSH_SECONDS have passed. Views are lost if the
+    process is killed before a flush; a clean exit flushes them.
+    """
+
+    def __init__(self, write=write_view_counts):
+        self.write = write
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._timer = None
+
+    def record(self, portfolio_id):
+        key = (portfolio_id, timezone.now().date())
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            if self._timer is None:
+                self._schedule()
+
+    def _schedule(self):
+        # Called with the lock held
+        timer = threading.Timer(settings.PORTFOLIO_VIEW_COUNT_FLUSH_SECONDS, self._flush_from_timer)
+        timer.daemon = True
+        self._timer = timer
+        timer.start()
+
+    def pending(self):
+        """Views tallied here and not yet written"""
+        with self._lock:
+            return sum(self._counts.values())
+
+    def flush(self):
+        """Write tallied views now; returns how many were written"""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not counts:
+            return 0
+        try:
+            self.write(counts)
+        except Exception as e:
+            logger.error(f"Failed to write {len(counts)} portfolio view counts: {str(e)}")
+            # Kept for the next flush rather than lost
+            with self._lock:
+                for key, views in counts.items():
+                    self._counts[key] = self._counts.get(key, 0) + views
+                if self._timer is None:
+                    self._schedule()
+            return 0
+        return sum(counts.values())
+
+    def _flush_from_timer(self):
+        close_old_connections()
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+    def clear(self):
+        """Forget tallied views without writing them"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._counts.clear()
+
+
+view_counter = ViewCounter()
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingSave:
+    """A sanitized save waiting for the end of its user's coalescing window"""
+    user: object
+    sanitized_code: str
+    sanitization_log: list
+    received_at: datetime
+
+
+class SaveCoalescer:
+    """
+    Collapses rapid autosaves from one user into a single write.
+
+    The first save in a window is written straight away. Saves arriving
+    before the window has passed since that write are parked here, each
+    replacing the previous one, and the latest is written when the window
+    ends. State is per process; persist() is expected to drop a parked save
+    that is older than what another process has already written.
+    """
+
+    def __init__(self, persist):
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._last_write = {}
+        self._pending = {}
+        self._timers = {}
+
+    def defer(self, pending, window):
+        """Park a save if its user was written within the window; returns whether it was parked"""
+        now = time.monotonic()
+        with self._lock:
+            last_write = self._last_write.get(pending.user.id)
+            if last_write is None or now - last_write >= window:
+                return False
+            self._pending[pending.user.id] = pending
+            if pending.user.id not in self._timers:
+                timer = threading.Timer(last_write + window - now, self._flush_from_timer, (pending.user.id,))
+                timer.daemon = True
+                self._timers[pending.user.id] = timer
+                timer.start()
+            return True
+
+    def written(self, user_id):
+        """Record that a user's portfolio was just written, opening a new window"""
+        with self._lock:
+            self._last_write[user_id] = time.monotonic()
+            # A direct write supersedes anything parked before it
+            self._pending.pop(user_id, None)
+
+    def has_pending(self, user_id):
+        with self._lock:
+            return user_id in self._pending
+
+    def flush(self, user_id=None):
+        """Write parked saves now, for one user or for everyone"""
+        with self._lock:
+            user_ids = [user_id] if user_id is not None else list(self._pending)
+            batch = []
+            for uid in user_ids:
+                timer = self._timers.pop(uid, None)
+                if timer:
+                    timer.cancel()
+                if uid in self._pending:
+                    batch.append(self._pending.pop(uid))
+        for pending in batch:
+            try:
+                self.persist(pending)
+            except Exception as e:
+                logger.error(f"Failed to write coalesced save for user {pending.user.id}: {str(e)}")
+            else:
+                self.written(pending.user.id)
+        return len(batch)
+
+    def _flush_from_timer(self, user_id):
+        close_old_connections()
+        try:
+            self.flush(user_id)
+        finally:
+            close_old_connections()
+
+    def clear(self):
+        """Forget all state without writing anything"""
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            self._pending.clear()
+            self._last_write.clear()
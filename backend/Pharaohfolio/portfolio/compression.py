@@ -0,0 +1,67 @@
+import gzip
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # In requirements.txt; without it only gzip variants are produced
+    brotli = None
+
+# Preferred first when a client accepts several
+ENCODINGS = ('br', 'gzip')
+
+
+def _compress(encoding, body):
+    if encoding == 'br':
+        return brotli.compress(body, quality=settings.PORTFOLIO_BROTLI_QUALITY)
+    # mtime=0 keeps the output, and so its ETag, stable for the same input
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def available_encodings():
+    return tuple(encoding for encoding in ENCODINGS if encoding != 'br' or brotli is not None)
+
+
+def compress_variants(body):
+    """
+    Encode a response body once with every available encoding. Returns a dict of
+    encoding -> bytes, leaving out bodies too small to bother with and variants
+    that would not be smaller than the original.
+    """
+    if len(body) < settings.PORTFOLIO_COMPRESSION_MIN_BYTES:
+        return {}
+    variants = {}
+    for encoding in available_encodings():
+        encoded = _compress(encoding, body)
+        if len(encoded) < len(body):
+            variants[encoding] = encoded
+    return variants
+
+
+def accepted_encodings(accept_encoding):
+    """Content codings an Accept-Encoding header allows, ignoring q=0 entries"""
+    accepted = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def negotiate(accept_encoding, available):
+    """Pick the stored encoding to send, or None for the uncompressed body"""
+    accepted = accepted_encodings(accept_encoding or '')
+    for encoding in ENCODINGS:
+        if encoding in available and (encoding in accepted or '*' in accepted):
+            return encoding
+    return None
@@ -0,0 +1,38 @@
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+# Fields needed to validate a conditional request; user_code is never loaded
+VALIDATOR_FIELDS = ('content_hash', 'updated_at', 'sanitizer_version')
+
+
+def is_conditional(request):
+    return 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def make_etag(*parts):
+    """Strong ETag from the stored content hash and any other parts of the body"""
+    return '"%s"' % '.'.join(str(part) for part in parts)
+
+
+def set_validators(response, etag, last_modified, private=False):
+    """Attach ETag, Last-Modified and a revalidate-every-time Cache-Control"""
+    if etag:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if private:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def not_modified(request, etag, last_modified, private=False):
+    """
+    Return a 304 response when the client's copy is current, else None.
+    last_modified is a Unix timestamp.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        return None
+    return set_validators(response, etag, last_modified, private)
@@ -0,0 +1,46 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+# Columns a gallery entry is built from; user_code is never loaded
+GALLERY_FIELDS = ('id', 'updated_at', 'title', 'user__username')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(updated_at, portfolio_id):
+    """Opaque cursor pointing just past a (updated_at, id) position"""
+    raw = f"{updated_at.isoformat()}|{portfolio_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        updated_at, portfolio_id = raw.split('|')
+        return datetime.fromisoformat(updated_at), int(portfolio_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def gallery_page(queryset, cursor, limit):
+    """
+    One page of portfolios, most recently updated first, and the cursor of the
+    next page or None. Keyset pagination on (updated_at, id): each page is an
+    index range scan starting where the last one stopped, however deep it is.
+    """
+    queryset = queryset.order_by('-updated_at', '-id')
+    if cursor:
+        updated_at, portfolio_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=portfolio_id),
+            updated_at__lte=updated_at,
+        )
+    rows = list(queryset.values(*GALLERY_FIELDS)[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['updated_at'], rows[-1]['id'])
+    return rows, next_cursor
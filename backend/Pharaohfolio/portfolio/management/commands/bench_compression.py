@@ -0,0 +1,100 @@
+import gzip
+import json
+import platform
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from portfolio import views
+from portfolio.compression import available_encodings, compress_variants, negotiate
+from portfolio.sanitization.corpus import PROFILES, generate_portfolio
+from .bench_sanitizer import parse_size, percentile
+
+DEFAULT_SIZES = '10KB,100KB,1MB'
+
+# What GZipMiddleware would do on every request
+ON_THE_FLY_GZIP_LEVEL = 6
+
+
+class Command(BaseCommand):
+    help = ('Compare bytes on the wire and CPU per request for public portfolios served '
+            'uncompressed, gzipped per request, or precompressed at save time')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='mixed', help='Comma-separated corpus profiles')
+        parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated document sizes, e.g. 1KB,1MB')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed runs per case')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        profiles = [p for p in options['profiles'].split(',') if p]
+        sizes = [parse_size(s) for s in options['sizes'].split(',') if s]
+        for profile in profiles:
+            if profile not in PROFILES:
+                raise CommandError(f"Unknown profile: {profile}")
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        results = []
+        for profile in profiles:
+            for size in sizes:
+                sanitized, _ = views.sanitize_with_regex(generate_portfolio(size, profile, options['seed']))
+                results.append(self.run_case(profile, views.public_body(sanitized), options['iterations']))
+                self.stderr.write(
+                    f"{profile:>7} {results[-1]['identity_bytes']:>9}B "
+                    + ' '.join(f"{mode}={case['bytes']}B/{case['cpu_ms']['p50']}ms"
+                               for mode, case in results[-1]['per_request'].items())
+                )
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'encodings': list(available_encodings()),
+            'iterations': options['iterations'],
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run_case(self, profile, body, iterations):
+        started = time.process_time()
+        variants = compress_variants(body)
+        save_cost = time.process_time() - started
+
+        modes = {
+            'identity': lambda: body,
+            'gzip_per_request': lambda: gzip.compress(body, compresslevel=ON_THE_FLY_GZIP_LEVEL, mtime=0),
+        }
+        for encoding in variants:
+            # Serving a stored variant is negotiation plus a lookup
+            modes[f'{encoding}_precompressed'] = (
+                lambda encoding=encoding: variants[negotiate(encoding, variants)]
+            )
+
+        per_request = {}
+        for mode, serve in modes.items():
+            timings = []
+            for _ in range(iterations):
+                started = time.process_time()
+                sent = serve()
+                timings.append(time.process_time() - started)
+            per_request[mode] = {
+                'bytes': len(sent),
+                'ratio': round(len(sent) / len(body), 4),
+                'cpu_ms': {
+                    'p50': round(percentile(timings, 50) * 1000, 3),
+                    'p99': round(percentile(timings, 99) * 1000, 3),
+                },
+            }
+
+        return {
+            'profile': profile,
+            'identity_bytes': len(body),
+            'save_time_compression_cpu_ms': round(save_cost * 1000, 3),
+            'per_request': per_request,
+        }
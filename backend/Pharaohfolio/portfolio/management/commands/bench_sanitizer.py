@@ -0,0 +1,137 @@
+import json
+import math
+import platform
+import time
+import tracemalloc
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from portfolio import views
+from portfolio.sanitization.budget import SanitizationBudget
+from portfolio.sanitization.corpus import PROFILES, generate_portfolio
+
+DEFAULT_SIZES = '1KB,10KB,100KB,1MB,5MB'
+
+_UNITS = {'KB': 1024, 'MB': 1024 * 1024, 'B': 1}
+
+
+def parse_size(value):
+    value = value.strip().upper()
+    for unit, factor in _UNITS.items():
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * factor)
+    return int(value)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def megabytes_per_second(size, seconds):
+    return round(size / (1024 * 1024) / seconds, 3) if seconds > 0 else None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the portfolio sanitizer engines on a generated corpus and print JSON results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engines', default=','.join(views.SANITIZER_ENGINES),
+                            help='Comma-separated engines to benchmark')
+        parser.add_argument('--profiles', default=','.join(PROFILES),
+                            help='Comma-separated corpus profiles')
+        parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                            help='Comma-separated document sizes, e.g. 1KB,1MB')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Timed runs per engine, profile and size')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        engines = [e for e in options['engines'].split(',') if e]
+        profiles = [p for p in options['profiles'].split(',') if p]
+        sizes = [parse_size(s) for s in options['sizes'].split(',') if s]
+        iterations = options['iterations']
+
+        for engine in engines:
+            if engine not in views.SANITIZER_ENGINES:
+                raise CommandError(f"Unknown engine: {engine}")
+        for profile in profiles:
+            if profile not in PROFILES:
+                raise CommandError(f"Unknown profile: {profile}")
+        if iterations < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        results = []
+        for profile in profiles:
+            for size in sizes:
+                code = generate_portfolio(size, profile, options['seed'])
+                for engine in engines:
+                    results.append(self.run_case(engine, profile, code, iterations))
+                    self.stderr.write(
+                        f"{engine:>9} {profile:>7} {len(code):>9}B "
+                        f"p50={results[-1]['latency_ms']['p50']}ms "
+                        f"{results[-1]['throughput_mb_s']}MB/s"
+                    )
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'rules_version': views.SANITIZER_RULES_VERSION,
+            'default_engine': settings.PORTFOLIO_SANITIZER_ENGINE,
+            'iterations': iterations,
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run_case(self, engine, profile, code, iterations):
+        # Engines are called directly so the result cache never short-circuits a run
+        sanitize = views.SANITIZER_ENGINES[engine]
+        size = len(code.encode('utf-8'))
+
+        latencies = []
+        stage_totals = {}
+        for _ in range(iterations):
+            budget = SanitizationBudget(record_stages=True)
+            started = time.perf_counter()
+            sanitize(code, budget)
+            latencies.append(time.perf_counter() - started)
+            for stage, seconds in budget.stage_timings.items():
+                stage_totals[stage] = stage_totals.get(stage, 0) + seconds
+
+        # Peak memory is measured on a separate run: tracing skews timings
+        tracemalloc.start()
+        try:
+            sanitize(code, SanitizationBudget())
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        mean = sum(latencies) / len(latencies)
+        return {
+            'engine': engine,
+            'profile': profile,
+            'size_bytes': size,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50) * 1000, 3),
+                'p99': round(percentile(latencies, 99) * 1000, 3),
+                'mean': round(mean * 1000, 3),
+            },
+            'throughput_mb_s': megabytes_per_second(size, mean),
+            'stages': {
+                stage: {
+                    'mean_ms': round(total / iterations * 1000, 3),
+                    'throughput_mb_s': megabytes_per_second(size, total / iterations),
+                }
+                for stage, total in stage_totals.items()
+            },
+            'peak_memory_bytes': peak,
+        }
@@ -0,0 +1,74 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+from portfolio.models import Portfolio, SanitizationEvent
+
+# Holds portfolio ids and their old sanitization_log while migrate drops the column
+STASH_TABLE = 'portfolio_sanitization_log_stash'
+
+
+class Command(BaseCommand):
+    help = ('Carry sanitization logs stored on portfolios over to sanitization events and '
+            'counts. Run before migrate to set the logs aside, and again after it to fold them in')
+
+    def handle(self, *args, **options):
+        tables = connection.introspection.table_names()
+        portfolio_table = Portfolio._meta.db_table
+        if portfolio_table not in tables:
+            self.stdout.write('No portfolio table yet; nothing to carry over')
+            return
+        with connection.cursor() as cursor:
+            columns = [c.name for c in connection.introspection.get_table_description(cursor, portfolio_table)]
+        if 'sanitization_log' in columns:
+            if STASH_TABLE in tables:
+                self.stdout.write('Sanitization logs already set aside')
+            else:
+                self.stash(portfolio_table)
+        elif STASH_TABLE in tables and SanitizationEvent._meta.db_table in tables:
+            self.fold()
+        else:
+            self.stdout.write('No sanitization logs to carry over')
+
+    def stash(self, portfolio_table):
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {quote(STASH_TABLE)} AS "
+                f"SELECT id AS portfolio_id, sanitization_log FROM {quote(portfolio_table)}"
+            )
+        self.stdout.write(self.style.SUCCESS('Set sanitization logs aside for after migrate'))
+
+    def fold(self):
+        quote = connection.ops.quote_name
+        folded = created = 0
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT portfolio_id, sanitization_log FROM {quote(STASH_TABLE)}")
+                rows = cursor.fetchall()
+            portfolios = Portfolio.objects.only('id', 'sanitization_counts').in_bulk([row[0] for row in rows])
+            for portfolio_id, log in rows:
+                portfolio = portfolios.get(portfolio_id)
+                if isinstance(log, (str, bytes)):
+                    log = json.loads(log)
+                if portfolio is None or not log:
+                    continue
+                entries = [
+                    {**entry, 'details': entry.get('details') if isinstance(entry.get('details'), list) else [entry.get('details')]}
+                    for entry in log if isinstance(entry, dict) and entry.get('action')
+                ]
+                events = SanitizationEvent.objects.bulk_create(portfolio.record_sanitization(entries))
+                # created_at is set on insert; give each event its log entry's time
+                for event, entry in zip(events, entries):
+                    timestamp = parse_datetime(entry.get('timestamp') or '')
+                    if timestamp:
+                        event.created_at = timestamp
+                SanitizationEvent.objects.bulk_update(events, ['created_at'])
+                Portfolio.objects.filter(id=portfolio.id).update(sanitization_counts=portfolio.sanitization_counts)
+                folded += 1
+                created += len(events)
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE {quote(STASH_TABLE)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Carried over sanitization logs of {folded} portfolios as {created} events"
+        ))
@@ -0,0 +1,54 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+from portfolio.models import SanitizationEvent
+
+
+class Command(BaseCommand):
+    help = 'Prune sanitization events past the retention window or beyond the per-portfolio cap'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.PORTFOLIO_SANITIZATION_EVENTS_RETENTION_DAYS,
+                            help='Delete events older than this many days')
+        parser.add_argument('--keep', type=int, default=settings.PORTFOLIO_SANITIZATION_EVENTS_MAX_PER_PORTFOLIO,
+                            help='Keep at most this many recent events per portfolio')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows deleted per statement')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['keep'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--days and --keep must not be negative and --batch-size must be positive')
+        self.options = options
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        expired = self.delete(SanitizationEvent.objects.filter(created_at__lt=cutoff))
+
+        overflow = 0
+        crowded = list(
+            SanitizationEvent.objects.values('portfolio_id')
+            .annotate(total=Count('id'))
+            .filter(total__gt=options['keep'])
+            .values_list('portfolio_id', flat=True)
+        )
+        for portfolio_id in crowded:
+            events = SanitizationEvent.objects.filter(portfolio_id=portfolio_id).order_by('-created_at', '-id')
+            # Everything older than the keep-th newest event goes
+            overflow += self.delete(events[options['keep']:])
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {expired} expired and {overflow} over-cap sanitization events"
+        ))
+
+    def delete(self, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        if self.options['dry_run']:
+            return len(ids)
+        batch_size = self.options['batch_size']
+        for start in range(0, len(ids), batch_size):
+            SanitizationEvent.objects.filter(id__in=ids[start:start + batch_size]).delete()
+        return len(ids)
+
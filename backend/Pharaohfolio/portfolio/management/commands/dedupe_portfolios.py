@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from portfolio.models import Portfolio
+
+
+def delete_rows(model, ids, tables):
+    """
+    Delete rows of model by primary key, and the rows cascading from them,
+    without the ORM collector. This runs before migrate, when the models may
+    name tables that do not exist yet; those can hold no rows, so are skipped.
+    """
+    for relation in model._meta.related_objects:
+        related = relation.related_model
+        if related._meta.db_table not in tables:
+            continue
+        dependent = related._base_manager.filter(**{f'{relation.field.name}__in': ids})
+        dependent_ids = list(dependent.values_list('pk', flat=True))
+        if dependent_ids:
+            delete_rows(related, dependent_ids, tables)
+    model._base_manager.filter(pk__in=ids)._raw_delete(connection.alias)
+
+
+class Command(BaseCommand):
+    help = ('Keep only the most recently updated portfolio of each user, so the '
+            'one-portfolio-per-user constraint can be applied')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted')
+
+    def handle(self, *args, **options):
+        tables = set(connection.introspection.table_names())
+        if Portfolio._meta.db_table not in tables:
+            self.stdout.write('No portfolio table yet; nothing to dedupe')
+            return
+
+        duplicated = list(
+            Portfolio.objects.values('user_id').annotate(total=Count('id'))
+            .filter(total__gt=1).values_list('user_id', flat=True)
+        )
+        removed = 0
+        for user_id in duplicated:
+            ids = list(
+                Portfolio.objects.filter(user_id=user_id)
+                .order_by('-updated_at', '-id').values_list('id', flat=True)
+            )
+            removed += len(ids) - 1
+            if not options['dry_run']:
+                with transaction.atomic():
+                    delete_rows(Portfolio, ids[1:], tables)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {removed} duplicate portfolios of {len(duplicated)} users"
+        ))
@@ -0,0 +1,63 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from portfolio import views
+from portfolio.models import Portfolio, PortfolioVariant
+from portfolio.publish.exporter import export_portfolio, get_backend, pointer_name, prune_objects
+from portfolio.sanitization.cache import content_hash
+
+
+class Command(BaseCommand):
+    help = 'Export every published portfolio to the static content-addressed store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Rows fetched per database round trip')
+        parser.add_argument('--prune', action='store_true',
+                            help='Afterwards delete pointers of users without a portfolio and unreferenced objects')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        started = time.perf_counter()
+        started_at = time.time()
+        exported = skipped = failed = 0
+        published = set()
+        queryset = (
+            Portfolio.objects.exclude(user_code='').select_related('user').order_by('id')
+            .only('id', 'user_code', 'content_hash', 'user__username')
+            # Variants compressed at save time are reused when current
+            .prefetch_related(Prefetch('variants', queryset=PortfolioVariant.objects.filter(format='html')))
+        )
+        for portfolio in queryset.iterator(chunk_size=options['chunk_size']):
+            digest = portfolio.content_hash or content_hash(portfolio.user_code)
+            encoded = {
+                variant.encoding: bytes(variant.body)
+                for variant in portfolio.variants.all() if variant.content_hash == digest
+            }
+            try:
+                if export_portfolio(portfolio.user.username, views.public_body(portfolio.user_code, 'html'), digest, encoded or None):
+                    exported += 1
+                    published.add(pointer_name(portfolio.user.username))
+                else:
+                    skipped += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Portfolio {portfolio.id} failed: {e!r}")
+
+        summary = f"Exported {exported}, skipped {skipped}, failed {failed} in {time.perf_counter() - started:.1f}s"
+        if options['prune'] and not failed:
+            backend = get_backend()
+            # Pointers set since the command started belong to saves made
+            # while it ran, which the row iterator may not have seen
+            stale = [
+                name for name, _ in backend.iter_pointers()
+                if name not in published and (backend.pointer_modified_at(name) or started_at) < started_at
+            ]
+            for name in stale:
+                backend.delete_pointer(name)
+            summary += f"; pruned {len(stale)} pointers and {prune_objects()} objects"
+        elif options['prune']:
+            summary += '; not pruning after failures'
+        self.stdout.write(self.style.SUCCESS(summary))
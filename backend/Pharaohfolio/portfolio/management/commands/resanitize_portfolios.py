@@ -0,0 +1,227 @@
+import difflib
+import json
+import os
+import time
+from concurrent.futures import CancelledError, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from portfolio import views
+from portfolio.metadata import METADATA_FIELDS, extract_metadata
+from portfolio.models import Portfolio, SanitizationEvent
+from portfolio.sanitization.cache import content_hash
+from portfolio.sanitization.pool import (
+    HARD_TIMEOUT_GRACE, SanitizationWorkerError, create_pool, sanitize_task, stop_pool,
+)
+
+
+# Ways a row can be lost with its pool rather than fail on its own
+LOST_WITH_POOL = (BrokenProcessPool, CancelledError)
+
+
+class Command(BaseCommand):
+    help = 'Re-run the current sanitization policy over portfolios stored under an older one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', default=settings.PORTFOLIO_SANITIZER_ENGINE,
+                            choices=list(views.SANITIZER_ENGINES))
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Sanitizer worker processes')
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Rows fetched per database round trip')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Portfolios sanitized and written per batch')
+        parser.add_argument('--checkpoint', help='File recording progress so an interrupted run can resume')
+        parser.add_argument('--resume', action='store_true', help='Continue after the id stored in --checkpoint')
+        parser.add_argument('--all', action='store_true',
+                            help='Reprocess every portfolio, not only those with a stale policy version')
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without writing them')
+        parser.add_argument('--diff-report', help='Write a unified diff of every changed portfolio to this file')
+
+    def handle(self, *args, **options):
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError('--resume requires --checkpoint')
+        if options['workers'] < 1 or options['batch_size'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers, --batch-size and --chunk-size must be positive')
+
+        self.options = options
+        self.stats = {'processed': 0, 'changed': 0, 'failed': 0, 'bytes': 0}
+        # Failed rows hold the checkpoint back, so --resume retries them
+        self.failed_ids = []
+        last_id = self.load_checkpoint() if options['resume'] else 0
+        self.diff_file = open(options['diff_report'], 'w') if options['diff_report'] else None
+
+        queryset = Portfolio.objects.filter(id__gt=last_id)
+        if not options['all']:
+            queryset = queryset.exclude(sanitizer_version=views.SANITIZER_RULES_VERSION)
+        queryset = (
+            queryset.select_related('user').order_by('id')
+            .only('id', 'user_code', 'content_hash', 'sanitization_counts', 'sanitizer_version', 'user__username')
+        )
+        self.started = time.perf_counter()
+        self.executor = create_pool(options['workers'])
+        try:
+            batch = []
+            for portfolio in queryset.iterator(chunk_size=options['chunk_size']):
+                batch.append(portfolio)
+                if len(batch) >= options['batch_size']:
+                    self.process_batch(batch)
+                    batch = []
+            if batch:
+                self.process_batch(batch)
+        finally:
+            stop_pool(self.executor, kill=True)
+            if self.diff_file:
+                self.diff_file.close()
+
+        elapsed = time.perf_counter() - self.started
+        verb = 'would change' if options['dry_run'] else 'changed'
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {self.stats['processed']} processed, {self.stats['changed']} {verb}, "
+            f"{self.stats['failed']} failed in {elapsed:.1f}s ({self.throughput(elapsed)})"
+        ))
+        if self.failed_ids:
+            self.stderr.write(f"Failed portfolio ids: {', '.join(map(str, self.failed_ids))}")
+
+    def restart_pool(self):
+        stop_pool(self.executor, kill=True)
+        self.executor = create_pool(self.options['workers'])
+
+    def sanitize_batch(self, batch):
+        """
+        Sanitize a batch in the pool. Returns {portfolio id: (sanitized, log)
+        or the exception it failed with}. A row running past its budget gets
+        the pool killed and rebuilt; rows lost with a broken or killed pool
+        are submitted again, once.
+        """
+        engine = self.options['engine']
+        seconds = settings.PORTFOLIO_SANITIZER_TIME_BUDGET
+        # Rows run in submission order, so a row being waited on has started
+        timeout = (seconds or settings.PORTFOLIO_SANITIZER_POOL_TIMEOUT) + HARD_TIMEOUT_GRACE
+        results = {}
+        resubmitted = set()
+        pending = batch
+        while pending:
+            futures = [(p, self.executor.submit(sanitize_task, p.user_code, engine, seconds)) for p in pending]
+            pending = []
+            for index, (portfolio, future) in enumerate(futures):
+                try:
+                    results[portfolio.id] = future.result(timeout=timeout)
+                    continue
+                except FuturesTimeoutError:
+                    results[portfolio.id] = SanitizationWorkerError(f'No result after {timeout}s')
+                except LOST_WITH_POOL as e:
+                    if portfolio.id in resubmitted:
+                        results[portfolio.id] = e
+                    else:
+                        pending.append(portfolio)
+                except Exception as e:
+                    results[portfolio.id] = e
+                    continue
+                # The pool is hung or broken: collect what finished, resubmit the rest
+                for later, later_future in futures[index + 1:]:
+                    try:
+                        results[later.id] = later_future.result(timeout=0)
+                    except (FuturesTimeoutError, *LOST_WITH_POOL):
+                        if later.id not in resubmitted:
+                            pending.append(later)
+                        else:
+                            results[later.id] = SanitizationWorkerError('Lost with the worker pool twice')
+                    except Exception as e:
+                        results[later.id] = e
+                self.restart_pool()
+                resubmitted.update(p.id for p in pending)
+                break
+        return results
+
+    def process_batch(self, batch):
+        results = self.sanitize_batch(batch)
+
+        processed = []
+        events = []
+        variants = []
+        changed = []
+        for portfolio in batch:
+            self.stats['processed'] += 1
+            self.stats['bytes'] += len(portfolio.user_code)
+            result = results[portfolio.id]
+            if isinstance(result, Exception):
+                self.stats['failed'] += 1
+                self.failed_ids.append(portfolio.id)
+                self.stderr.write(f"Portfolio {portfolio.id} failed: {result!r}")
+                continue
+            sanitized, sanitization_log = result
+            # Every successfully processed row is stamped with the current version
+            portfolio.sanitizer_version = views.SANITIZER_RULES_VERSION
+            portfolio.content_hash = content_hash(sanitized)
+            # Also backfills metadata of rows saved before it was extracted
+            portfolio.set_metadata(extract_metadata(sanitized))
+            processed.append(portfolio)
+            if sanitized == portfolio.user_code:
+                continue
+            self.stats['changed'] += 1
+            if self.diff_file:
+                self.write_diff(portfolio, sanitized)
+            events.extend(portfolio.record_sanitization(sanitization_log))
+            portfolio.user_code = sanitized
+            portfolio_variants = views.build_variants(portfolio)
+            variants.extend(portfolio_variants)
+            changed.append((portfolio, portfolio_variants))
+
+        if processed and not self.options['dry_run']:
+            with transaction.atomic():
+                Portfolio.objects.bulk_update(
+                    processed, ['user_code', 'content_hash', 'sanitization_counts', 'sanitizer_version', *METADATA_FIELDS]
+                )
+                SanitizationEvent.objects.bulk_create(events)
+                views.save_variants(variants)
+            for portfolio, portfolio_variants in changed:
+                views.publish_static(portfolio, portfolio_variants)
+        if not self.options['dry_run']:
+            # Never past a row that failed, so --resume comes back to it
+            self.save_checkpoint(min(self.failed_ids) - 1 if self.failed_ids else batch[-1].id)
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f"{self.stats['processed']} processed, {self.stats['changed']} changed, "
+            f"last id {batch[-1].id} ({self.throughput(elapsed)})"
+        )
+
+    def write_diff(self, portfolio, sanitized):
+        self.diff_file.writelines(difflib.unified_diff(
+            portfolio.user_code.splitlines(keepends=True),
+            sanitized.splitlines(keepends=True),
+            fromfile=f'portfolio/{portfolio.id}/stored',
+            tofile=f'portfolio/{portfolio.id}/resanitized',
+        ))
+
+    def throughput(self, elapsed):
+        if elapsed <= 0:
+            return '-'
+        return (
+            f"{self.stats['processed'] / elapsed:.1f} portfolios/s, "
+            f"{self.stats['bytes'] / (1024 * 1024) / elapsed:.2f} MB/s"
+        )
+
+    def load_checkpoint(self):
+        path = self.options['checkpoint']
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('rules_version') != views.SANITIZER_RULES_VERSION:
+            self.stderr.write('Checkpoint was written under other sanitization rules, starting over')
+            return 0
+        self.stdout.write(f"Resuming after portfolio {checkpoint['last_id']}")
+        return checkpoint['last_id']
+
+    def save_checkpoint(self, last_id):
+        path = self.options['checkpoint']
+        if not path:
+            return
+        # Write then rename so a crash never leaves a truncated checkpoint
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_id': last_id, 'rules_version': views.SANITIZER_RULES_VERSION}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,109 @@
+import html
+import re
+from .sanitization.tokenizer import TAG_BODY, _ATTRIBUTE, _MARKUP_START, _RAW_TEXT_END
+
+# Portfolio columns filled by extract_metadata
+METADATA_FIELDS = ['title', 'description', 'preview_image', 'metadata']
+
+# Column sizes on Portfolio
+TITLE_MAX_LENGTH = 200
+DESCRIPTION_MAX_LENGTH = 500
+URL_MAX_LENGTH = 500
+
+# Caps on what is kept in Portfolio.metadata
+MAX_PROPERTIES = 20
+MAX_RESOURCES = 50
+
+# Elements and the attribute holding the URL of a resource they load
+RESOURCE_ATTRIBUTES = {
+    'script': 'src', 'link': 'href', 'img': 'src', 'iframe': 'src',
+    'source': 'src', 'video': 'src', 'audio': 'src', 'embed': 'src',
+}
+
+_EXTERNAL_URL = re.compile(r'^(?:https?:)?//', re.IGNORECASE)
+_TAGS = re.compile(r'<[^>]*>')
+_WHITESPACE = re.compile(r'\s+')
+_H1_END = re.compile(r'</h1\s*>', re.IGNORECASE)
+
+
+def _text(fragment, max_length):
+    """Visible text of an HTML fragment, collapsed and truncated"""
+    text = _WHITESPACE.sub(' ', html.unescape(_TAGS.sub(' ', fragment))).strip()
+    return text[:max_length]
+
+
+def _attributes(attrs):
+    values = {}
+    for attr in _ATTRIBUTE.finditer(attrs):
+        value = attr.group(2)
+        if value is None:
+            value = attr.group(3)
+        if value is None:
+            value = attr.group(4)
+        values.setdefault(attr.group(1).lower(), html.unescape(value or '').strip())
+    return values
+
+
+def extract_metadata(code):
+    """
+    Read a sanitized document's title, description, preview image, OpenGraph
+    and Twitter card properties, and the external resources it loads, in one
+    linear scan over its tags. Returns the values of Portfolio's metadata columns.
+    """
+    title = heading = ''
+    heading_read = False
+    meta = {}
+    properties = {}
+    resources = []
+    pos = 0
+    length = len(code)
+
+    while pos < length:
+        match = _MARKUP_START.search(code, pos)
+        if not match:
+            break
+        if match.group(1):
+            end = code.find('-->', match.end())
+            pos = length if end == -1 else end + 3
+            continue
+        body = TAG_BODY.match(code, match.end())
+        pos = min(body.end() + 1, length)
+        tag = match.group(3)
+        if not tag or match.group(2):
+            continue
+        tag = tag.lower()
+
+        if tag == 'meta':
+            attrs = _attributes(code[match.end():body.end()])
+            name = (attrs.get('property') or attrs.get('name') or '').lower()
+            content = attrs.get('content', '')
+            if name and content:
+                meta.setdefault(name, content)
+                if name.startswith(('og:', 'twitter:')) and len(properties) < MAX_PROPERTIES:
+                    properties.setdefault(name, content[:URL_MAX_LENGTH])
+        elif tag in RESOURCE_ATTRIBUTES:
+            url = _attributes(code[match.end():body.end()]).get(RESOURCE_ATTRIBUTES[tag], '')
+            if _EXTERNAL_URL.match(url) and len(url) <= URL_MAX_LENGTH and url not in resources \
+                    and len(resources) < MAX_RESOURCES:
+                resources.append(url)
+        elif tag == 'h1' and not heading_read:
+            # Only the first heading is read, keeping the scan linear
+            heading_read = True
+            end = _H1_END.search(code, pos)
+            if end:
+                heading = _text(code[pos:end.start()], TITLE_MAX_LENGTH)
+
+        if tag in _RAW_TEXT_END:
+            raw_end = _RAW_TEXT_END[tag].search(code, pos)
+            content_end = length if raw_end is None else raw_end.start()
+            if tag == 'title' and not title:
+                title = _text(code[pos:content_end], TITLE_MAX_LENGTH)
+            pos = content_end
+
+    image = meta.get('og:image') or meta.get('twitter:image') or ''
+    return {
+        'title': title or meta.get('og:title', '')[:TITLE_MAX_LENGTH] or heading,
+        'description': (meta.get('description') or meta.get('og:description', ''))[:DESCRIPTION_MAX_LENGTH],
+        'preview_image': image if _EXTERNAL_URL.match(image) and len(image) <= URL_MAX_LENGTH else '',
+        'metadata': {'properties': properties, 'resources': resources},
+    }
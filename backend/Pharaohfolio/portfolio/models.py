@@ -1,48 +1,170 @@
+import hashlib
 from django.db import models
 from accounts.models import User
 
 # Create your models here.
 class Portfolio(models.Model):
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='portfolios')
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='portfolio')
     user_code = models.TextField()
-    sanitization_log = models.JSONField(default=list, blank=True, help_text="Log of what was removed during sanitization")
+    sanitization_counts = models.JSONField(default=dict, blank=True, help_text="Running totals of removed items per sanitization action")
+    content_hash = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of user_code, used to skip saves that change nothing")
+    sanitizer_version = models.CharField(max_length=32, blank=True, default='', db_index=True, help_text="Version of the sanitization policy that produced user_code")
+    title = models.CharField(max_length=200, blank=True, default='', db_index=True, help_text="Extracted at save time from <title>, og:title or the first <h1>")
+    description = models.CharField(max_length=500, blank=True, default='', help_text="Extracted at save time from the description or og:description meta tag")
+    preview_image = models.CharField(max_length=500, blank=True, default='', help_text="og:image or twitter:image URL")
+    metadata = models.JSONField(default=dict, blank=True, help_text="OpenGraph/Twitter card properties and external resource URLs")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"Portfolio of {self.user.username} ({self.created_at.strftime('%Y-%m-%d')})"
     
-    def add_sanitization_log(self, action, details):
-        """Add entry to sanitization log"""
-        if not self.sanitization_log:
-            self.sanitization_log = []
-        self.sanitization_log.append({
-            'action': action,
-            'details': details,
-            'timestamp': self.updated_at.isoformat()
-        })
-        self.save(update_fields=['sanitization_log'])
+    def record_sanitization(self, sanitization_log):
+        """
+        Add a sanitizer log to the summary counters and return unsaved
+        SanitizationEvent rows for it. The caller saves the portfolio, then
+        bulk-creates the events.
+        """
+        counts = dict(self.sanitization_counts or {})
+        events = []
+        for entry in sanitization_log:
+            counts[entry['action']] = counts.get(entry['action'], 0) + len(entry['details'])
+            events.append(SanitizationEvent.from_log_entry(self, entry))
+        self.sanitization_counts = counts
+        return events
+    
+    def set_metadata(self, metadata):
+        """Apply the column values returned by metadata.extract_metadata"""
+        for field, value in metadata.items():
+            setattr(self, field, value)
+
+    def is_stale(self, policy_version):
+        """Whether user_code was sanitized under another policy version"""
+        return self.sanitizer_version != policy_version
     
     def get_sanitization_summary(self):
         """Get a user-friendly summary of what was removed"""
-        if not self.sanitization_log:
+        if not self.sanitization_counts:
             return "No changes made to your code."
         
         summary = []
-        for entry in self.sanitization_log:
-            if entry['action'] == 'removed_dangerous_attributes':
-                summary.append(f"Removed {len(entry['details'])} potentially dangerous attributes")
-            elif entry['action'] == 'removed_images':
-                summary.append(f"Removed {len(entry['details'])} images from non-allowed sources")
-            elif entry['action'] == 'removed_scripts':
-                summary.append(f"Removed {len(entry['details'])} script elements")
-            elif entry['action'] == 'removed_navigation':
-                summary.append(f"Removed {len(entry['details'])} navigation elements")
+        for action, count in self.sanitization_counts.items():
+            if action == 'removed_dangerous_attributes':
+                summary.append(f"Removed {count} potentially dangerous attributes")
+            elif action == 'removed_images':
+                summary.append(f"Removed {count} images from non-allowed sources")
+            elif action == 'removed_scripts':
+                summary.append(f"Removed {count} script elements")
+            elif action == 'removed_navigation':
+                summary.append(f"Removed {count} navigation elements")
         
         return "; ".join(summary) if summary else "Code was cleaned for security."
     
     class Meta:
         verbose_name = "Portfolio"
         verbose_name_plural = "Portfolios"
+        indexes = [
+            # Gallery keyset pagination over published rows; includes user_id so a
+            # page is read from the index alone
+            models.Index(
+                fields=['-updated_at', '-id'], include=['user'], condition=~models.Q(user_code=''),
+                name='portfolio_gallery_idx',
+            ),
+        ]
+
+
+class SanitizationEvent(models.Model):
+    """
+    One sanitizer action applied to a portfolio save. Append-only: rows are
+    never updated, only pruned by manage.py compact_sanitization_events.
+    Removed fragments are kept as a fingerprint plus a few short excerpts.
+    """
+
+    EXCERPT_LENGTH = 120
+    MAX_EXCERPTS = 10
+
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='sanitization_events')
+    action = models.CharField(max_length=64)
+    count = models.PositiveIntegerField(default=0)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the removed fragments")
+    excerpts = models.JSONField(default=list, blank=True, help_text="First removed fragments, truncated")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.action} x{self.count} on portfolio {self.portfolio_id}"
+
+    @classmethod
+    def from_log_entry(cls, portfolio, entry):
+        details = [str(detail) for detail in entry['details']]
+        return cls(
+            portfolio=portfolio,
+            action=entry['action'],
+            count=len(details),
+            fingerprint=hashlib.sha256('\0'.join(details).encode('utf-8')).hexdigest(),
+            excerpts=[
+                detail if len(detail) <= cls.EXCERPT_LENGTH else detail[:cls.EXCERPT_LENGTH] + '…'
+                for detail in details[:cls.MAX_EXCERPTS]
+            ],
+        )
+
+    def as_log_entry(self):
+        return {
+            'action': self.action,
+            'details': self.excerpts,
+            'count': self.count,
+            'fingerprint': self.fingerprint,
+            'timestamp': self.created_at.isoformat(),
+        }
+
+    class Meta:
+        verbose_name = "Sanitization event"
+        verbose_name_plural = "Sanitization events"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['portfolio', '-created_at']),
+        ]
+
+
+class PortfolioVariant(models.Model):
+    """
+    A published representation of a portfolio, compressed once at save time
+    with one content coding. Only served while content_hash matches the portfolio's.
+    """
+
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='variants')
+    format = models.CharField(max_length=16, default='json', help_text="Representation: the JSON payload or the bare HTML document")
+    encoding = models.CharField(max_length=16)
+    content_hash = models.CharField(max_length=64, help_text="Portfolio.content_hash the body was built from")
+    body = models.BinaryField()
+
+    def __str__(self):
+        return f"{self.format}/{self.encoding} variant of portfolio {self.portfolio_id} ({len(self.body)} bytes)"
+
+    class Meta:
+        verbose_name = "Portfolio variant"
+        verbose_name_plural = "Portfolio variants"
+        constraints = [
+            models.UniqueConstraint(fields=['portfolio', 'format', 'encoding'], name='unique_portfolio_variant'),
+        ]
+
+
+class PortfolioViewCount(models.Model):
+    """
+    Public page views of a portfolio on one day (UTC). Views are tallied in
+    memory by each worker and added here in batches, see analytics.ViewCounter.
+    """
+
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='view_counts')
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.count} views of portfolio {self.portfolio_id} on {self.day}"
+
+    class Meta:
+        verbose_name = "Portfolio view count"
+        verbose_name_plural = "Portfolio view counts"
+        constraints = [
+            models.UniqueConstraint(fields=['portfolio', 'day'], name='unique_portfolio_view_day'),
+        ]
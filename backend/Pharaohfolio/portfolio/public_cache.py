@@ -0,0 +1,39 @@
+from urllib.parse import quote
+from django.conf import settings
+from django.core.cache import caches
+
+PUBLIC_CACHE_ALIAS = 'public_portfolios'
+
+
+def public_cache_key(username, rules_version, fmt='json'):
+    """
+    Key for a user's published payload in one format. The policy version is part
+    of the key so a sanitizer rules change never serves code cleaned under old rules.
+    """
+    return f"public:{rules_version}:{fmt}:{quote(username, safe='')}"
+
+
+def get_public_payload(username, rules_version, fmt='json'):
+    """Return the cached {'body', 'variants', 'etag', 'last_modified'} payload or None"""
+    return caches[PUBLIC_CACHE_ALIAS].get(public_cache_key(username, rules_version, fmt))
+
+
+def payload_size(payload):
+    """Bytes of a payload's body and compressed variants"""
+    return len(payload['body']) + sum(len(body) for body in payload['variants'].values())
+
+
+def store_public_payload(username, rules_version, payload, fmt='json'):
+    """Cache a rendered payload unless it is too large to be worth keeping"""
+    if payload_size(payload) > settings.PORTFOLIO_PUBLIC_CACHE_MAX_PAYLOAD_BYTES:
+        return
+    caches[PUBLIC_CACHE_ALIAS].set(public_cache_key(username, rules_version, fmt), payload)
+
+
+def invalidate_public_portfolio(username):
+    """Drop a user's cached payloads after their portfolio or username changed"""
+    # Imported here: portfolio.views imports this module
+    from portfolio.views import PUBLIC_FORMATS, SANITIZER_RULES_VERSION
+    caches[PUBLIC_CACHE_ALIAS].delete_many([
+        public_cache_key(username, SANITIZER_RULES_VERSION, fmt) for fmt in PUBLIC_FORMATS
+    ])
@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+
+
+class StaticExportBackend:
+    """
+    Storage for statically exported portfolios.
+
+    Objects are immutable directories of files named by the content hash of
+    the document they hold. Pointers map a username to the hash currently
+    published for it and are swapped atomically, so a reader sees either the
+    old or the new portfolio, never a mix. An object-store backend implements
+    the same methods, with pointers as small objects instead of symlinks.
+    """
+
+    def has_object(self, digest):
+        raise NotImplementedError
+
+    def put_object(self, digest, files):
+        """Store {filename: bytes} under digest; a no-op if it already exists"""
+        raise NotImplementedError
+
+    def touch_object(self, digest):
+        """Mark an object as just written; returns False if it does not exist"""
+        raise NotImplementedError
+
+    def object_modified_at(self, digest):
+        """Epoch seconds an object was last written or touched, or None"""
+        raise NotImplementedError
+
+    def delete_object(self, digest):
+        raise NotImplementedError
+
+    def iter_objects(self):
+        """Yield the digest of every stored object"""
+        raise NotImplementedError
+
+    def set_pointer(self, name, digest):
+        raise NotImplementedError
+
+    def get_pointer(self, name):
+        """Return the digest a name points to, or None"""
+        raise NotImplementedError
+
+    def pointer_modified_at(self, name):
+        """Epoch seconds a pointer was last set, or None"""
+        raise NotImplementedError
+
+    def delete_pointer(self, name):
+        raise NotImplementedError
+
+    def iter_pointers(self):
+        """Yield (name, digest) for every pointer"""
+        raise NotImplementedError
+
+    def put_config(self, files):
+        """Store {filename: bytes} of server configuration at the root, replacing it"""
+        raise NotImplementedError
+
+
+class LocalDirectoryBackend(StaticExportBackend):
+    """
+    Export tree on the local filesystem, ready for a web server to serve:
+
+        <root>/objects/ab/abcdef.../index.html (.gz, .br)
+        <root>/u/<username> -> ../objects/ab/abcdef...
+        <root>/_headers, <root>/headers.nginx.conf
+
+    so /u/<username>/index.html resolves through the pointer symlink, and
+    precompressed siblings work with gzip_static/brotli_static. The server
+    must send the headers in the config files with every document.
+    """
+
+    def __init__(self, root):
+        self.root = str(root)
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.pointers_dir = os.path.join(self.root, 'u')
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _pointer_path(self, name):
+        return os.path.join(self.pointers_dir, name)
+
+    def has_object(self, digest):
+        return os.path.isdir(self._object_path(digest))
+
+    def put_object(self, digest, files):
+        path = self._object_path(digest)
+        if os.path.isdir(path):
+            return
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        # Build the whole directory aside, then rename it into place
+        staging = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+        try:
+            for filename, data in files.items():
+                with open(os.path.join(staging, filename), 'wb') as f:
+                    f.write(data)
+            os.chmod(staging, 0o755)
+            try:
+                os.rename(staging, path)
+            except OSError:
+                # Published concurrently by another process
+                if not os.path.isdir(path):
+                    raise
+        finally:
+            if os.path.isdir(staging):
+                shutil.rmtree(staging, ignore_errors=True)
+
+    def touch_object(self, digest):
+        try:
+            os.utime(self._object_path(digest))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def object_modified_at(self, digest):
+        try:
+            return os.stat(self._object_path(digest)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def delete_object(self, digest):
+        shutil.rmtree(self._object_path(digest), ignore_errors=True)
+
+    def iter_objects(self):
+        if not os.path.isdir(self.objects_dir):
+            return
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            for digest in os.listdir(prefix_dir):
+                if not digest.startswith('.'):
+                    yield digest
+
+    def set_pointer(self, name, digest):
+        os.makedirs(self.pointers_dir, exist_ok=True)
+        target = os.path.join('..', 'objects', digest[:2], digest)
+        # A new symlink renamed over the old one swaps it atomically
+        tmp_link = self._pointer_path(f'.tmp-{name}-{os.getpid()}')
+        if os.path.lexists(tmp_link):
+            os.unlink(tmp_link)
+        os.symlink(target, tmp_link)
+        os.replace(tmp_link, self._pointer_path(name))
+
+    def get_pointer(self, name):
+        path = self._pointer_path(name)
+        if not os.path.islink(path):
+            return None
+        return os.path.basename(os.readlink(path))
+
+    def pointer_modified_at(self, name):
+        try:
+            return os.lstat(self._pointer_path(name)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def delete_pointer(self, name):
+        path = self._pointer_path(name)
+        if os.path.lexists(path):
+            os.unlink(path)
+
+    def iter_pointers(self):
+        if not os.path.isdir(self.pointers_dir):
+            return
+        for name in os.listdir(self.pointers_dir):
+            if not name.startswith('.'):
+                digest = self.get_pointer(name)
+                if digest:
+                    yield name, digest
+
+    def put_config(self, files):
+        os.makedirs(self.root, exist_ok=True)
+        for filename, data in files.items():
+            fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.root)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, os.path.join(self.root, filename))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
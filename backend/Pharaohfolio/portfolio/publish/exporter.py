@@ -0,0 +1,140 @@
+import logging
+import time
+from csp.utils import build_policy
+from django.conf import settings
+from django.utils.module_loading import import_string
+from ..compression import compress_variants
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_NAME = 'index.html'
+
+# File suffix of each precompressed sibling
+ENCODING_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+# Server configuration written at the root of the export tree: a _headers
+# file for static hosts and CDNs that read one, and an nginx snippet
+HEADERS_FILE_NAME = '_headers'
+NGINX_SNIPPET_NAME = 'headers.nginx.conf'
+
+_backend = None
+
+
+def export_headers():
+    """
+    Headers every exported document must be served with. They are the ones
+    public_portfolio_raw sends, since the export holds the same user code:
+    without the sandbox it would run scripts in the origin serving it.
+    """
+    return {
+        'Content-Security-Policy': build_policy(replace=settings.PUBLIC_PORTFOLIO_CSP_REPLACE),
+        'X-Content-Type-Options': 'nosniff',
+    }
+
+
+def header_config_files():
+    """{filename: bytes} of server configuration applying export_headers() to the tree"""
+    headers = export_headers()
+    static_host = ['/*'] + [f'  {name}: {value}' for name, value in headers.items()]
+    nginx = [
+        '# Include in every server or location block serving the export tree.',
+        '# nginx drops inherited add_header directives in a block that sets its own,',
+        '# so include it again in any nested location that adds headers.',
+    ] + [f'add_header {name} "{value}" always;' for name, value in headers.items()]
+    return {
+        HEADERS_FILE_NAME: ('\n'.join(static_host) + '\n').encode('utf-8'),
+        NGINX_SNIPPET_NAME: ('\n'.join(nginx) + '\n').encode('utf-8'),
+    }
+
+
+def get_backend():
+    """
+    The configured StaticExportBackend, built on first use. The header
+    configuration is written to the tree before anything is exported to it,
+    and rewritten by each process so it follows the current policy.
+    """
+    global _backend
+    if _backend is None:
+        backend_class = import_string(settings.PORTFOLIO_STATIC_EXPORT_BACKEND)
+        backend = backend_class(settings.PORTFOLIO_STATIC_EXPORT_ROOT)
+        backend.put_config(header_config_files())
+        _backend = backend
+    return _backend
+
+
+def reset_backend():
+    global _backend
+    _backend = None
+
+
+def pointer_name(username):
+    """
+    Name of a username's pointer, or None when the username cannot be used
+    as a path segment as it is.
+    """
+    if not username or username.startswith('.') or '/' in username or '\\' in username or '\0' in username:
+        return None
+    return username
+
+
+def export_portfolio(username, document, digest, encoded=None):
+    """
+    Write a sanitized document to the content-addressed store and point the
+    username at it. encoded is {encoding: bytes} of the document when already
+    compressed; otherwise it is compressed here. Returns whether anything
+    was published.
+    """
+    name = pointer_name(username)
+    if name is None:
+        logger.warning(f"Not exporting portfolio of {username!r}: unsafe as a path")
+        return False
+    backend = get_backend()
+    # An existing object is touched, so prune_objects leaves it alone until
+    # the pointer below refers to it; one pruned meanwhile is written again
+    if not backend.touch_object(digest):
+        if encoded is None:
+            encoded = compress_variants(document)
+        files = {DOCUMENT_NAME: document}
+        for encoding, body in encoded.items():
+            if encoding in ENCODING_SUFFIXES:
+                files[DOCUMENT_NAME + ENCODING_SUFFIXES[encoding]] = body
+        backend.put_object(digest, files)
+    if backend.get_pointer(name) != digest:
+        backend.set_pointer(name, digest)
+    return True
+
+
+def rename_export(old_username, new_username):
+    """Move a published pointer after a username change"""
+    old_name, new_name = pointer_name(old_username), pointer_name(new_username)
+    backend = get_backend()
+    digest = backend.get_pointer(old_name) if old_name else None
+    if digest is None:
+        return
+    if new_name:
+        backend.set_pointer(new_name, digest)
+    backend.delete_pointer(old_name)
+
+
+def prune_objects(grace_seconds=None):
+    """
+    Delete objects no pointer refers to that were not written or touched in
+    the last grace_seconds, PORTFOLIO_STATIC_EXPORT_PRUNE_GRACE_SECONDS by
+    default. Returns how many were removed.
+    """
+    if grace_seconds is None:
+        grace_seconds = settings.PORTFOLIO_STATIC_EXPORT_PRUNE_GRACE_SECONDS
+    backend = get_backend()
+    objects = list(backend.iter_objects())
+    referenced = {digest for _, digest in backend.iter_pointers()}
+    removed = 0
+    for digest in objects:
+        if digest in referenced:
+            continue
+        # Read after the pointers: a publish swapping its pointer after they
+        # were listed touched its object first, so it is too recent to go
+        modified_at = backend.object_modified_at(digest)
+        if modified_at is not None and time.time() - modified_at >= grace_seconds:
+            backend.delete_object(digest)
+            removed += 1
+    return removed
@@ -0,0 +1,39 @@
+import time
+
+
+class SanitizationTimeout(Exception):
+    """Raised when sanitizing a document runs past its time budget"""
+
+
+class SanitizationBudget:
+    """
+    Wall-clock budget for one sanitization.
+    Engines call check() periodically inside their scan loops and
+    checkpoint() at the end of each stage; every stage is linear, so the
+    overrun past the deadline is bounded. With record_stages=True the
+    duration of each stage is kept in `stage_timings` for benchmarking.
+    """
+
+    def __init__(self, seconds=None, record_stages=False):
+        self.seconds = seconds
+        self.started = time.perf_counter()
+        self.deadline = self.started + seconds if seconds else None
+        self.stage_timings = {} if record_stages else None
+        self._last_checkpoint = self.started
+
+    def check(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SanitizationTimeout(
+                f"Sanitization exceeded its {self.seconds}s budget"
+            )
+
+    def checkpoint(self, stage):
+        """Mark the end of a stage, recording its duration when enabled"""
+        if self.stage_timings is not None:
+            now = time.perf_counter()
+            self.stage_timings[stage] = self.stage_timings.get(stage, 0) + now - self._last_checkpoint
+            self._last_checkpoint = now
+        self.check()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
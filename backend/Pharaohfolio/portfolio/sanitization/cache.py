@@ -0,0 +1,82 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+SANITIZER_CACHE_ALIAS = 'sanitizer'
+
+# Bytes held by each SizeBoundedLocMemCache, keyed by LOCATION like LocMemCache's own stores
+_usage = {}
+
+
+class SizeBoundedLocMemCache(LocMemCache):
+    """
+    LocMemCache bounded by the total size of its pickled values as well as
+    by their count. Setting an entry first evicts least recently used ones
+    until it fits in OPTIONS['MAX_BYTES']; an entry larger than that on its
+    own is not stored.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._max_bytes = int(params.get('OPTIONS', {}).get('MAX_BYTES', 64 * 1024 * 1024))
+        self._usage = _usage.setdefault(name, {'bytes': 0, 'sizes': {}})
+
+    def _set(self, key, value, timeout=None):
+        self._delete(key)
+        size = len(value)
+        if size > self._max_bytes:
+            return
+        while self._cache and self._usage['bytes'] + size > self._max_bytes:
+            # Entries are kept most recently used first
+            self._delete(next(reversed(self._cache)))
+        super()._set(key, value, timeout)
+        self._usage['sizes'][key] = size
+        self._usage['bytes'] += size
+
+    def _cull(self):
+        count = len(self._cache) if self._cull_frequency == 0 else len(self._cache) // self._cull_frequency
+        for _ in range(count):
+            self._delete(next(reversed(self._cache)))
+
+    def _delete(self, key):
+        if not super()._delete(key):
+            return False
+        self._usage['bytes'] -= self._usage['sizes'].pop(key, 0)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._expire_info.clear()
+            self._usage['sizes'].clear()
+            self._usage['bytes'] = 0
+
+    def size_bytes(self):
+        return self._usage['bytes']
+
+
+def content_hash(code):
+    """SHA-256 hex digest of the submitted code"""
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+
+def cache_key(code, engine, rules_version):
+    """Content-addressed key: same input under the same rules maps to the same entry"""
+    return f"sanitized:{engine}:{rules_version}:{content_hash(code)}"
+
+
+def get_cached_result(key):
+    """Return the cached (sanitized_code, sanitization_log) tuple or None"""
+    cached = caches[SANITIZER_CACHE_ALIAS].get(key)
+    if cached is None:
+        return None
+    sanitized, sanitization_log = cached
+    return sanitized, sanitization_log
+
+
+def store_result(key, code, result):
+    """Cache a sanitizer result unless the input is too large to be worth keeping"""
+    if len(code) > settings.PORTFOLIO_SANITIZER_CACHE_MAX_BYTES:
+        return
+    caches[SANITIZER_CACHE_ALIAS].set(key, result)
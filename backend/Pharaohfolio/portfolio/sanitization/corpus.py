@@ -0,0 +1,131 @@
+import random
+
+# Synthetic portfolio generator for the sanitizer benchmark. Documents are
+# built from sections resembling what AI assistants produce, mixed by
+# profile, and are deterministic for a given (profile, size, seed).
+
+PROFILES = ('mixed', 'svg', 'images', 'nav', 'scripts')
+
+_HEAD = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>Portfolio</title>
+<style>
+body { font-family: 'Inter', sans-serif; margin: 0; color: #1f2937; }
+.card { border-radius: 12px; box-shadow: 0 4px 12px rgba(0,0,0,.1); padding: 24px; }
+.grid > .item:hover { transform: translateY(-4px); }
+</style>
+</head>
+<body>
+'''
+
+_TAIL = '''</body>
+</html>
+'''
+
+_WORDS = (
+    'design', 'develop', 'react', 'django', 'portfolio', 'project', 'client',
+    'experience', 'creative', 'modern', 'responsive', 'performance', 'team',
+    'product', 'startup', 'research', 'open', 'source', 'cloud', 'data',
+)
+
+_IMAGE_HOSTS = (
+    'https://images.unsplash.com/photo-',
+    'https://i.imgur.com/',
+    'https://picsum.photos/seed/',
+    'https://cdn.example.com/assets/',
+)
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _section(rng, i):
+    return (
+        f'<section id="section-{i}" class="card">\n'
+        f'<h2 class="title">{_text(rng, 4).title()}</h2>\n'
+        f'<p style="line-height: 1.6">{_text(rng, 60)}</p>\n'
+        f'<a href="https://example.com/{i}" target="_blank" rel="noopener">Read more</a>\n'
+        f'<button type="button" onclick="toggle({i})">Details</button>\n'
+        '</section>\n'
+    )
+
+
+def _svg(rng, i):
+    points = ' '.join(f'{rng.randint(0, 200)},{rng.randint(0, 200)}' for _ in range(12))
+    paths = ''.join(
+        f'<path d="M{rng.randint(0, 99)} {rng.randint(0, 99)} C {rng.randint(0, 99)} {rng.randint(0, 99)}, '
+        f'{rng.randint(0, 99)} {rng.randint(0, 99)}, {rng.randint(0, 99)} {rng.randint(0, 99)}" '
+        f'fill="none" stroke="#{rng.randint(0, 0xffffff):06x}" stroke-width="2"/>\n'
+        for _ in range(6)
+    )
+    return (
+        f'<svg width="200" height="200" viewBox="0 0 200 200" xmlns="http://www.w3.org/2000/svg" id="icon-{i}">\n'
+        '<defs><linearGradient id="g" x1="0" y1="0" x2="1" y2="1">'
+        '<stop offset="0" stop-color="#f59e0b"/><stop offset="1" stop-color="#b45309"/></linearGradient></defs>\n'
+        f'<g transform="rotate({rng.randint(0, 359)} 100 100)">\n{paths}'
+        f'<polygon points="{points}" fill="url(#g)" opacity="0.6"/>\n'
+        f'<circle cx="{rng.randint(0, 200)}" cy="{rng.randint(0, 200)}" r="{rng.randint(5, 40)}" fill="#fff"/>\n'
+        '</g></svg>\n'
+    )
+
+
+def _images(rng, i):
+    return '<div class="grid">\n' + ''.join(
+        f'<div class="item"><img src="{rng.choice(_IMAGE_HOSTS)}{rng.randint(10 ** 6, 10 ** 7)}.jpg" '
+        f'alt="{_text(rng, 3)}" width="320" height="240" onerror="this.hidden=true"></div>\n'
+        for _ in range(8)
+    ) + '</div>\n'
+
+
+def _nav(rng, i):
+    links = ''.join(
+        f'<li><a href="#section-{rng.randint(0, 50)}">{_text(rng, 1).title()}</a></li>'
+        for _ in range(6)
+    )
+    return (
+        f'<nav class="top-nav" id="nav-{i}"><ul>{links}</ul></nav>\n'
+        f'<ul class="navbar-links">{links}</ul>\n'
+        f'<ol class="breadcrumb-nav">{links}</ol>\n'
+    )
+
+
+def _script(rng, i):
+    return (
+        '<script>\n'
+        f'const items{i} = document.querySelectorAll(".item");\n'
+        f'items{i}.forEach((el, idx) => {{ if (idx > {rng.randint(1, 9)} && el) el.classList.add("shown"); }});\n'
+        f'function toggle(n) {{ return n < {rng.randint(10, 99)} ? "<b>open</b>" : "closed"; }}\n'
+        f'window.addEventListener("scroll", () => {{ /* {_text(rng, 8)} */ }});\n'
+        '</script>\n'
+    )
+
+
+_BLOCKS = {
+    'mixed': (_section, _svg, _images, _nav, _script),
+    'svg': (_svg, _svg, _svg, _section),
+    'images': (_images, _images, _section),
+    'nav': (_nav, _nav, _section),
+    'scripts': (_script, _script, _section),
+}
+
+
+def generate_portfolio(size, profile='mixed', seed=0):
+    """Build a synthetic portfolio of roughly `size` characters"""
+    if profile not in _BLOCKS:
+        raise ValueError(f"Unknown corpus profile: {profile}")
+    rng = random.Random(f'{profile}:{size}:{seed}')
+    blocks = _BLOCKS[profile]
+    parts = [_HEAD]
+    length = len(_HEAD) + len(_TAIL)
+    i = 0
+    while length < size:
+        block = blocks[i % len(blocks)](rng, i)
+        parts.append(block)
+        length += len(block)
+        i += 1
+    parts.append(_TAIL)
+    return ''.join(parts)
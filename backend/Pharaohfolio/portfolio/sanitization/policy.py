@@ -0,0 +1,56 @@
+import hashlib
+import json
+import re
+from .stages import NAV_OPEN, NAV_LIST_OPEN, NAV_CLASS
+
+
+class SanitizationPolicy:
+    """
+    Compiled, versioned set of sanitization rules.
+
+    Built once at startup from the rule lists in portfolio.views and shared
+    by every engine. Its version is a hash of the rules and patterns, stored
+    on each Portfolio, so rows sanitized under an older policy can be found
+    and reprocessed without rescanning the whole table.
+    """
+
+    def __init__(self, dangerous_attributes, allowed_img_domains, image_placeholder, revision):
+        self.dangerous_attributes = tuple(dangerous_attributes)
+        self.allowed_img_domains = tuple(allowed_img_domains)
+        self.image_placeholder = image_placeholder
+        self.revision = revision
+
+        self.event_handler_patterns = tuple(
+            re.compile(rf'{attr}\s*=\s*["\'][^"\']*["\']', re.IGNORECASE)
+            for attr in self.dangerous_attributes
+        )
+        self.javascript_protocol = re.compile(r'javascript\s*:', re.IGNORECASE)
+        self.javascript_protocol_detail = re.compile(r'javascript\s*:[^"\'>\s]+', re.IGNORECASE)
+        # Applied by the linear scan in stages.remove_data_scripts; the
+        # pattern defines the rule and is part of the version
+        self.data_script = re.compile(r'src\s*=\s*["\']data:[^"\']*?script[^"\']*?["\']', re.IGNORECASE)
+
+        self.version = self._compute_version()
+
+    def is_allowed_img_src(self, src):
+        return src.startswith(self.allowed_img_domains)
+
+    def _compute_version(self):
+        patterns = [
+            pattern.pattern for pattern in (
+                *self.event_handler_patterns,
+                self.javascript_protocol,
+                self.data_script,
+                NAV_OPEN,
+                NAV_LIST_OPEN,
+                NAV_CLASS,
+            )
+        ]
+        rules = [
+            self.revision,
+            self.dangerous_attributes,
+            self.allowed_img_domains,
+            self.image_placeholder,
+            patterns,
+        ]
+        return hashlib.sha256(json.dumps(rules).encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,127 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Extra seconds the web worker waits past the pool timeout before it gives
+# up on a task; the worker's own budget normally ends it first
+HARD_TIMEOUT_GRACE = 2.0
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class SanitizationWorkerError(Exception):
+    """Raised when a pool worker crashes or never returns a result"""
+
+
+class SanitizationMemoryError(SanitizationWorkerError):
+    """Raised when a pool worker runs out of its memory limit"""
+
+
+def should_offload(code):
+    """Whether a document is large enough to be sanitized in the process pool"""
+    return (
+        settings.PORTFOLIO_SANITIZER_POOL_ENABLED
+        and len(code) >= settings.PORTFOLIO_SANITIZER_POOL_THRESHOLD
+    )
+
+
+def _init_worker(settings_module, memory_limit):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+    if memory_limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def sanitize_task(code, engine, seconds):
+    """Run one sanitizer engine in a pool worker"""
+    # Imported here: views imports this module
+    from portfolio.views import SANITIZER_ENGINES
+    from .budget import SanitizationBudget
+    return SANITIZER_ENGINES[engine](code, SanitizationBudget(seconds))
+
+
+def create_pool(workers):
+    """New process pool whose workers have Django set up and the memory limit applied"""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(settings.PORTFOLIO_SANITIZER_POOL_START_METHOD),
+        initializer=_init_worker,
+        initargs=(
+            os.environ.get('DJANGO_SETTINGS_MODULE', 'Pharaohfolio.settings'),
+            settings.PORTFOLIO_SANITIZER_POOL_MEMORY_LIMIT,
+        ),
+    )
+
+
+def get_executor():
+    """Return the persistent process pool, starting it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = create_pool(settings.PORTFOLIO_SANITIZER_POOL_WORKERS)
+        return _executor
+
+
+def stop_pool(executor, kill=False):
+    """Stop a pool; with kill=True running workers are terminated first"""
+    if kill:
+        # ProcessPoolExecutor has no public way to stop a running task
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.terminate()
+    executor.shutdown(wait=not kill, cancel_futures=True)
+
+
+def shutdown_pool(kill=False):
+    """Stop the persistent pool, see stop_pool"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        stop_pool(executor, kill)
+
+
+atexit.register(shutdown_pool)
+
+
+def sanitize_in_pool(code, engine, seconds):
+    """
+    Sanitize code in the process pool under a per-task timeout.
+    Returns tuple: (sanitized_code, sanitization_log)
+    """
+    timeout = settings.PORTFOLIO_SANITIZER_POOL_TIMEOUT
+    if seconds:
+        timeout = min(timeout, seconds)
+    try:
+        future = get_executor().submit(sanitize_task, code, engine, timeout)
+    except BrokenProcessPool:
+        shutdown_pool(kill=True)
+        future = get_executor().submit(sanitize_task, code, engine, timeout)
+
+    try:
+        return future.result(timeout=timeout + HARD_TIMEOUT_GRACE)
+    except FuturesTimeoutError:
+        if not future.cancel():
+            # Still running: the worker is stuck, replace the pool
+            logger.error(f"Sanitization worker exceeded {timeout}s, restarting pool")
+            shutdown_pool(kill=True)
+        raise SanitizationWorkerError('Sanitization worker timed out')
+    except MemoryError:
+        raise SanitizationMemoryError('Sanitization worker ran out of memory')
+    except BrokenProcessPool:
+        logger.error('Sanitization worker crashed, restarting pool')
+        shutdown_pool(kill=True)
+        raise SanitizationWorkerError('Sanitization worker crashed')
@@ -0,0 +1,127 @@
+import re
+from .tokenizer import TAG_BODY
+
+# Linear-time implementations of the regex engine's image and navigation
+# stages. Each scan only moves forward: a tag is delimited once, and a
+# missing closing tag ends the search for that element for good instead of
+# being rescanned from every later opening tag.
+
+_IMG_OPEN = re.compile(r'<img\b', re.IGNORECASE)
+_IMG_SRC = re.compile(r'src=["\']([^"\']*)["\']', re.IGNORECASE)
+
+NAV_OPEN = re.compile(r'<(nav)\b', re.IGNORECASE)
+NAV_LIST_OPEN = re.compile(r'<(ul|ol)\b', re.IGNORECASE)
+NAV_CLASS = re.compile(r'class=["\'][^"\']*nav[^"\']*["\']', re.IGNORECASE)
+
+# Start of a src attribute whose quoted value is a data: URL
+_DATA_SRC_OPEN = re.compile(r'src\s*=\s*["\']data:', re.IGNORECASE)
+_QUOTE = re.compile(r'["\']')
+
+_CLOSING_TAGS = {
+    tag: re.compile(rf'</{tag}>', re.IGNORECASE) for tag in ('nav', 'ul', 'ol')
+}
+
+
+def replace_disallowed_images(code, is_allowed_img_src, placeholder, budget):
+    """
+    Replace <img> tags whose src is not allowed with the placeholder.
+    Returns tuple: (code, removed_srcs)
+    """
+    out = []
+    removed = []
+    pos = 0
+    length = len(code)
+
+    while True:
+        budget.check()
+        match = _IMG_OPEN.search(code, pos)
+        if not match:
+            break
+        end = TAG_BODY.match(code, match.end()).end()
+        if end >= length:
+            # Unterminated tag: nothing after it can be an element either
+            break
+        end += 1
+        src = _IMG_SRC.search(code, match.end(), end)
+        if src and not is_allowed_img_src(src.group(1)):
+            out.append(code[pos:match.start()])
+            out.append(placeholder)
+            removed.append(src.group(1))
+        else:
+            out.append(code[pos:end])
+        pos = end
+
+    out.append(code[pos:])
+    return ''.join(out), removed
+
+
+def remove_data_scripts(code, budget):
+    """
+    Remove src attributes holding a data: URL that mentions "script", the
+    same matches as SanitizationPolicy.data_script. A value ends at the first
+    quote of either kind, so each one is scanned once.
+    Returns tuple: (code, removed_attributes)
+    """
+    out = []
+    removed = []
+    pos = 0
+    search_from = 0
+
+    while True:
+        budget.check()
+        match = _DATA_SRC_OPEN.search(code, search_from)
+        if not match:
+            break
+        quote = _QUOTE.search(code, match.end())
+        if not quote:
+            # No quote remains, so no later attribute can be quoted either
+            break
+        if 'script' not in code[match.end():quote.start()].lower():
+            # The closing quote may open a src nested in this value
+            search_from = match.start() + 1
+            continue
+        out.append(code[pos:match.start()])
+        removed.append(code[match.start():quote.end()])
+        pos = search_from = quote.end()
+
+    out.append(code[pos:])
+    return ''.join(out), removed
+
+
+def remove_elements(code, opener, budget, class_filter=None):
+    """
+    Remove every element opened by `opener` (group 1 is the tag name) up to
+    its first closing tag, optionally only when its start tag matches
+    `class_filter`. Returns tuple: (code, removed_fragments)
+    """
+    out = []
+    removed = []
+    pos = 0
+    search_from = 0
+    unclosed = set()
+
+    while True:
+        budget.check()
+        match = opener.search(code, search_from)
+        if not match:
+            break
+        tag = match.group(1).lower()
+        tag_end = code.find('>', match.end())
+        if tag_end == -1:
+            break
+        search_from = tag_end + 1
+        if tag in unclosed:
+            continue
+        if class_filter and not class_filter.search(code, match.end(), tag_end):
+            continue
+        closing = _CLOSING_TAGS[tag].search(code, tag_end + 1)
+        if not closing:
+            # No closing tag remains, so no later element of this tag can match
+            unclosed.add(tag)
+            continue
+        out.append(code[pos:match.start()])
+        removed.append(code[match.start():closing.end()])
+        pos = search_from = closing.end()
+
+    out.append(code[pos:])
+    return ''.join(out), removed
@@ -0,0 +1,204 @@
+import re
+from .budget import SanitizationBudget
+
+# Elements whose content is raw text: nothing inside them is markup, so the
+# scanner copies them through untouched up to the matching end tag.
+RAW_TEXT_TAGS = ('script', 'style', 'textarea', 'title')
+
+# Start of any markup construct: comment, end tag, start tag or declaration
+_MARKUP_START = re.compile(r'<(?:(!--)|(/)?([a-zA-Z][a-zA-Z0-9:_-]*)|[!?])')
+
+# Body of a tag up to its closing '>', honouring quoted attribute values.
+# An unterminated quote runs to the end of the document, so the pattern
+# can never fail and never backtracks.
+TAG_BODY = re.compile(r'''(?:[^>"']+|"[^"]*"?|'[^']*'?)*''')
+
+_ATTRIBUTE = re.compile(
+    r'''([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?'''
+)
+
+_RAW_TEXT_END = {
+    tag: re.compile(rf'</{tag}\s*>', re.IGNORECASE) for tag in RAW_TEXT_TAGS
+}
+
+# Tokens scanned between two budget checks
+BUDGET_CHECK_INTERVAL = 1024
+
+_JS_PROTOCOL = re.compile(r'javascript\s*:', re.IGNORECASE)
+_JS_PROTOCOL_DETAIL = re.compile(r'javascript\s*:[^"\'>\s]+', re.IGNORECASE)
+
+
+def _attribute_prefilter(dangerous_attributes):
+    """Cheap check telling whether a tag may need its attributes rewritten"""
+    handlers = '|'.join(re.escape(attr) for attr in dangerous_attributes)
+    return re.compile(rf'(?:{handlers})\s*=|javascript\s*:|\bsrc\s*=', re.IGNORECASE)
+
+
+class TokenizerSanitizer:
+    """
+    Single-pass sanitizer built on a streaming HTML tokenizer.
+
+    Applies every rule of the regex engine (event handlers, javascript:
+    protocols, data: scripts, image allowlist, navigation removal) during one
+    linear scan of the document instead of one regex pass per rule. Rules
+    act on markup only: attribute values are rewritten, while text and the
+    content of raw-text elements such as <script> are copied as-is.
+    """
+
+    def __init__(self, policy):
+        self.dangerous_attributes = frozenset(attr.lower() for attr in policy.dangerous_attributes)
+        self.is_allowed_img_src = policy.is_allowed_img_src
+        self.image_placeholder = policy.image_placeholder
+        self._prefilter = _attribute_prefilter(policy.dangerous_attributes)
+
+    def sanitize(self, code, budget=None):
+        """
+        Sanitize code in one pass.
+        Returns tuple: (sanitized_code, sanitization_log)
+        """
+        budget = budget or SanitizationBudget()
+        removed = {
+            'removed_dangerous_attributes': [],
+            'removed_javascript_protocols': [],
+            'removed_data_scripts': [],
+            'removed_images': [],
+            'removed_navigation': [],
+        }
+        out = []
+        # Open navigation capture: [tag, depth, index into out]
+        capture = None
+        pos = 0
+        length = len(code)
+        tokens = 0
+
+        while pos < length:
+            tokens += 1
+            if tokens % BUDGET_CHECK_INTERVAL == 0:
+                budget.check()
+            match = _MARKUP_START.search(code, pos)
+            if not match:
+                out.append(code[pos:])
+                break
+            start = match.start()
+            if start > pos:
+                out.append(code[pos:start])
+
+            is_comment, is_end, tag = match.group(1), match.group(2), match.group(3)
+
+            if is_comment:
+                end = code.find('-->', match.end())
+                pos = length if end == -1 else end + 3
+                out.append(code[start:pos])
+                continue
+
+            body = TAG_BODY.match(code, match.end())
+            pos = min(body.end() + 1, length)
+
+            if not tag:
+                # Doctype, processing instruction or bogus comment
+                out.append(code[start:pos])
+                continue
+
+            tag = tag.lower()
+
+            if is_end:
+                out.append(code[start:pos])
+                if capture and capture[0] == tag:
+                    capture[1] -= 1
+                    if capture[1] == 0:
+                        removed['removed_navigation'].append(''.join(out[capture[2]:]))
+                        del out[capture[2]:]
+                        capture = None
+                continue
+
+            attrs = code[match.end():body.end()]
+            closed = body.end() < length
+            tag_text = code[start:pos]
+
+            if tag == 'img' or self._prefilter.search(attrs):
+                tag_text = self._rewrite_tag(tag, attrs, closed, tag_text, removed)
+
+            if capture:
+                if capture[0] == tag:
+                    capture[1] += 1
+            elif tag == 'nav' or (tag in ('ul', 'ol') and self._has_nav_class(attrs)):
+                capture = [tag, 1, len(out)]
+
+            out.append(tag_text)
+
+            if tag in _RAW_TEXT_END:
+                raw_end = _RAW_TEXT_END[tag].search(code, pos)
+                content_end = length if raw_end is None else raw_end.start()
+                out.append(code[pos:content_end])
+                pos = content_end
+
+        budget.checkpoint('tokenize')
+
+        sanitization_log = [
+            {'action': action, 'details': details, 'count': len(details)}
+            for action, details in removed.items() if details
+        ]
+        return ''.join(out), sanitization_log
+
+    def _rewrite_tag(self, tag, attrs, closed, tag_text, removed):
+        """Apply the attribute rules to one start tag, returning its new text"""
+        kept = []
+        changed = False
+        src = None
+
+        for attr in _ATTRIBUTE.finditer(attrs):
+            name = attr.group(1).lower()
+            raw = attr.group(0)
+
+            if name in self.dangerous_attributes:
+                removed['removed_dangerous_attributes'].append(raw)
+                changed = True
+                continue
+
+            value = attr.group(2)
+            quote = '"'
+            if value is None:
+                value = attr.group(3)
+                quote = "'"
+            if value is None:
+                value = attr.group(4)
+                quote = '"'
+
+            if value and _JS_PROTOCOL.search(value):
+                removed['removed_javascript_protocols'].extend(_JS_PROTOCOL_DETAIL.findall(value))
+                value = _JS_PROTOCOL.sub('', value)
+                raw = f'{attr.group(1)}={quote}{value}{quote}'
+                changed = True
+
+            if name == 'src' and value is not None:
+                lowered = value.lower()
+                if lowered.startswith('data:') and 'script' in lowered:
+                    removed['removed_data_scripts'].append(raw)
+                    changed = True
+                    continue
+                src = value
+
+            kept.append(raw)
+
+        if tag == 'img' and src is not None and not self.is_allowed_img_src(src):
+            removed['removed_images'].append(src)
+            return self.image_placeholder
+
+        if not changed:
+            return tag_text
+
+        self_closing = attrs.rstrip().endswith('/')
+        rebuilt = '<' + tag_text[1:1 + len(tag)]
+        if kept:
+            rebuilt += ' ' + ' '.join(kept)
+        if self_closing:
+            rebuilt += ' /'
+        return rebuilt + ('>' if closed else '')
+
+    @staticmethod
+    def _has_nav_class(attrs):
+        for attr in _ATTRIBUTE.finditer(attrs):
+            if attr.group(1).lower() == 'class':
+                value = attr.group(2) or attr.group(3) or attr.group(4) or ''
+                return 'nav' in value.lower()
+        return False
@@ -1,13 +1,48 @@
 from django.test import TestCase
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import override_settings
+from unittest import mock, skipUnless
+import time
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Portfolio
+from .models import Portfolio, PortfolioViewCount, SanitizationEvent
+from . import compression, views
 from .views import sanitize_portfolio_code
+from .sanitization.budget import SanitizationBudget, SanitizationTimeout
+from .sanitization import pool
+from .sanitization.cache import SizeBoundedLocMemCache
+from .sanitization.policy import SanitizationPolicy
+from .sanitization.stages import remove_data_scripts
+from .publish import exporter
+from .management.commands import export_static_portfolios
+from .username_filter import BloomFilter, username_filter
+from .analytics import ViewCounter, view_counter
+from .metadata import extract_metadata
+from io import StringIO
+import os
+import tempfile
 import json
+import gzip
+from datetime import timedelta
+from django.utils import timezone
 
 User = get_user_model()
 
+# Views tallied by the public endpoint tests are never written from a timer
+# mid-run; tests that check flushing call view_counter.flush() themselves
+no_view_count_timer = override_settings(PORTFOLIO_VIEW_COUNT_FLUSH_SECONDS=24 * 3600)
+
+def setUpModule():
+    no_view_count_timer.enable()
+
+def tearDownModule():
+    view_counter.clear()
+    no_view_count_timer.disable()
+
 class XSSPreventionTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -94,3 +129,1252 @@ class CSPReportTestCase(TestCase):
         )
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+class TokenizerEngineTestCase(TestCase):
+    def sanitize(self, code):
+        return sanitize_portfolio_code(code, engine='tokenizer')
+
+    def test_event_handler_removal(self):
+        """Test that dangerous event handlers are removed from tags"""
+        sanitized, log = self.sanitize('<div onclick="alert(\'XSS\')">Click me</div>')
+        self.assertEqual(sanitized, '<div>Click me</div>')
+        self.assertEqual(log[0]['action'], 'removed_dangerous_attributes')
+
+    def test_quoted_gt_does_not_end_tag(self):
+        """Test that a '>' inside a quoted value cannot hide a handler"""
+        sanitized, _ = self.sanitize('<div title="a>b" onmouseover="x()">Hi</div>')
+        self.assertNotIn('onmouseover', sanitized)
+        self.assertIn('title="a>b"', sanitized)
+
+    def test_javascript_protocol_and_data_script_removal(self):
+        """Test that javascript: protocols and data: scripts are removed"""
+        sanitized, log = self.sanitize(
+            '<a href="javascript:alert(1)">Link</a>'
+            '<script src="data:text/javascript,alert(1)"></script>'
+        )
+        self.assertNotIn('javascript:', sanitized)
+        self.assertNotIn('data:text/javascript', sanitized)
+        actions = [entry['action'] for entry in log]
+        self.assertIn('removed_javascript_protocols', actions)
+        self.assertIn('removed_data_scripts', actions)
+
+    def test_image_allowlist(self):
+        """Test that only images from allowed hosts are kept"""
+        sanitized, log = self.sanitize(
+            '<img src="https://i.imgur.com/a.png" alt="ok">'
+            '<img alt="bad" src="https://evil.com/b.png">'
+        )
+        self.assertIn('https://i.imgur.com/a.png', sanitized)
+        self.assertNotIn('evil.com', sanitized)
+        self.assertIn('removed-image-placeholder', sanitized)
+        self.assertEqual(log[0]['details'], ['https://evil.com/b.png'])
+
+    def test_navigation_removal(self):
+        """Test that nav blocks and nav lists are removed, nested ones whole"""
+        sanitized, log = self.sanitize(
+            '<nav><nav>a</nav>b</nav><ul class="navbar"><li>x</li></ul>'
+            '<ul class="list"><li>kept</li></ul>'
+        )
+        self.assertEqual(sanitized, '<ul class="list"><li>kept</li></ul>')
+        self.assertEqual(log[0]['count'], 2)
+
+    def test_script_content_untouched(self):
+        """Test that raw-text element content is copied as-is"""
+        code = '<script>const f = (a) => a > 1 && "<nav>";</script>'
+        sanitized, log = self.sanitize(code)
+        self.assertEqual(sanitized, code)
+        self.assertEqual(log, [])
+
+    def test_matches_regex_engine_on_clean_markup(self):
+        """Test that both engines agree on a typical portfolio"""
+        code = (
+            '<!DOCTYPE html><html><head><title>Me</title></head><body>'
+            '<!-- hero --><section class="hero"><h1>Hello</h1>'
+            '<img src="https://images.unsplash.com/photo.jpg" alt="me"></section>'
+            '<a href="https://example.com">Site</a></body></html>'
+        )
+        self.assertEqual(self.sanitize(code), sanitize_portfolio_code(code, engine='regex'))
+
+class SanitizerCacheTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        self.engine = mock.Mock(side_effect=views.sanitize_with_regex)
+
+    def test_identical_submission_skips_pipeline(self):
+        """Test that a repeated submission is served from the cache"""
+        code = '<div onclick="x()">Hi</div>'
+        with mock.patch.dict(views.SANITIZER_ENGINES, {'regex': self.engine}):
+            first = sanitize_portfolio_code(code, engine='regex')
+            second = sanitize_portfolio_code(code, engine='regex')
+        self.assertEqual(first, second)
+        self.assertEqual(self.engine.call_count, 1)
+
+    def test_rules_version_change_misses(self):
+        """Test that changing the rule set invalidates cached results"""
+        code = '<div>Hi</div>'
+        with mock.patch.dict(views.SANITIZER_ENGINES, {'regex': self.engine}):
+            sanitize_portfolio_code(code, engine='regex')
+            with mock.patch.object(views, 'SANITIZER_RULES_VERSION', 'changed'):
+                sanitize_portfolio_code(code, engine='regex')
+        self.assertEqual(self.engine.call_count, 2)
+
+    @override_settings(PORTFOLIO_SANITIZER_CACHE_MAX_BYTES=10)
+    def test_large_submission_not_cached(self):
+        """Test that submissions above the size limit are not cached"""
+        code = '<div>' + 'x' * 100 + '</div>'
+        with mock.patch.dict(views.SANITIZER_ENGINES, {'regex': self.engine}):
+            sanitize_portfolio_code(code, engine='regex')
+            sanitize_portfolio_code(code, engine='regex')
+        self.assertEqual(self.engine.call_count, 2)
+
+    def test_cache_bounded_by_total_size(self):
+        """Test that the cache evicts least recently used entries to stay under MAX_BYTES"""
+        cache = SizeBoundedLocMemCache('size-test', {'OPTIONS': {'MAX_BYTES': 2500}})
+        cache.clear()
+        cache.set('a', 'x' * 1000)
+        cache.set('b', 'x' * 1000)
+        cache.get('a')
+        cache.set('c', 'x' * 1000)
+        self.assertEqual([cache.has_key(key) for key in 'abc'], [True, False, True])
+        self.assertLessEqual(cache.size_bytes(), 2500)
+        cache.set('huge', 'x' * 5000)
+        self.assertFalse(cache.has_key('huge'))
+        cache.clear()
+        self.assertEqual(cache.size_bytes(), 0)
+
+class PathologicalInputTestCase(TestCase):
+    """Adversarial documents that made the old nav/img patterns backtrack"""
+
+    ADVERSARIAL_INPUTS = {
+        'unclosed_nav': '<nav>' * 40000,
+        'unclosed_nav_list': '<ul class="nav">x' * 40000,
+        'unclosed_ordered_nav_list': '<ol class="navbar"><li>' * 40000,
+        'img_without_src': '<img ' * 40000 + '>',
+        'img_unterminated': '<img src="x' * 40000,
+        'mixed_unclosed': '<nav><ul class="nav"><img src="a" ' * 20000,
+        'data_src_unterminated': 'src="data:' + 'script' * 20000,
+    }
+
+    def setUp(self):
+        caches['sanitizer'].clear()
+
+    def test_bounded_runtime(self):
+        """Test that every engine stays linear on adversarial input"""
+        for engine in views.SANITIZER_ENGINES:
+            for name, code in self.ADVERSARIAL_INPUTS.items():
+                with self.subTest(engine=engine, input=name):
+                    started = time.monotonic()
+                    sanitize_portfolio_code(code, engine=engine, budget=SanitizationBudget())
+                    self.assertLess(time.monotonic() - started, 2.0)
+
+    def test_unclosed_elements_are_kept(self):
+        """Test that unclosed navigation is left alone, closed navigation removed"""
+        sanitized, log = sanitize_portfolio_code('<nav>a<nav>b</nav>c', engine='regex')
+        self.assertEqual(sanitized, 'c')
+        self.assertEqual(log[0]['details'], ['<nav>a<nav>b</nav>'])
+        sanitized, _ = sanitize_portfolio_code('<ul class="nav"><li>x</li>', engine='regex')
+        self.assertEqual(sanitized, '<ul class="nav"><li>x</li>')
+
+    def test_data_script_scan_matches_pattern(self):
+        """Test that the linear data: script scan removes what the policy pattern matches"""
+        pattern = views.SANITIZATION_POLICY.data_script
+        for code in (
+            '<script src="data:text/javascript,1"></script><img src=\'data:image/png;base64,AA\'>',
+            '<x src="data:xsrc=\'data:SCRIPT\'"> <y SRC = "data:a,script',
+            'src="data:text/plain" src="data:;script\' src="',
+        ):
+            with self.subTest(code=code):
+                sanitized, removed = remove_data_scripts(code, SanitizationBudget())
+                self.assertEqual(sanitized, pattern.sub('', code))
+                self.assertEqual(removed, pattern.findall(code))
+
+    def test_quoted_gt_in_img_src(self):
+        """Test that a '>' inside src cannot smuggle a disallowed image"""
+        sanitized, _ = sanitize_portfolio_code('<img src="https://evil.com/?a>b">', engine='regex')
+        self.assertNotIn('evil.com', sanitized)
+
+    def test_budget_exceeded_raises(self):
+        """Test that a run past its budget raises SanitizationTimeout"""
+        for engine in views.SANITIZER_ENGINES:
+            budget = SanitizationBudget(seconds=1e-9)
+            time.sleep(0.001)
+            with self.subTest(engine=engine), self.assertRaises(SanitizationTimeout):
+                sanitize_portfolio_code('<nav>' * 5000, engine=engine, budget=budget)
+
+    @override_settings(PORTFOLIO_SANITIZER_TIME_BUDGET=1e-9)
+    def test_budget_exceeded_rejects_save(self):
+        """Test that a save past the budget is rejected with a 400"""
+        user = User.objects.create_user(username='slow', email='slow@example.com', password='testpass123')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.post('/api/portfolio/save/', {'user_code': '<nav>' * 5000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class BenchSanitizerCommandTestCase(TestCase):
+    def test_emits_json_report(self):
+        """Test that the benchmark reports latency, throughput and memory per case"""
+        out = StringIO()
+        call_command('bench_sanitizer', sizes='2KB', profiles='mixed,svg', iterations=2, stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(len(report['results']), 2 * len(views.SANITIZER_ENGINES))
+        case = report['results'][0]
+        self.assertGreaterEqual(case['size_bytes'], 2048)
+        self.assertIn('p99', case['latency_ms'])
+        self.assertIn('navigation', case['stages'])
+        self.assertGreater(case['peak_memory_bytes'], 0)
+
+@override_settings(PORTFOLIO_SANITIZER_POOL_ENABLED=True, PORTFOLIO_SANITIZER_POOL_THRESHOLD=1000, PORTFOLIO_SANITIZER_POOL_WORKERS=1)
+class SanitizerPoolTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        self.user = User.objects.create_user(username='pooled', email='pooled@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        pool.shutdown_pool()
+        super().tearDownClass()
+
+    def test_large_document_runs_in_pool(self):
+        """Test that large documents are sanitized in the pool with the same result"""
+        code = '<div onclick="x()">' + 'a' * 2000 + '</div><nav>menu</nav>'
+        with override_settings(PORTFOLIO_SANITIZER_POOL_ENABLED=False):
+            inline = sanitize_portfolio_code(code, engine='regex')
+        caches['sanitizer'].clear()
+        with mock.patch.object(views, 'sanitize_in_pool', wraps=pool.sanitize_in_pool) as offload:
+            pooled = sanitize_portfolio_code(code, engine='regex')
+        offload.assert_called_once()
+        self.assertEqual(pooled, inline)
+
+    def test_small_document_stays_inline(self):
+        """Test that small documents never touch the pool"""
+        with mock.patch.object(views, 'sanitize_in_pool') as offload:
+            sanitize_portfolio_code('<div>small</div>', engine='regex')
+        offload.assert_not_called()
+
+    def test_worker_failures_return_clean_errors(self):
+        """Test that worker crashes and memory limits map to 503 and 413"""
+        code = '<div>' + 'a' * 2000 + '</div>'
+        cases = [
+            (pool.SanitizationWorkerError('crashed'), status.HTTP_503_SERVICE_UNAVAILABLE),
+            (pool.SanitizationMemoryError('oom'), status.HTTP_413_REQUEST_ENTITY_TOO_LARGE),
+        ]
+        for error, expected in cases:
+            with self.subTest(error=error), mock.patch.object(views, 'sanitize_in_pool', side_effect=error):
+                response = self.client.post('/api/portfolio/save/', {'user_code': code})
+                self.assertEqual(response.status_code, expected)
+
+def misbehaving_sanitize_task(code, engine, seconds):
+    """Pool task that hangs or kills its worker when the code asks it to"""
+    if 'HANG' in code:
+        time.sleep(60)
+    if 'CRASH' in code:
+        os._exit(1)
+    return pool.sanitize_task(code, engine, seconds)
+
+class ResanitizePortfoliosCommandTestCase(TestCase):
+    def setUp(self):
+        self.portfolios = []
+        for i in range(5):
+            user = User.objects.create_user(username=f'bulk{i}', email=f'bulk{i}@example.com', password='testpass123')
+            code = f'<div>{i}</div><nav>menu</nav>' if i % 2 == 0 else f'<div>{i}</div>'
+            self.portfolios.append(Portfolio.objects.create(user=user, user_code=code))
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def run_command(self, **options):
+        out = StringIO()
+        call_command('resanitize_portfolios', engine='regex', workers=1, batch_size=2, stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_rewrites_stale_portfolios(self):
+        """Test that only portfolios changed by the current rules are rewritten"""
+        output = self.run_command()
+        self.assertIn('5 processed, 3 changed', output)
+        for portfolio in self.portfolios:
+            portfolio.refresh_from_db()
+            self.assertNotIn('<nav>', portfolio.user_code)
+        event = self.portfolios[0].sanitization_events.get()
+        self.assertEqual(event.action, 'removed_navigation')
+        self.assertEqual(self.portfolios[0].sanitization_counts, {'removed_navigation': 1})
+
+    def test_dry_run_reports_diff_without_writing(self):
+        """Test that a dry run writes a diff report and leaves rows untouched"""
+        report = os.path.join(self.tmpdir.name, 'diff.txt')
+        output = self.run_command(dry_run=True, diff_report=report)
+        self.assertIn('3 would change', output)
+        with open(report) as f:
+            self.assertIn('-<div>0</div><nav>menu</nav>', f.read())
+        self.portfolios[0].refresh_from_db()
+        self.assertIn('<nav>', self.portfolios[0].user_code)
+
+    def test_resume_from_checkpoint(self):
+        """Test that a resumed run skips portfolios before the checkpoint"""
+        checkpoint = os.path.join(self.tmpdir.name, 'checkpoint.json')
+        with open(checkpoint, 'w') as f:
+            json.dump({'last_id': self.portfolios[2].id, 'rules_version': views.SANITIZER_RULES_VERSION}, f)
+        output = self.run_command(checkpoint=checkpoint, resume=True)
+        self.assertIn('2 processed, 1 changed', output)
+        self.portfolios[0].refresh_from_db()
+        self.assertIn('<nav>', self.portfolios[0].user_code)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['last_id'], self.portfolios[4].id)
+
+    @override_settings(PORTFOLIO_SANITIZER_TIME_BUDGET=0.5)
+    def test_hung_and_crashed_workers(self):
+        """Test that hung and crashing rows fail alone and hold the checkpoint back"""
+        from .management.commands import resanitize_portfolios
+        Portfolio.objects.filter(id=self.portfolios[1].id).update(user_code='<div>HANG</div>')
+        Portfolio.objects.filter(id=self.portfolios[3].id).update(user_code='<div>CRASH</div>')
+        checkpoint = os.path.join(self.tmpdir.name, 'checkpoint.json')
+        with mock.patch.object(resanitize_portfolios, 'sanitize_task', misbehaving_sanitize_task):
+            output = self.run_command(checkpoint=checkpoint)
+        self.assertIn('5 processed, 3 changed, 2 failed', output)
+        for portfolio in (self.portfolios[2], self.portfolios[4]):
+            portfolio.refresh_from_db()
+            self.assertEqual(portfolio.sanitizer_version, views.SANITIZER_RULES_VERSION)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['last_id'], self.portfolios[1].id - 1)
+
+class SanitizationPolicyVersionTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        self.user = User.objects.create_user(username='versioned', email='versioned@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_version_tracks_rules(self):
+        """Test that the policy version changes with any rule and only then"""
+        args = (views.DANGEROUS_ATTRIBUTES, views.ALLOWED_IMG_DOMAINS, views.REMOVED_IMAGE_PLACEHOLDER, views.SANITIZER_RULES_REVISION)
+        self.assertEqual(SanitizationPolicy(*args).version, views.SANITIZATION_POLICY.version)
+        changed = SanitizationPolicy(args[0], args[1] + ['https://example.com/'], args[2], args[3])
+        self.assertNotEqual(changed.version, views.SANITIZATION_POLICY.version)
+
+    def test_save_stamps_policy_version(self):
+        """Test that saving a portfolio records the policy that sanitized it"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>Hello world</div>'})
+        portfolio = Portfolio.objects.get(user=self.user)
+        self.assertEqual(portfolio.sanitizer_version, views.SANITIZATION_POLICY.version)
+
+    def test_stale_rows_reprocessed_once(self):
+        """Test that the bulk command only picks up stale portfolios"""
+        Portfolio.objects.create(user=self.user, user_code='<div>a</div><nav>x</nav>', sanitizer_version='old')
+        out = StringIO()
+        call_command('resanitize_portfolios', engine='regex', workers=1, stdout=out, stderr=StringIO())
+        self.assertIn('1 processed, 1 changed', out.getvalue())
+        out = StringIO()
+        call_command('resanitize_portfolios', engine='regex', workers=1, stdout=out, stderr=StringIO())
+        self.assertIn('0 processed', out.getvalue())
+
+    @override_settings(PORTFOLIO_RESANITIZE_ON_READ=True)
+    def test_stale_portfolio_refreshed_on_read(self):
+        """Test that reading a stale portfolio re-sanitizes it lazily"""
+        portfolio = Portfolio.objects.create(user=self.user, user_code='<div>a</div><nav>x</nav>', sanitizer_version='old')
+        response = self.client.get('/api/portfolio/u/versioned/')
+        self.assertEqual(response.json()['user_code'], '<div>a</div>')
+        portfolio.refresh_from_db()
+        self.assertEqual(portfolio.sanitizer_version, views.SANITIZATION_POLICY.version)
+
+class SaveQueryBudgetTestCase(TestCase):
+    # Captured queries: the unlocked SELECT ruling out a no-op save, then SAVEPOINT,
+    # SELECT ... FOR UPDATE, INSERT/UPDATE, RELEASE SAVEPOINT, plus one bulk
+    # INSERT of sanitization events when any rule fired
+    SAVE_QUERIES = 5
+    EVENT_QUERIES = 1
+
+    NOISY_CODE = (
+        '<div onclick="a()" onmouseover="b()">Hi</div><a href="javascript:void(0)">x</a>'
+        '<script src="data:text/javascript,alert(1)"></script>'
+        '<img src="https://evil.com/a.png"><nav>menu</nav><ul class="nav"><li>x</li></ul>'
+    )
+
+    def setUp(self):
+        caches['sanitizer'].clear()
+        self.user = User.objects.create_user(username='budget', email='budget@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_first_save_query_count(self):
+        """Test that creating a portfolio costs a fixed number of queries"""
+        with self.assertNumQueries(self.SAVE_QUERIES + self.EVENT_QUERIES):
+            response = self.client.post('/api/portfolio/save/', {'user_code': self.NOISY_CODE})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['created'])
+
+    def test_update_query_count_independent_of_log_size(self):
+        """Test that updates cost the same queries however many rules fired"""
+        Portfolio.objects.create(user=self.user, user_code='<div>old</div>')
+        with self.assertNumQueries(self.SAVE_QUERIES):
+            self.client.post('/api/portfolio/save/', {'user_code': '<div>clean code</div>'})
+        for code in ('<div>x</div><nav>menu</nav>', self.NOISY_CODE):
+            with self.subTest(code=code), self.assertNumQueries(self.SAVE_QUERIES + self.EVENT_QUERIES):
+                response = self.client.post('/api/portfolio/save/', {'user_code': code})
+            self.assertFalse(response.data['created'])
+        portfolio = Portfolio.objects.get(user=self.user)
+        self.assertEqual(portfolio.sanitization_events.count(), 6)
+        self.assertNotIn('<nav>', portfolio.user_code)
+
+class SanitizationEventStoreTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        self.user = User.objects.create_user(username='events', email='events@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_large_fragments_are_fingerprinted(self):
+        """Test that removed fragments are stored as a hash and short excerpts"""
+        code = '<nav>' + 'x' * 10000 + '</nav><div>ok</div>'
+        self.client.post('/api/portfolio/save/', {'user_code': code})
+        event = SanitizationEvent.objects.get(portfolio__user=self.user)
+        self.assertEqual(event.count, 1)
+        self.assertEqual(len(event.fingerprint), 64)
+        self.assertLessEqual(len(event.excerpts[0]), SanitizationEvent.EXCERPT_LENGTH + 1)
+
+    def test_counts_accumulate_across_saves(self):
+        """Test that the summary counters add up every save"""
+        for i in range(2):
+            self.client.post('/api/portfolio/save/', {'user_code': f'<div>{i}</div><nav>x</nav>'})
+        portfolio = Portfolio.objects.get(user=self.user)
+        self.assertEqual(portfolio.sanitization_counts, {'removed_navigation': 2})
+        self.assertEqual(portfolio.get_sanitization_summary(), 'Removed 2 navigation elements')
+
+    def test_get_code_lists_recent_events(self):
+        """Test that get_code returns events in the old log shape"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>a</div><nav>x</nav>'})
+        response = self.client.get('/api/portfolio/my/get/')
+        entry = response.data['sanitization_log'][0]
+        self.assertEqual(entry['action'], 'removed_navigation')
+        self.assertEqual(entry['count'], 1)
+
+    def test_compaction_applies_retention_and_cap(self):
+        """Test that compaction drops expired events and caps each portfolio"""
+        portfolio = Portfolio.objects.create(user=self.user, user_code='<div>a</div>')
+        SanitizationEvent.objects.bulk_create(
+            SanitizationEvent(portfolio=portfolio, action='removed_navigation', count=1) for _ in range(5)
+        )
+        old = SanitizationEvent.objects.filter(portfolio=portfolio).order_by('id').first()
+        SanitizationEvent.objects.filter(id=old.id).update(created_at=old.created_at - timedelta(days=400))
+        out = StringIO()
+        call_command('compact_sanitization_events', days=90, keep=2, stdout=out)
+        self.assertIn('Deleted 1 expired and 2 over-cap', out.getvalue())
+        self.assertEqual(portfolio.sanitization_events.count(), 2)
+
+    def test_old_logs_carried_over(self):
+        """Test that logs set aside before migrate become events and counts after it"""
+        from django.db import connection
+        portfolio = Portfolio.objects.create(
+            user=self.user, user_code='<div>a</div>', sanitization_counts={'removed_images': 1}
+        )
+        log = [
+            {'action': 'removed_navigation', 'details': ['<nav>a</nav>', '<nav>b</nav>'], 'timestamp': '2024-01-02T03:04:05+00:00'},
+            {'action': 'removed_images', 'details': ['https://evil.com/a.png'], 'timestamp': '2024-01-02T03:04:05+00:00'},
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE portfolio_sanitization_log_stash (portfolio_id integer, sanitization_log text)')
+            cursor.execute('INSERT INTO portfolio_sanitization_log_stash VALUES (%s, %s)', [portfolio.id, json.dumps(log)])
+        out = StringIO()
+        call_command('carry_over_sanitization_logs', stdout=out)
+        self.assertIn('Carried over sanitization logs of 1 portfolios as 2 events', out.getvalue())
+        portfolio.refresh_from_db()
+        self.assertEqual(portfolio.sanitization_counts, {'removed_images': 2, 'removed_navigation': 2})
+        event = portfolio.sanitization_events.get(action='removed_navigation')
+        self.assertEqual((event.count, event.created_at.year), (2, 2024))
+        self.assertNotIn('portfolio_sanitization_log_stash', connection.introspection.table_names())
+        call_command('carry_over_sanitization_logs', stdout=out)
+        self.assertIn('No sanitization logs to carry over', out.getvalue())
+
+class NoOpSaveTestCase(TestCase):
+    # One SELECT without a lock: no transaction and no write
+    NOOP_QUERIES = 1
+
+    def setUp(self):
+        caches['sanitizer'].clear()
+        self.user = User.objects.create_user(username='noop', email='noop@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.addCleanup(views.save_coalescer.clear)
+
+    def test_unchanged_save_skips_write(self):
+        """Test that resubmitting identical code writes nothing"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>Hello world</div>'})
+        updated_at = Portfolio.objects.get(user=self.user).updated_at
+        with self.assertNumQueries(self.NOOP_QUERIES):
+            response = self.client.post('/api/portfolio/save/', {'user_code': '<div>Hello world</div>'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['unchanged'])
+        self.assertEqual(Portfolio.objects.get(user=self.user).updated_at, updated_at)
+
+    def test_unchanged_save_skips_extraction_and_compression(self):
+        """Test that a no-op save never parses or compresses the code"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>Hello world</div>'})
+        with mock.patch.object(views, 'compress_public_bodies') as compress, \
+                mock.patch.object(views, 'extract_metadata') as extract:
+            response = self.client.post('/api/portfolio/save/', {'user_code': '<div>Hello world</div>'})
+        self.assertTrue(response.data['unchanged'])
+        compress.assert_not_called()
+        extract.assert_not_called()
+
+    def test_changed_save_writes(self):
+        """Test that different code is still written and rehashed"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>Hello world</div>'})
+        response = self.client.post('/api/portfolio/save/', {'user_code': '<div>Hello again</div>'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        portfolio = Portfolio.objects.get(user=self.user)
+        self.assertEqual(portfolio.user_code, '<div>Hello again</div>')
+        self.assertEqual(len(portfolio.content_hash), 64)
+
+    def test_stale_policy_rewrites_identical_code(self):
+        """Test that identical code is rewritten when the policy changed"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>Hello world</div>'})
+        Portfolio.objects.filter(user=self.user).update(sanitizer_version='old')
+        response = self.client.post('/api/portfolio/save/', {'user_code': '<div>Hello world</div>'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(PORTFOLIO_SAVE_COALESCE_WINDOW=60)
+    def test_rapid_saves_are_coalesced(self):
+        """Test that saves inside the window are parked and only the latest is written"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>version one</div>'})
+        for i in (2, 3):
+            with self.assertNumQueries(0):
+                response = self.client.post('/api/portfolio/save/', {'user_code': f'<div>version {i}</div>'})
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Portfolio.objects.get(user=self.user).user_code, '<div>version one</div>')
+        self.assertEqual(views.save_coalescer.flush(), 1)
+        self.assertEqual(Portfolio.objects.get(user=self.user).user_code, '<div>version 3</div>')
+
+    @override_settings(PORTFOLIO_SAVE_COALESCE_WINDOW=60)
+    def test_parked_save_older_than_row_is_dropped(self):
+        """Test that a parked save never overwrites a newer write from elsewhere"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>version one</div>'})
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>version two</div>'})
+        Portfolio.objects.filter(user=self.user).update(user_code='<div>elsewhere</div>', updated_at=timezone.now())
+        views.save_coalescer.flush()
+        self.assertEqual(Portfolio.objects.get(user=self.user).user_code, '<div>elsewhere</div>')
+
+class PublicPortfolioCacheTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        caches['public_portfolios'].clear()
+        self.user = User.objects.create_user(username='visited', email='visited@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>first version</div>'})
+
+    def test_cached_payload_served_without_queries(self):
+        """Test that repeat visits are answered from the cache"""
+        self.client.get('/api/portfolio/u/visited/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/portfolio/u/visited/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['user_code'], '<div>first version</div>')
+
+    def test_save_invalidates_payload(self):
+        """Test that a save is visible on the next visit"""
+        self.client.get('/api/portfolio/u/visited/')
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>second version</div>'})
+        response = self.client.get('/api/portfolio/u/visited/')
+        self.assertEqual(response.json()['user_code'], '<div>second version</div>')
+
+    def test_username_change_invalidates_payload(self):
+        """Test that the old username stops serving the portfolio after a rename"""
+        self.client.get('/api/portfolio/u/visited/')
+        response = self.client.put('/api/profile/update/', {'username': 'renamed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/portfolio/u/visited/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/portfolio/u/renamed/').json()['user_code'], '<div>first version</div>')
+
+    def test_file_based_backend(self):
+        """Test that the cache also works on a file-based backend"""
+        with tempfile.TemporaryDirectory() as location:
+            file_caches = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'sanitizer': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sanitizer-test'},
+                'public_portfolios': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=file_caches):
+                self.client.get('/api/portfolio/u/visited/')
+                with self.assertNumQueries(0):
+                    self.client.get('/api/portfolio/u/visited/')
+                self.client.post('/api/portfolio/save/', {'user_code': '<div>second version</div>'})
+                response = self.client.get('/api/portfolio/u/visited/')
+                self.assertEqual(response.json()['user_code'], '<div>second version</div>')
+
+class PortfolioLookupTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        caches['public_portfolios'].clear()
+        self.user = User.objects.create_user(username='Nefertiti', email='nefertiti@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>queen</div>'})
+        caches['public_portfolios'].clear()
+
+    def test_public_read_is_one_query(self):
+        """Test that a cache miss loads the portfolio and username in one join"""
+        with self.assertNumQueries(1) as context:
+            response = self.client.get('/api/portfolio/u/Nefertiti/')
+        self.assertEqual(response.json()['user_code'], '<div>queen</div>')
+        sql = context.captured_queries[0]['sql']
+        self.assertIn('JOIN', sql)
+        self.assertNotIn('sanitization_counts', sql)
+
+    def test_username_matched_exactly(self):
+        """Test that a username differing only in case finds nothing"""
+        self.assertEqual(self.client.get('/api/portfolio/u/nefertiti/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/portfolio/u/nefertiti/meta/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/portfolio/u/NEFERTITI/raw/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_usernames_differing_in_case_kept_apart(self):
+        """Test that each of two usernames differing only in case gets its own portfolio"""
+        other = User.objects.create_user(username='nefertiti', email='other@example.com', password='testpass123')
+        Portfolio.objects.create(user=other, user_code='<div>namesake</div>')
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/portfolio/u/Nefertiti/').json()['user_code'], '<div>queen</div>')
+            self.assertEqual(self.client.get('/api/portfolio/u/nefertiti/').json()['user_code'], '<div>namesake</div>')
+
+    def test_one_portfolio_per_user(self):
+        """Test that a second portfolio for the same user is rejected"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Portfolio.objects.create(user=self.user, user_code='<div>second</div>')
+        self.assertEqual(Portfolio.objects.get(user=self.user).user_code, '<div>queen</div>')
+
+    def test_dedupe_command(self):
+        """Test that the dedupe command leaves single portfolios alone"""
+        out = StringIO()
+        call_command('dedupe_portfolios', stdout=out)
+        self.assertIn('Deleted 0 duplicate portfolios', out.getvalue())
+        self.assertTrue(Portfolio.objects.filter(user=self.user).exists())
+
+    def test_dedupe_skips_tables_not_yet_migrated(self):
+        """Test that dedupe deletes dependent rows only in tables that exist"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .management.commands.dedupe_portfolios import delete_rows
+        portfolio = Portfolio.objects.get(user=self.user)
+        SanitizationEvent.objects.create(portfolio=portfolio, action='removed_images', count=1)
+        # As before migrate: the variant table does not exist, so holds nothing
+        portfolio.variants.all().delete()
+        tables = set(connection.introspection.table_names()) - {'portfolio_portfoliovariant'}
+        with CaptureQueriesContext(connection) as context:
+            delete_rows(Portfolio, [portfolio.id], tables)
+        self.assertFalse(any('portfolio_portfoliovariant' in query['sql'] for query in context.captured_queries))
+        self.assertFalse(Portfolio.objects.filter(id=portfolio.id).exists())
+        self.assertFalse(SanitizationEvent.objects.filter(portfolio_id=portfolio.id).exists())
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        caches['public_portfolios'].clear()
+        self.user = User.objects.create_user(username='etagged', email='etagged@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>first version</div>'})
+
+    def test_public_etag_and_not_modified(self):
+        """Test that a matching If-None-Match gets a 304 without touching user_code"""
+        response = self.client.get('/api/portfolio/u/etagged/')
+        etag = response['ETag']
+        self.assertEqual(etag, '"%s"' % Portfolio.objects.get(user=self.user).content_hash)
+        self.assertIn('Last-Modified', response)
+        caches['public_portfolios'].clear()
+        with self.assertNumQueries(1) as context:
+            response = self.client.get('/api/portfolio/u/etagged/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotIn('user_code', context.captured_queries[0]['sql'])
+        self.assertEqual(response['ETag'], etag)
+
+    def test_public_not_modified_from_cache(self):
+        """Test that a cached payload answers revalidation with no queries"""
+        etag = self.client.get('/api/portfolio/u/etagged/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/portfolio/u/etagged/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_public_if_modified_since(self):
+        """Test that If-Modified-Since at or after updated_at gets a 304"""
+        last_modified = self.client.get('/api/portfolio/u/etagged/')['Last-Modified']
+        response = self.client.get('/api/portfolio/u/etagged/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_stale_etag_gets_full_body(self):
+        """Test that a save changes the ETag and old copies get the new body"""
+        etag = self.client.get('/api/portfolio/u/etagged/')['ETag']
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>second version</div>'})
+        response = self.client.get('/api/portfolio/u/etagged/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['user_code'], '<div>second version</div>')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_get_code_not_modified(self):
+        """Test that the owner's editor reload revalidates against metadata only"""
+        response = self.client.get('/api/portfolio/my/get/')
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        with self.assertNumQueries(1) as context:
+            response = self.client.get('/api/portfolio/my/get/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotIn('user_code', context.captured_queries[0]['sql'])
+
+class PrecompressedVariantTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        caches['public_portfolios'].clear()
+        self.user = User.objects.create_user(username='squeezed', email='squeezed@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.code = '<div>' + '<p>Hello pharaoh</p>' * 500 + '</div>'
+        self.client.post('/api/portfolio/save/', {'user_code': self.code})
+
+    def test_variants_stored_at_save(self):
+        """Test that a save stores a gzip variant of the public payload"""
+        portfolio = Portfolio.objects.get(user=self.user)
+        variant = portfolio.variants.get(format='json', encoding='gzip')
+        self.assertEqual(variant.content_hash, portfolio.content_hash)
+        self.assertEqual(gzip.decompress(bytes(variant.body)), views.public_body(self.code))
+
+    def test_compressed_before_row_lock(self):
+        """Test that variants are compressed outside the save transaction"""
+        from django.db import connection
+        depths = []
+        real_compress = views.compress_variants
+        def compress(body):
+            depths.append(len(connection.savepoint_ids))
+            return real_compress(body)
+        outside = len(connection.savepoint_ids)
+        with mock.patch.object(views, 'compress_variants', compress):
+            self.client.post('/api/portfolio/save/', {'user_code': self.code + '<p>more</p>'})
+        self.assertTrue(depths)
+        self.assertEqual(set(depths), {outside})
+        portfolio = Portfolio.objects.get(user=self.user)
+        self.assertTrue(portfolio.variants.filter(content_hash=portfolio.content_hash).exists())
+
+    def test_gzip_served_when_accepted(self):
+        """Test that gzip clients get the stored variant with its own ETag"""
+        plain = self.client.get('/api/portfolio/u/squeezed/')
+        self.assertNotIn('Content-Encoding', plain)
+        response = self.client.get('/api/portfolio/u/squeezed/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertLess(len(response.content), len(plain.content) // 10)
+        self.assertEqual(json.loads(gzip.decompress(response.content))['user_code'], self.code)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_brotli_served_when_accepted(self):
+        """Test that brotli is stored at the save-time quality and preferred over gzip"""
+        with mock.patch.object(compression.brotli, 'compress', wraps=compression.brotli.compress) as compress:
+            self.client.post('/api/portfolio/save/', {'user_code': self.code + '<p>more</p>'})
+        self.assertEqual({call.kwargs['quality'] for call in compress.call_args_list}, {settings.PORTFOLIO_BROTLI_QUALITY})
+        response = self.client.get('/api/portfolio/u/squeezed/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(compression.brotli.decompress(response.content))['user_code'], self.code + '<p>more</p>')
+
+    def test_public_cache_bounded_by_size(self):
+        """Test that the public cache is size-bounded and skips oversized payloads"""
+        self.assertIsInstance(caches['public_portfolios'], SizeBoundedLocMemCache)
+        with override_settings(PORTFOLIO_PUBLIC_CACHE_MAX_PAYLOAD_BYTES=1024):
+            self.client.get('/api/portfolio/u/squeezed/')
+            self.assertEqual(caches['public_portfolios'].size_bytes(), 0)
+            with self.assertNumQueries(2):
+                self.client.get('/api/portfolio/u/squeezed/')
+        self.client.get('/api/portfolio/u/squeezed/')
+        self.assertGreater(caches['public_portfolios'].size_bytes(), 0)
+        with self.assertNumQueries(0):
+            self.client.get('/api/portfolio/u/squeezed/')
+
+    def test_gzip_etag_revalidates(self):
+        """Test that the gzip ETag revalidates from metadata alone"""
+        etag = self.client.get('/api/portfolio/u/squeezed/', HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        caches['public_portfolios'].clear()
+        response = self.client.get('/api/portfolio/u/squeezed/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_refused_encoding_not_served(self):
+        """Test that q=0 turns an encoding off"""
+        response = self.client.get('/api/portfolio/u/squeezed/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_small_payloads_not_compressed(self):
+        """Test that tiny documents are served as they are"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>tiny page</div>'})
+        portfolio = Portfolio.objects.get(user=self.user)
+        self.assertFalse(portfolio.variants.filter(content_hash=portfolio.content_hash).exists())
+        response = self.client.get('/api/portfolio/u/squeezed/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_bench_compression_report(self):
+        """Test that the compression benchmark reports bytes and CPU per mode"""
+        out = StringIO()
+        call_command('bench_compression', sizes='20KB', iterations=2, stdout=out, stderr=StringIO())
+        result = json.loads(out.getvalue())['results'][0]
+        self.assertIn('gzip_per_request', result['per_request'])
+        self.assertLess(result['per_request']['gzip_precompressed']['bytes'], result['identity_bytes'])
+
+class RawPortfolioTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        caches['public_portfolios'].clear()
+        self.user = User.objects.create_user(username='framed', email='framed@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.code = '<html><body><h1>"Quoted" title</h1>\n<p>Line two</p></body></html>'
+        self.client.post('/api/portfolio/save/', {'user_code': self.code})
+
+    def test_raw_document_served_as_html(self):
+        """Test that the raw endpoint returns the stored document unwrapped"""
+        response = self.client.get('/api/portfolio/u/framed/raw/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertEqual(response.content.decode('utf-8'), self.code)
+        json_response = self.client.get('/api/portfolio/u/framed/')
+        self.assertLess(len(response.content), len(json_response.content))
+
+    def test_raw_document_is_sandboxed(self):
+        """Test that the raw document carries sandbox and framing headers"""
+        response = self.client.get('/api/portfolio/u/framed/raw/')
+        policy = response['Content-Security-Policy']
+        self.assertIn('sandbox allow-scripts', policy)
+        self.assertIn('frame-ancestors', policy)
+        self.assertNotIn("frame-ancestors 'none'", policy)
+        self.assertNotIn('X-Frame-Options', response)
+        # User content gets its own source lists, not the site's allowlist
+        directives = dict(d.strip().split(' ', 1) for d in policy.split(';') if ' ' in d.strip())
+        for directive in ('default-src', 'script-src', 'style-src', 'img-src', 'font-src'):
+            self.assertIn('https:', directives[directive])
+        self.assertIn("'unsafe-inline'", directives['script-src'])
+        self.assertNotIn('cdnjs.cloudflare.com', directives['script-src'])
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_raw_etag_differs_from_json(self):
+        """Test that the raw and JSON representations never share an ETag"""
+        raw = self.client.get('/api/portfolio/u/framed/raw/')
+        self.assertNotEqual(raw['ETag'], self.client.get('/api/portfolio/u/framed/')['ETag'])
+        response = self.client.get('/api/portfolio/u/framed/raw/', HTTP_IF_NONE_MATCH=raw['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_raw_save_invalidates(self):
+        """Test that a save is visible on the raw endpoint"""
+        self.client.get('/api/portfolio/u/framed/raw/')
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>second version</div>'})
+        response = self.client.get('/api/portfolio/u/framed/raw/')
+        self.assertEqual(response.content, b'<div>second version</div>')
+
+    def test_raw_missing_portfolio(self):
+        """Test that unknown users get an HTML 404"""
+        response = self.client.get('/api/portfolio/u/nobody/raw/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn(b'Portfolio not found', response.content)
+
+class StaticExportTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings_override = override_settings(
+            PORTFOLIO_STATIC_EXPORT_ENABLED=True,
+            PORTFOLIO_STATIC_EXPORT_ROOT=self.tmpdir.name,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        exporter.reset_backend()
+        self.addCleanup(exporter.reset_backend)
+        self.user = User.objects.create_user(username='exported', email='exported@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def read_published(self, username, filename='index.html'):
+        with open(os.path.join(self.tmpdir.name, 'u', username, filename), 'rb') as f:
+            return f.read()
+
+    def test_save_publishes_content_addressed_document(self):
+        """Test that a save writes the document under its hash and points the username at it"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>first version</div><nav>x</nav>'})
+        portfolio = Portfolio.objects.get(user=self.user)
+        self.assertEqual(self.read_published('exported'), b'<div>first version</div>')
+        self.assertEqual(exporter.get_backend().get_pointer('exported'), portfolio.content_hash)
+
+    def test_header_config_written_with_tree(self):
+        """Test that the export tree carries server config for the sandbox headers"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>first version</div>'})
+        for filename in (exporter.HEADERS_FILE_NAME, exporter.NGINX_SNIPPET_NAME):
+            with open(os.path.join(self.tmpdir.name, filename)) as f:
+                config = f.read()
+            self.assertIn('sandbox allow-scripts', config)
+            self.assertIn('frame-ancestors', config)
+            self.assertIn('X-Content-Type-Options', config)
+        self.assertNotIn(exporter.HEADERS_FILE_NAME, [name for name, _ in exporter.get_backend().iter_pointers()])
+
+    def test_save_swaps_pointer(self):
+        """Test that a new save repoints the username and keeps the old object until pruned"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>first version</div>'})
+        first = Portfolio.objects.get(user=self.user).content_hash
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>second version</div>'})
+        self.assertEqual(self.read_published('exported'), b'<div>second version</div>')
+        backend = exporter.get_backend()
+        self.assertTrue(backend.has_object(first))
+        # Too recent to prune until the grace period has passed
+        self.assertEqual(exporter.prune_objects(), 0)
+        self.assertEqual(exporter.prune_objects(grace_seconds=0), 1)
+        self.assertFalse(backend.has_object(first))
+
+    def test_publish_during_prune_keeps_object(self):
+        """Test that an object repointed while a prune runs is not deleted"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>first version</div>'})
+        first = Portfolio.objects.get(user=self.user).content_hash
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>second version</div>'})
+        backend = exporter.get_backend()
+        # The first version is old and unreferenced: eligible for pruning
+        old = time.time() - 7200
+        os.utime(backend._object_path(first), (old, old))
+        real_iter_pointers = backend.iter_pointers
+        def iter_pointers():
+            yield from real_iter_pointers()
+            # Reverted to the first version after the pointers were listed
+            exporter.export_portfolio('exported', b'<div>first version</div>', first)
+        with mock.patch.object(backend, 'iter_pointers', iter_pointers):
+            self.assertEqual(exporter.prune_objects(), 0)
+        self.assertTrue(backend.has_object(first))
+        self.assertEqual(self.read_published('exported'), b'<div>first version</div>')
+
+    def test_export_prune_keeps_pointers_set_meanwhile(self):
+        """Test that the export command does not prune pointers of saves made while it ran"""
+        Portfolio.objects.create(user=self.user, user_code='<div>legacy row</div>')
+        backend = exporter.get_backend()
+        real_export = export_static_portfolios.export_portfolio
+        def export_and_publish(*args, **kwargs):
+            # Another user publishes after the command's rows were read
+            backend.set_pointer('latecomer', 'e' * 64)
+            return real_export(*args, **kwargs)
+        out = StringIO()
+        with mock.patch.object(export_static_portfolios, 'export_portfolio', export_and_publish):
+            call_command('export_static_portfolios', prune=True, stdout=out, stderr=StringIO())
+        self.assertIn('pruned 0 pointers', out.getvalue())
+        self.assertEqual(backend.get_pointer('latecomer'), 'e' * 64)
+
+    def test_large_document_gets_precompressed_siblings(self):
+        """Test that the gzip variant from save time is exported next to the document"""
+        code = '<div>' + '<p>Hello pharaoh</p>' * 500 + '</div>'
+        self.client.post('/api/portfolio/save/', {'user_code': code})
+        self.assertEqual(gzip.decompress(self.read_published('exported', 'index.html.gz')), code.encode('utf-8'))
+
+    def test_username_change_moves_pointer(self):
+        """Test that renaming a user moves the published pointer"""
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>first version</div>'})
+        self.client.put('/api/profile/update/', {'username': 'moved'}, format='json')
+        backend = exporter.get_backend()
+        self.assertIsNone(backend.get_pointer('exported'))
+        self.assertEqual(self.read_published('moved'), b'<div>first version</div>')
+
+    def test_backfill_command(self):
+        """Test that the export command publishes existing rows and prunes leftovers"""
+        Portfolio.objects.create(user=self.user, user_code='<div>legacy row</div>')
+        exporter.get_backend().set_pointer('ghost', 'f' * 64)
+        out = StringIO()
+        call_command('export_static_portfolios', prune=True, stdout=out, stderr=StringIO())
+        self.assertIn('Exported 1, skipped 0, failed 0', out.getvalue())
+        self.assertIn('pruned 1 pointers', out.getvalue())
+        self.assertEqual(self.read_published('exported'), b'<div>legacy row</div>')
+
+    def test_unsafe_username_not_exported(self):
+        """Test that usernames that are not safe path segments are skipped"""
+        self.assertIsNone(exporter.pointer_name('../etc'))
+        self.assertIsNone(exporter.pointer_name('.hidden'))
+        self.assertFalse(exporter.export_portfolio('../etc', b'<div>x</div>', 'a' * 64))
+
+@override_settings(PORTFOLIO_USERNAME_FILTER_ENABLED=True)
+class UsernameFilterTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        caches['public_portfolios'].clear()
+        username_filter.invalidate()
+        username_filter.reset_stats()
+        self.addCleanup(username_filter.invalidate)
+        self.user = User.objects.create_user(username='filtered', email='filtered@example.com', password='testpass123')
+        Portfolio.objects.create(user=self.user, user_code='<div>published already</div>')
+        # Built here: a background build would not see this test's transaction
+        username_filter.rebuild()
+        self.client = APIClient()
+
+    def test_bloom_filter_membership(self):
+        """Test that added items are always found and the error rate holds"""
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'user{i}')
+        self.assertTrue(all(f'user{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_missing_username_rejected_without_queries(self):
+        """Test that enumerating missing usernames never reaches the database"""
+        self.client.get('/api/portfolio/u/filtered/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/portfolio/u/no-such-user/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        stats = username_filter.get_stats()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['rebuilds'], 1)
+
+    def test_checks_never_wait_for_a_build(self):
+        """Test that a build runs in the background and keeps publishes made meanwhile"""
+        import threading
+        username_filter.invalidate()
+        started, release = threading.Event(), threading.Event()
+        def slow_build():
+            started.set()
+            release.wait(5)
+            return BloomFilter(100, 0.01), 100
+        with mock.patch.object(username_filter, '_build', slow_build):
+            self.assertTrue(username_filter.might_exist('no-such-user'))
+            self.assertTrue(started.wait(5))
+            self.assertTrue(username_filter.might_exist('no-such-user'))
+            username_filter.add('latecomer')
+            builders = [t for t in threading.enumerate() if t.name == 'username-filter-rebuild']
+            release.set()
+            for thread in builders:
+                thread.join(5)
+        self.assertEqual(len(builders), 1)
+        self.assertFalse(username_filter.might_exist('no-such-user'))
+        self.assertTrue(username_filter.might_exist('latecomer'))
+        self.assertEqual(username_filter.get_stats()['rebuilds'], 2)
+
+    def test_new_publish_visible_immediately(self):
+        """Test that a portfolio published after the filter was built is served"""
+        self.client.get('/api/portfolio/u/filtered/')
+        newcomer = User.objects.create_user(username='newcomer', email='newcomer@example.com', password='testpass123')
+        self.client.force_authenticate(user=newcomer)
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>brand new page</div>'})
+        response = self.client.get('/api/portfolio/u/newcomer/')
+        self.assertEqual(response.json()['user_code'], '<div>brand new page</div>')
+
+    def test_rename_visible_immediately(self):
+        """Test that a renamed user's portfolio is served under the new name"""
+        self.client.get('/api/portfolio/u/filtered/')
+        self.client.force_authenticate(user=self.user)
+        self.client.put('/api/profile/update/', {'username': 'refiltered'}, format='json')
+        response = self.client.get('/api/portfolio/u/refiltered/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_false_positive_counted(self):
+        """Test that a filter hit the database disproves is counted"""
+        User.objects.create_user(username='unpublished', email='unpublished@example.com', password='testpass123')
+        username_filter.add('unpublished')
+        self.client.get('/api/portfolio/u/unpublished/')
+        self.assertEqual(username_filter.get_stats()['false_positives'], 1)
+
+    def test_stats_endpoint_is_admin_only(self):
+        """Test that filter statistics are exposed to staff only"""
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get('/api/portfolio/username-filter/stats/').status_code, status.HTTP_403_FORBIDDEN)
+        admin = User.objects.create_user(username='staff', email='staff@example.com', password='testpass123', is_staff=True)
+        self.client.force_authenticate(user=admin)
+        response = self.client.get('/api/portfolio/username-filter/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('false_positive_rate', response.data)
+
+class ViewCountTestCase(TestCase):
+    def setUp(self):
+        caches['sanitizer'].clear()
+        caches['public_portfolios'].clear()
+        view_counter.clear()
+        self.addCleanup(view_counter.clear)
+        self.user = User.objects.create_user(username='watched', email='watched@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/portfolio/save/', {'user_code': '<div>look at me</div>'})
+        self.portfolio = Portfolio.objects.get(user=self.user)
+
+    def test_views_tallied_without_queries(self):
+        """Test that counting a cached view never touches the database"""
+        self.client.get('/api/portfolio/u/watched/')
+        self.client.get('/api/portfolio/u/watched/raw/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/portfolio/u/watched/')
+            self.client.get('/api/portfolio/u/watched/raw/')
+        self.assertEqual(view_counter.pending(), 4)
+        self.assertFalse(PortfolioViewCount.objects.exists())
+
+    def test_flush_adds_to_daily_bucket(self):
+        """Test that flushes add to one row per portfolio and day"""
+        for _ in range(5):
+            self.client.get('/api/portfolio/u/watched/')
+        self.assertEqual(view_counter.flush(), 5)
+        self.client.get('/api/portfolio/u/watched/')
+        self.client.get('/api/portfolio/u/watched/')
+        view_counter.flush()
+        bucket = PortfolioViewCount.objects.get(portfolio=self.portfolio)
+        self.assertEqual(bucket.count, 7)
+        self.assertEqual(bucket.day, timezone.now().date())
+        self.assertEqual(view_counter.pending(), 0)
+
+    def test_not_modified_counted(self):
+        """Test that a revalidated visit counts as a view"""
+        etag = self.client.get('/api/portfolio/u/watched/')['ETag']
+        caches['public_portfolios'].clear()
+        self.client.get('/api/portfolio/u/watched/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(view_counter.pending(), 2)
+
+    def test_missing_portfolio_not_counted(self):
+        """Test that 404s are not tallied"""
+        self.client.get('/api/portfolio/u/nobody/')
+        self.assertEqual(view_counter.pending(), 0)
+
+    def test_failed_flush_keeps_views(self):
+        """Test that views survive a failed write for the next flush"""
+        counter = ViewCounter(write=mock.Mock(side_effect=Exception('database down')))
+        self.addCleanup(counter.clear)
+        counter.record(self.portfolio.id)
+        counter.record(self.portfolio.id)
+        self.assertEqual(counter.flush(), 0)
+        self.assertEqual(counter.pending(), 2)
+
+    def test_deleted_portfolio_views_dropped(self):
+        """Test that views of a portfolio deleted before the flush are dropped"""
+        self.client.get('/api/portfolio/u/watched/')
+        self.portfolio.delete()
+        view_counter.flush()
+        self.assertFalse(PortfolioViewCount.objects.exists())
+
+    def test_record_overhead(self):
+        """Test that tallying a view costs microseconds"""
+        counter = ViewCounter(write=mock.Mock())
+        self.addCleanup(counter.clear)
+        started = time.perf_counter()
+        for _ in range(10000):
+            counter.record(self.portfolio.id)
+        per_view = (time.perf_counter() - started) / 10000
+        self.assertLess(per_view, 0.0001)
+
+    def test_stats_endpoint(self):
+        """Test that owners see their total and daily views"""
+        for _ in range(3):
+            self.client.get('/api/portfolio/u/watched/')
+        view_counter.flush()
+        PortfolioViewCount.objects.create(portfolio=self.portfolio, day=timezone.now().date() - timedelta(days=400), count=10)
+        response = self.client.get('/api/portfolio/my/views/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total'], 13)
+        self.assertEqual([entry['count'] for entry in response.data['days']], [3])
+        self.assertEqual(self.client.get('/api/portfolio/my/views/?days=x').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stats_without_portfolio(self):
+        """Test that users without a portfolio get a 404"""
+        newcomer = User.objects.create_user(username='unseen', email='unseen@example.com', password='testpass123')
+        self.client.force_authenticate(user=newcomer)
+        self.assertEqual(self.client.get('/api/portfolio/my/views/').status_code, status.HTTP_404_NOT_FOUND)
+
+class GalleryTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        moment = timezone.now()
+        # Two pairs share an updated_at, so the id tiebreak is exercised
+        for i, minutes in enumerate([0, 1, 1, 2, 2]):
+            user = User.objects.create_user(username=f'artist{i}', email=f'artist{i}@example.com', password='testpass123',
+                                            first_name='Artist' if i == 0 else '', last_name=str(i) if i == 0 else '')
+            portfolio = Portfolio.objects.create(user=user, user_code=f'<div>work {i}</div>')
+            Portfolio.objects.filter(id=portfolio.id).update(updated_at=moment - timedelta(minutes=minutes))
+        # Never published: left empty, so not listed
+        empty = User.objects.create_user(username='blank', email='blank@example.com', password='testpass123')
+        Portfolio.objects.create(user=empty, user_code='')
+
+    def test_pages_cover_every_portfolio_once(self):
+        """Test that following cursors lists every portfolio once, newest first"""
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+            with self.assertNumQueries(1) as context:
+                response = self.client.get('/api/portfolio/gallery/', params)
+            # user_code is only filtered on, never loaded
+            self.assertNotIn('user_code', context.captured_queries[0]['sql'].split(' FROM ')[0])
+            self.assertNotIn('OFFSET', context.captured_queries[0]['sql'])
+            seen += [entry['username'] for entry in response.data['results']]
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, ['artist0', 'artist2', 'artist1', 'artist4', 'artist3'])
+
+    def test_entry_metadata(self):
+        """Test that entries carry username, title and updated_at only, never the real name"""
+        entry = self.client.get('/api/portfolio/gallery/', {'limit': 1}).data['results'][0]
+        self.assertEqual(set(entry), {'username', 'title', 'updated_at'})
+        self.assertEqual(entry['title'], 'artist0')
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        response = self.client.get('/api/portfolio/gallery/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class PortfolioMetadataTestCase(TestCase):
+    DOCUMENT = '''<!DOCTYPE html><html><head>
+<title>Ramses &amp; Co
+  Portfolio</title>
+<meta name="description" content="Builder of monuments">
+<meta property="og:image" content="https://images.unsplash.com/photo-1.jpg">
+<meta property="og:title" content="Ramses on OG">
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bulma.css">
+<script src="https://cdn.tailwindcss.com"></script>
+<!-- <script src="https://commented.example.com/x.js"></script> -->
+<script>var markup = '<img src="https://inside.script.example.com/a.png">';</script>
+</head><body><h1>Main heading</h1><img src="/local.png"></body></html>'''
+
+    def setUp(self):
+        caches['sanitizer'].clear()
+        caches['public_portfolios'].clear()
+        self.user = User.objects.create_user(username='ramses', email='ramses@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_extract_metadata(self):
+        """Test that head metadata and external resources are read from markup only"""
+        metadata = extract_metadata(self.DOCUMENT)
+        self.assertEqual(metadata['title'], 'Ramses & Co Portfolio')
+        self.assertEqual(metadata['description'], 'Builder of monuments')
+        self.assertEqual(metadata['preview_image'], 'https://images.unsplash.com/photo-1.jpg')
+        self.assertEqual(metadata['metadata']['properties']['og:title'], 'Ramses on OG')
+        self.assertEqual(metadata['metadata']['resources'], [
+            'https://cdn.jsdelivr.net/npm/bulma.css', 'https://cdn.tailwindcss.com',
+        ])
+
+    def test_title_fallbacks(self):
+        """Test that og:title, then the first heading, stand in for a missing <title>"""
+        self.assertEqual(extract_metadata('<meta property="og:title" content="OG"><h1>H</h1>')['title'], 'OG')
+        self.assertEqual(extract_metadata('<h1>The <em>first</em></h1><h1>second</h1>')['title'], 'The first')
+        self.assertEqual(extract_metadata('<div>nothing here</div>')['title'], '')
+
+    def test_metadata_stored_on_save(self):
+        """Test that a save fills the metadata columns from the sanitized code"""
+        self.client.post('/api/portfolio/save/', {'user_code': self.DOCUMENT})
+        portfolio = Portfolio.objects.get(user=self.user)
+        self.assertEqual(portfolio.title, 'Ramses & Co Portfolio')
+        self.assertEqual(portfolio.preview_image, 'https://images.unsplash.com/photo-1.jpg')
+
+    def test_metadata_extracted_before_row_lock(self):
+        """Test that metadata is extracted outside the save transaction"""
+        from django.db import connection
+        depths = []
+        def extract(code):
+            depths.append(len(connection.savepoint_ids))
+            return extract_metadata(code)
+        outside = len(connection.savepoint_ids)
+        with mock.patch.object(views, 'extract_metadata', extract):
+            self.client.post('/api/portfolio/save/', {'user_code': self.DOCUMENT})
+        self.assertEqual(depths, [outside])
+        self.assertEqual(Portfolio.objects.get(user=self.user).title, 'Ramses & Co Portfolio')
+
+    def test_metadata_endpoint(self):
+        """Test that metadata is served without loading user_code"""
+        self.client.post('/api/portfolio/save/', {'user_code': self.DOCUMENT})
+        with self.assertNumQueries(1) as context:
+            response = self.client.get('/api/portfolio/u/ramses/meta/')
+        self.assertNotIn('user_code', context.captured_queries[0]['sql'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['title'], 'Ramses & Co Portfolio')
+        self.assertEqual(response.data['description'], 'Builder of monuments')
+        self.assertEqual(self.client.get('/api/portfolio/u/nobody/meta/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_gallery_uses_extracted_title(self):
+        """Test that gallery entries prefer the extracted title"""
+        self.client.post('/api/portfolio/save/', {'user_code': self.DOCUMENT})
+        entry = self.client.get('/api/portfolio/gallery/').data['results'][0]
+        self.assertEqual(entry['title'], 'Ramses & Co Portfolio')
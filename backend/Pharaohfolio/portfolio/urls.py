@@ -3,8 +3,13 @@ from . import views
 
 urlpatterns = [
     path('my/get/', views.get_code, name='get_code'),
+    path('my/views/', views.portfolio_views, name='portfolio_views'),
     path('save/', views.code_operation, name='code_operation'),
     path('csp-report/', views.csp_report, name='csp_report'),
+    path('username-filter/stats/', views.username_filter_stats, name='username_filter_stats'),
+    path('gallery/', views.gallery, name='gallery'),
     path('u/<str:username>/', views.public_portfolio, name='public_portfolio'),  # Public portfolio endpoint
+    path('u/<str:username>/meta/', views.public_portfolio_metadata, name='public_portfolio_metadata'),
+    path('u/<str:username>/raw/', views.public_portfolio_raw, name='public_portfolio_raw'),  # Bare HTML for iframe src
 ]
 
@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from .public_cache import PUBLIC_CACHE_ALIAS
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing of one SHA-256"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.sha256(item.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class PublishedUsernameFilter:
+    """
+    In-process set of lowercased usernames that may have a published portfolio, so
+    public_portfolio can turn away enumeration of missing usernames without
+    a query. A negative answer is definite; a positive one still goes to the
+    database.
+
+    The filter is built from the database on a background thread, first when
+    it is used and then every PORTFOLIO_USERNAME_FILTER_REBUILD_SECONDS, and
+    swapped in whole once built. Checks never wait for a build: until the
+    first one finishes every username passes through to the database.
+    Publishes in this process are added directly, including to a build in
+    progress; publishes in other processes are seen through a short-lived
+    marker in the public portfolio cache, which must be shared between
+    processes for that to work.
+    """
+
+    MARKER_PREFIX = 'published-username:'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._bloom = None
+        self._capacity = 0
+        self._due_at = 0.0
+        # Usernames published while a build runs, or None when none is running
+        self._pending = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = {'checks': 0, 'rejected': 0, 'passed': 0, 'false_positives': 0, 'rebuilds': 0}
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _marker_key(self, username):
+        return self.MARKER_PREFIX + hashlib.sha256(username.encode('utf-8')).hexdigest()
+
+    def _build(self):
+        # Imported here: models are not ready when this module is imported
+        from .models import Portfolio
+        usernames = list(
+            Portfolio.objects.exclude(user_code='').order_by()
+            .values_list('user__username', flat=True).iterator(chunk_size=2000)
+        )
+        # Leave room to grow until the next rebuild
+        capacity = max(settings.PORTFOLIO_USERNAME_FILTER_CAPACITY, 2 * len(usernames))
+        bloom = BloomFilter(capacity, settings.PORTFOLIO_USERNAME_FILTER_ERROR_RATE)
+        for username in usernames:
+            bloom.add(username.lower())
+        return bloom, capacity
+
+    def rebuild(self):
+        """Build the filter from the database and swap it in"""
+        with self._lock:
+            if self._pending is None:
+                self._pending = []
+        try:
+            bloom, capacity = self._build()
+        except Exception as e:
+            logger.error(f"Failed to build the published username filter: {str(e)}")
+            with self._lock:
+                self._pending = None
+                # Retried after a full period rather than on every check
+                self._due_at = time.monotonic() + settings.PORTFOLIO_USERNAME_FILTER_REBUILD_SECONDS
+            return
+        with self._lock:
+            for username in self._pending:
+                bloom.add(username)
+            self._bloom, self._capacity = bloom, capacity
+            self._pending = None
+            self._due_at = time.monotonic() + settings.PORTFOLIO_USERNAME_FILTER_REBUILD_SECONDS
+        self._count('rebuilds')
+
+    def _rebuild_in_background(self):
+        close_old_connections()
+        try:
+            self.rebuild()
+        finally:
+            close_old_connections()
+
+    def _current(self):
+        """The filter as last built, or None; starts a rebuild when one is due"""
+        bloom = self._bloom
+        if time.monotonic() >= self._due_at or (bloom is not None and bloom.count > self._capacity):
+            with self._lock:
+                if self._pending is not None:
+                    return bloom
+                self._pending = []
+            thread = threading.Thread(target=self._rebuild_in_background, name='username-filter-rebuild', daemon=True)
+            thread.start()
+        return bloom
+
+    def might_exist(self, username):
+        """False only when username certainly has no published portfolio"""
+        self._count('checks')
+        username = username.lower()
+        bloom = self._current()
+        if bloom is None or username in bloom or caches[PUBLIC_CACHE_ALIAS].get(self._marker_key(username)):
+            self._count('passed')
+            return True
+        self._count('rejected')
+        return False
+
+    def record_false_positive(self):
+        self._count('false_positives')
+
+    def add(self, username):
+        """Record a newly published username, here and for other processes"""
+        username = username.lower()
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(username)
+            if self._pending is not None:
+                self._pending.append(username)
+        caches[PUBLIC_CACHE_ALIAS].set(
+            self._marker_key(username), True, settings.PORTFOLIO_USERNAME_FILTER_REBUILD_SECONDS * 2
+        )
+
+    def invalidate(self):
+        """Drop the filter so the next check starts a rebuild"""
+        with self._lock:
+            self._bloom = None
+            self._due_at = 0.0
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['rejection_rate'] = round(stats['rejected'] / stats['checks'], 4) if stats['checks'] else None
+        # Share of usernames without a portfolio that the filter let through
+        negatives = stats['false_positives'] + stats['rejected']
+        stats['false_positive_rate'] = round(stats['false_positives'] / negatives, 4) if negatives else None
+        bloom = self._bloom
+        stats['built'] = bloom is not None
+        if bloom is not None:
+            stats['size_bits'] = bloom.size
+            stats['hash_count'] = bloom.hash_count
+            stats['usernames'] = bloom.count
+        return stats
+
+
+username_filter = PublishedUsernameFilter()
@@ -1,18 +1,46 @@
 from django.shortcuts import render, get_object_or_404
+from django.http import HttpResponse, HttpResponseNotFound, HttpResponseServerError
+from django.views.decorators.clickjacking import xframe_options_exempt
+from csp.decorators import csp_replace
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from accounts.authentication import ClaimsJWTAuthentication
 from accounts.models import User
-from .models import Portfolio
+from .models import Portfolio, PortfolioVariant, PortfolioViewCount, SanitizationEvent
+from .sanitization.policy import SanitizationPolicy
+from .sanitization.tokenizer import TokenizerSanitizer
+from .sanitization.cache import cache_key, content_hash, get_cached_result, store_result
+from .sanitization.budget import SanitizationBudget, SanitizationTimeout
+from .sanitization.pool import should_offload, sanitize_in_pool, SanitizationWorkerError, SanitizationMemoryError
+from .sanitization.stages import replace_disallowed_images, remove_data_scripts, remove_elements, NAV_OPEN, NAV_LIST_OPEN, NAV_CLASS
+from .coalesce import PendingSave, SaveCoalescer
+from .public_cache import get_public_payload, store_public_payload, invalidate_public_portfolio
+from .conditional import VALIDATOR_FIELDS, is_conditional, make_etag, not_modified, set_validators
+from .compression import ENCODINGS, compress_variants, negotiate
+from .publish.exporter import export_portfolio
+from .username_filter import username_filter
+from .analytics import view_counter
+from .gallery import InvalidCursor, gallery_page
+from .metadata import METADATA_FIELDS, extract_metadata
+import atexit
+from datetime import timedelta
 import bleach
 import hashlib
 import re
 import json
 import logging
 from Pharaohfolio.settings import SITE_DOMAIN, frontend_url
+from django.conf import settings
 from django.template.loader import render_to_string
 from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 
 logger = logging.getLogger(__name__)
 
@@ -65,18 +93,73 @@ DANGEROUS_ATTRIBUTES = [
     'onabort', 'onunload', 'onresize', 'onscroll', 'ondblclick'
 ]
 
-def sanitize_portfolio_code(code, portfolio_instance=None):
+# Image hosts portfolios may load pictures from
+ALLOWED_IMG_DOMAINS = [
+    'https://i.imgur.com/',
+    'https://live.staticflickr.com/',
+    'https://images.unsplash.com/',  # Add Unsplash as allowed
+    'https://picsum.photos/',        # Add Lorem Picsum as allowed
+]
+
+REMOVED_IMAGE_PLACEHOLDER = '<div class="removed-image-placeholder" style="background: #f0f0f0; border: 2px dashed #ccc; padding: 20px; text-align: center; color: #666;">Image removed for security<br><small>Use images from imgur.com, flickr.com, unsplash.com, or picsum.photos</small></div>'
+
+# Bump when the sanitizer code changes in a way the rule lists above don't capture
+SANITIZER_RULES_REVISION = 2
+
+# ALLOWED_TAGS and ALLOWED_ATTRIBUTES are not applied while Bleach is bypassed (see
+# Step 4 below), so they are not part of the policy and don't affect its version.
+SANITIZATION_POLICY = SanitizationPolicy(
+    DANGEROUS_ATTRIBUTES,
+    ALLOWED_IMG_DOMAINS,
+    REMOVED_IMAGE_PLACEHOLDER,
+    SANITIZER_RULES_REVISION,
+)
+
+# Version of the rule set, stored on portfolios and part of every sanitizer cache key
+SANITIZER_RULES_VERSION = SANITIZATION_POLICY.version
+
+is_allowed_img_src = SANITIZATION_POLICY.is_allowed_img_src
+
+def sanitize_portfolio_code(code, engine=None, budget=None):
     """
     Enhanced sanitization for XSS prevention with detailed logging and code preservation.
+    The engine ('regex' or 'tokenizer') defaults to settings.PORTFOLIO_SANITIZER_ENGINE.
+    Raises SanitizationTimeout when the run exceeds settings.PORTFOLIO_SANITIZER_TIME_BUDGET,
+    and SanitizationWorkerError when an offloaded run's worker crashes or hangs.
     Returns tuple: (sanitized_code, sanitization_log)
     """
+    engine = engine or settings.PORTFOLIO_SANITIZER_ENGINE
+    if engine not in SANITIZER_ENGINES:
+        raise ValueError(f"Unknown sanitizer engine: {engine}")
+
+    # Identical submissions under the same rules skip the pipeline entirely
+    key = cache_key(code, engine, SANITIZER_RULES_VERSION)
+    cached = get_cached_result(key)
+    if cached is not None:
+        sanitized, sanitization_log = cached
+    else:
+        budget = budget or SanitizationBudget(settings.PORTFOLIO_SANITIZER_TIME_BUDGET)
+        if should_offload(code):
+            # Large documents run in the process pool so they can't pin a web worker
+            sanitized, sanitization_log = sanitize_in_pool(code, engine, budget.seconds)
+        else:
+            sanitized, sanitization_log = SANITIZER_ENGINES[engine](code, budget)
+        store_result(key, code, (sanitized, sanitization_log))
+
+    return sanitized, sanitization_log
+
+def sanitize_with_regex(code, budget=None, policy=None):
+    """
+    Regex engine: applies each sanitization rule as its own pass over the code.
+    Returns tuple: (sanitized_code, sanitization_log)
+    """
+    budget = budget or SanitizationBudget()
+    policy = policy or SANITIZATION_POLICY
     sanitization_log = []
-    original_code = code
     
     # Step 1: Remove dangerous event handlers (but log what we remove)
     removed_attributes = []
-    for attr in DANGEROUS_ATTRIBUTES:
-        pattern = re.compile(rf'{attr}\s*=\s*["\'][^"\']*["\']', re.IGNORECASE)
+    for pattern in policy.event_handler_patterns:
         matches = pattern.findall(code)
         if matches:
             removed_attributes.extend(matches)
@@ -89,28 +172,29 @@ def sanitize_portfolio_code(code, portfolio_instance=None):
             'count': len(removed_attributes)
         })
 
+    budget.checkpoint('event_handlers')
+
     # Step 2: Remove javascript: protocols
-    js_protocol_matches = re.findall(r'javascript\s*:[^"\'>\s]+', code, re.IGNORECASE)
+    js_protocol_matches = policy.javascript_protocol_detail.findall(code)
     if js_protocol_matches:
         sanitization_log.append({
             'action': 'removed_javascript_protocols',
             'details': js_protocol_matches,
             'count': len(js_protocol_matches)
         })
-        js_protocol_pattern = re.compile(r'javascript\s*:', re.IGNORECASE)
-        code = js_protocol_pattern.sub('', code)
+        code = policy.javascript_protocol.sub('', code)
+
+    budget.checkpoint('javascript_protocols')
 
     # Step 3: Remove data: URLs for scripts (but allow for images)
-    data_script_matches = re.findall(r'src\s*=\s*["\']data:[^"\']*?script[^"\']*?["\']', code, re.IGNORECASE)
+    # Scanned linearly, checking the budget as it goes
+    code, data_script_matches = remove_data_scripts(code, budget)
     if data_script_matches:
         sanitization_log.append({
             'action': 'removed_data_scripts',
             'details': data_script_matches,
             'count': len(data_script_matches)
         })
-        # Optimize the regex to avoid inefficiency
-        data_script_pattern = re.compile(r'src\s*=\s*["\']data:[^"\']*?script[^"\']*?["\']', re.IGNORECASE)
-        code = data_script_pattern.sub('', code)
 
     # Step 4: Bypass Bleach HTML parsing to preserve document structures (html, head, body tags)
     # and prevent HTML-escaping inside script blocks (which corrupts javascript arrow functions and operators).
@@ -118,33 +202,14 @@ def sanitize_portfolio_code(code, portfolio_instance=None):
     # which fully isolates the execution origin.
     sanitized = code
 
+    budget.checkpoint('data_scripts')
+
     # Step 5: Handle images more intelligently
-    # Find all img tags and check their sources
-    img_pattern = re.compile(r'<img\b([^>]*?)src=["\']([^"\']*)["\']([^>]*?)>', re.IGNORECASE)
-    img_matches = img_pattern.findall(sanitized)
-    removed_images = []
-    
-    def is_allowed_img_src(src):
-        allowed_domains = [
-            'https://i.imgur.com/',
-            'https://live.staticflickr.com/',
-            'https://images.unsplash.com/',  # Add Unsplash as allowed
-            'https://picsum.photos/',        # Add Lorem Picsum as allowed
-        ]
-        return any(src.startswith(domain) for domain in allowed_domains)
-    
-    def replace_img_tag(match):
-        full_match = match.group(0)
-        before_src = match.group(1)
-        src = match.group(2)
-        after_src = match.group(3)
-        if not is_allowed_img_src(src):
-            removed_images.append(src)
-            # Replace with a placeholder div instead of removing completely
-            return f'<div class="removed-image-placeholder" style="background: #f0f0f0; border: 2px dashed #ccc; padding: 20px; text-align: center; color: #666;">Image removed for security<br><small>Use images from imgur.com, flickr.com, unsplash.com, or picsum.photos</small></div>'
-        return full_match
-    
-    sanitized = img_pattern.sub(replace_img_tag, sanitized)
+    # Replace img tags from non-allowed sources with a placeholder div instead of removing completely
+    sanitized, removed_images = replace_disallowed_images(
+        sanitized, policy.is_allowed_img_src, policy.image_placeholder, budget
+    )
+    budget.checkpoint('images')
     
     if removed_images:
         sanitization_log.append({
@@ -154,19 +219,17 @@ def sanitize_portfolio_code(code, portfolio_instance=None):
         })
 
     # Step 6: Remove navigation elements (nav, ul with nav classes, etc.)
+    # Both scans are linear even when closing tags are missing
     nav_elements_removed = []
     
     # Remove nav tags
-    nav_matches = re.findall(r'<nav\b[^>]*>.*?</nav>', sanitized, re.IGNORECASE | re.DOTALL)
-    if nav_matches:
-        nav_elements_removed.extend(nav_matches)
-        sanitized = re.sub(r'<nav\b[^>]*>.*?</nav>', '', sanitized, flags=re.IGNORECASE | re.DOTALL)
+    sanitized, nav_matches = remove_elements(sanitized, NAV_OPEN, budget)
+    nav_elements_removed.extend(nav_matches)
     
     # Remove ul/ol with navigation classes
-    nav_list_matches = re.findall(r'<(ul|ol)\b[^>]*class=["\'][^"\']*nav[^"\']*["\'][^>]*>.*?</\1>', sanitized, re.IGNORECASE | re.DOTALL)
-    if nav_list_matches:
-        nav_elements_removed.extend(nav_list_matches)
-        sanitized = re.sub(r'<(ul|ol)\b[^>]*class=["\'][^"\']*nav[^"\']*["\'][^>]*>.*?</\1>', '', sanitized, flags=re.IGNORECASE | re.DOTALL)
+    sanitized, nav_list_matches = remove_elements(sanitized, NAV_LIST_OPEN, budget, class_filter=NAV_CLASS)
+    nav_elements_removed.extend(nav_list_matches)
+    budget.checkpoint('navigation')
     
     if nav_elements_removed:
         sanitization_log.append({
@@ -175,13 +238,178 @@ def sanitize_portfolio_code(code, portfolio_instance=None):
             'count': len(nav_elements_removed)
         })
 
-    # Step 7: Log to portfolio instance if provided
-    if portfolio_instance and sanitization_log:
-        for log_entry in sanitization_log:
-            portfolio_instance.add_sanitization_log(log_entry['action'], log_entry['details'])
-
     return sanitized, sanitization_log
 
+def refresh_stale_portfolio(portfolio):
+    """
+    Lazily re-sanitize a portfolio stored under an older policy, when
+    settings.PORTFOLIO_RESANITIZE_ON_READ is on. On failure the stored code is kept
+    and the row stays stale for the resanitize_portfolios command to pick up.
+    """
+    if not settings.PORTFOLIO_RESANITIZE_ON_READ or not portfolio.is_stale(SANITIZATION_POLICY.version):
+        return portfolio
+    try:
+        sanitized_code, sanitization_log = sanitize_portfolio_code(portfolio.user_code)
+    except (SanitizationTimeout, SanitizationWorkerError) as e:
+        logger.warning(f"Could not re-sanitize stale portfolio {portfolio.pk}: {str(e)}")
+        return portfolio
+    events = portfolio.record_sanitization(sanitization_log)
+    portfolio.user_code = sanitized_code
+    portfolio.content_hash = content_hash(sanitized_code)
+    portfolio.sanitizer_version = SANITIZATION_POLICY.version
+    portfolio.set_metadata(extract_metadata(sanitized_code))
+    bodies = compress_public_bodies(sanitized_code)
+    with transaction.atomic():
+        # Not a user edit, so updated_at is left alone
+        portfolio.save(update_fields=['user_code', 'content_hash', 'sanitization_counts', 'sanitizer_version', *METADATA_FIELDS])
+        SanitizationEvent.objects.bulk_create(events)
+        variants = store_variants(portfolio, bodies)
+        publish_static(portfolio, variants)
+    return portfolio
+
+# Representations of a published portfolio: the JSON payload of
+# public_portfolio and the bare document of public_portfolio_raw
+PUBLIC_FORMATS = {
+    'json': 'application/json',
+    'html': 'text/html; charset=utf-8',
+}
+
+def public_body(user_code, fmt='json'):
+    """A public portfolio response body, uncompressed"""
+    if fmt == 'html':
+        return user_code.encode('utf-8')
+    return JSONRenderer().render({'user_code': user_code})
+
+def compress_public_bodies(user_code):
+    """
+    Compress the published payload once per format and content coding.
+    Returns {(format, encoding): body}; slow on large documents, so callers
+    run it before taking any row lock.
+    """
+    return {
+        (fmt, encoding): body
+        for fmt in PUBLIC_FORMATS
+        for encoding, body in compress_variants(public_body(user_code, fmt)).items()
+    }
+
+def build_variants(portfolio, bodies=None):
+    """Unsaved variants of a portfolio from compress_public_bodies, compressed here when not given"""
+    if bodies is None:
+        bodies = compress_public_bodies(portfolio.user_code)
+    return [
+        PortfolioVariant(portfolio=portfolio, format=fmt, encoding=encoding, content_hash=portfolio.content_hash, body=body)
+        for (fmt, encoding), body in bodies.items()
+    ]
+
+def store_variants(portfolio, bodies=None):
+    """Build and save a portfolio's variants, see save_variants; returns them"""
+    variants = build_variants(portfolio, bodies)
+    save_variants(variants)
+    return variants
+
+def save_variants(variants):
+    """
+    Upsert compressed variants in one query, so public_portfolio never
+    compresses per request.
+    """
+    if variants:
+        PortfolioVariant.objects.bulk_create(
+            variants,
+            update_conflicts=True,
+            unique_fields=['portfolio', 'format', 'encoding'],
+            update_fields=['content_hash', 'body'],
+        )
+
+def publish_static(portfolio, variants=None, username=None):
+    """
+    Export a saved portfolio to the static file store when
+    settings.PORTFOLIO_STATIC_EXPORT_ENABLED is on. Failures are logged and
+    left for export_static_portfolios to repair; they never fail the save.
+    """
+    if not settings.PORTFOLIO_STATIC_EXPORT_ENABLED:
+        return
+    username = username or portfolio.user.username
+    encoded = None
+    if variants is not None:
+        encoded = {variant.encoding: variant.body for variant in variants if variant.format == 'html'}
+    try:
+        export_portfolio(username, public_body(portfolio.user_code, 'html'), portfolio.content_hash, encoded)
+    except Exception as e:
+        logger.error(f"Failed to export static portfolio of {username}: {str(e)}")
+
+def is_unchanged(portfolio, digest, received_at=None):
+    """Whether a save of code hashing to digest would leave the stored row as it is"""
+    if portfolio.content_hash == digest and not portfolio.is_stale(SANITIZATION_POLICY.version):
+        return True
+    return bool(received_at and portfolio.updated_at >= received_at)
+
+def persist_portfolio(user, sanitized_code, sanitization_log, received_at=None):
+    """
+    Lock or create a user's portfolio, write it back with one UPDATE/INSERT and
+    append its sanitization events with one bulk INSERT, however many
+    sanitization actions fired. The old user_code is never read.
+
+    Nothing is written when the sanitized code hashes the same as the stored
+    code under the current policy, or when received_at is given and the row
+    was already written after it.
+    Returns tuple: (portfolio, created, written)
+    """
+    digest = content_hash(sanitized_code)
+    # Checked first without a lock, so an unchanged resubmission costs one
+    # read and is never parsed or compressed
+    current = Portfolio.objects.defer('user_code').filter(user=user).first()
+    if current is not None and is_unchanged(current, digest, received_at):
+        return current, False, False
+    # Parsed and compressed before the row is locked, so the lock is held for the writes alone
+    metadata = extract_metadata(sanitized_code)
+    bodies = compress_public_bodies(sanitized_code)
+    created = False
+    try:
+        with transaction.atomic():
+            portfolio = Portfolio.objects.select_for_update().defer('user_code').filter(user=user).first()
+            created = portfolio is None
+            if created:
+                portfolio = Portfolio(user=user)
+            elif is_unchanged(portfolio, digest, received_at):
+                # Written by a concurrent save since the check above
+                return portfolio, False, False
+            events = portfolio.record_sanitization(sanitization_log)
+            portfolio.user_code = sanitized_code
+            portfolio.content_hash = digest
+            portfolio.sanitizer_version = SANITIZATION_POLICY.version
+            # Read once per save so listings and link previews never parse user_code
+            portfolio.set_metadata(metadata)
+            portfolio.save()
+            SanitizationEvent.objects.bulk_create(events)
+            variants = store_variants(portfolio, bodies)
+            # Exported under the row lock, so pointers are swapped in save order
+            publish_static(portfolio, variants, username=user.username)
+    except IntegrityError:
+        if not created:
+            raise
+        # A concurrent request created this user's portfolio first; update it instead
+        return persist_portfolio(user, sanitized_code, sanitization_log, received_at)
+    invalidate_public_portfolio(user.username)
+    if settings.PORTFOLIO_USERNAME_FILTER_ENABLED:
+        username_filter.add(user.username)
+    return portfolio, created, True
+
+def persist_pending_save(pending):
+    return persist_portfolio(pending.user, pending.sanitized_code, pending.sanitization_log, pending.received_at)
+
+# Autosave coalescing, used when settings.PORTFOLIO_SAVE_COALESCE_WINDOW is set
+save_coalescer = SaveCoalescer(persist_pending_save)
+atexit.register(save_coalescer.flush)
+atexit.register(view_counter.flush)
+
+# Single-pass engine applying the same rules during one tokenizer scan
+tokenizer_sanitizer = TokenizerSanitizer(SANITIZATION_POLICY)
+
+SANITIZER_ENGINES = {
+    'regex': sanitize_with_regex,
+    'tokenizer': tokenizer_sanitizer.sanitize,
+}
+
 # Create your views here.
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -203,16 +431,50 @@ def code_operation(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Check if portfolio already exists for this user
-        portfolio, created = Portfolio.objects.get_or_create(user=user)
-        
-        # Sanitize the user code with detailed logging
-        sanitized_code, sanitization_log = sanitize_portfolio_code(user_code, portfolio)
+        received_at = timezone.now()
+
+        # Sanitize before touching the database so no transaction stays open while it runs
+        try:
+            sanitized_code, sanitization_log = sanitize_portfolio_code(user_code)
+        except SanitizationTimeout:
+            logger.warning(f"Sanitization budget exceeded for user {user.username} ({len(user_code)} chars)")
+            return Response(
+                {'error': 'Your code took too long to process. Please simplify it and try again.'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except SanitizationMemoryError:
+            logger.warning(f"Sanitization memory limit exceeded for user {user.username} ({len(user_code)} chars)")
+            return Response(
+                {'error': 'Your code is too large to process. Please reduce its size and try again.'}, 
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        except SanitizationWorkerError as e:
+            logger.error(f"Sanitization worker failed for user {user.username}: {str(e)}")
+            return Response(
+                {'error': 'We could not process your code right now. Please try again shortly.'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         
-        # Update portfolio with sanitized code
+        # A save arriving soon after this user's last write is parked and
+        # only the latest one in the window is written
+        coalesce_window = settings.PORTFOLIO_SAVE_COALESCE_WINDOW
+        if coalesce_window and save_coalescer.defer(
+            PendingSave(user, sanitized_code, sanitization_log, received_at), coalesce_window
+        ):
+            return Response({
+                'message': 'Portfolio save queued. It will be published in a few seconds.',
+                'portfolio_url': f"{frontend_url}/u/{user.username}",
+                'created': False,
+                'queued': True,
+                'sanitization_summary': Portfolio(sanitization_counts={
+                    entry['action']: len(entry['details']) for entry in sanitization_log
+                }).get_sanitization_summary(),
+                'changes_made': len(sanitization_log) > 0,
+                'sanitization_details': sanitization_log,
+            }, status=status.HTTP_202_ACCEPTED)
+
         try:
-            portfolio.user_code = sanitized_code
-            portfolio.save()
+            portfolio, created, written = persist_portfolio(user, sanitized_code, sanitization_log)
         except Exception as e:
             logger.error(f"Failed to save portfolio for user {user.username}: {str(e)}")
             return Response(
@@ -220,6 +482,19 @@ def code_operation(request):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        if coalesce_window and written:
+            save_coalescer.written(user.id)
+
+        if not written:
+            return Response({
+                'message': 'No changes to save. Your portfolio is already up to date.',
+                'portfolio_url': f"{frontend_url}/u/{user.username}",
+                'created': False,
+                'unchanged': True,
+                'sanitization_summary': portfolio.get_sanitization_summary(),
+                'changes_made': False
+            }, status=status.HTTP_200_OK)
+
         # Send email notification only for new portfolios
         if created:
             try:
@@ -256,22 +531,164 @@ def code_operation(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+def can_revalidate(validators):
+    """
+    Whether stored validators describe what would be served: rows saved before
+    content hashes existed, or about to be re-sanitized on read, go the full path.
+    """
+    if not validators['content_hash']:
+        return False
+    return not (settings.PORTFOLIO_RESANITIZE_ON_READ and validators['sanitizer_version'] != SANITIZATION_POLICY.version)
+
+def public_validators(validators):
+    """ETag and Last-Modified timestamp of the public payload, which is user_code alone"""
+    etag = make_etag(validators['content_hash']) if validators['content_hash'] else None
+    return etag, int(validators['updated_at'].timestamp())
+
+def owner_validators(validators):
+    """ETag and Last-Modified timestamp of get_code, whose body also carries updated_at"""
+    updated_at = validators['updated_at']
+    etag = make_etag(validators['content_hash'], int(updated_at.timestamp() * 1_000_000)) if validators['content_hash'] else None
+    return etag, int(updated_at.timestamp())
+
+def encoded_etag(etag, fmt, encoding):
+    """Each format and content coding is its own representation and needs its own strong ETag"""
+    if not etag:
+        return etag
+    suffix = ''.join(f'.{part}' for part in (fmt if fmt != 'json' else None, encoding) if part)
+    return etag[:-1] + suffix + '"'
+
+def public_not_modified(request, validators, fmt):
+    """304 for a client holding any encoding of the current payload, else None"""
+    etag, last_modified = public_validators(validators)
+    for encoding in (None, *ENCODINGS):
+        response = not_modified(request, encoded_etag(etag, fmt, encoding), last_modified)
+        if response:
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+    return None
+
+def public_response(request, payload, fmt):
+    """Serve a public payload, precompressed when the client accepts a stored encoding"""
+    variants = payload.get('variants') or {}
+    encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING'), variants)
+    etag = encoded_etag(payload['etag'], fmt, encoding)
+    response = not_modified(request, etag, payload['last_modified'])
+    if not response:
+        body = variants[encoding] if encoding else payload['body']
+        response = HttpResponse(body, content_type=PUBLIC_FORMATS[fmt])
+        if encoding:
+            response['Content-Encoding'] = encoding
+        set_validators(response, etag, payload['last_modified'])
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+# Columns public_portfolio needs; sanitization_counts is only read when a
+# stale row is refreshed
+PUBLIC_PORTFOLIO_FIELDS = ('id', 'user_code', 'content_hash', 'updated_at', 'sanitizer_version', 'user__username')
+
+def published_portfolios(username):
+    """
+    The portfolio whose owner's username is exactly username. The
+    lower(username) index finds the few usernames differing at most in
+    case; the exact comparison then keeps the one that matches.
+    """
+    return (
+        Portfolio.objects.alias(username_slug=Lower('user__username'))
+        .filter(username_slug=username.lower(), user__username=username)
+    )
+
+def serve_public_portfolio(request, username, fmt):
+    """
+    Response for a published portfolio in one of PUBLIC_FORMATS.
+    Returns tuple: (response, error); response is None when nothing is published.
+    """
+    # Published payloads are cached rendered, with their validators and
+    # variants; code_operation and update_profile invalidate them
+    payload = get_public_payload(username, SANITIZER_RULES_VERSION, fmt)
+    if payload is not None:
+        if payload.get('portfolio_id'):
+            view_counter.record(payload['portfolio_id'])
+        return public_response(request, payload, fmt), None
+    filter_enabled = settings.PORTFOLIO_USERNAME_FILTER_ENABLED
+    if filter_enabled and not username_filter.might_exist(username):
+        # Certainly nothing published under this name
+        return None, 'Portfolio not found'
+    if is_conditional(request):
+        # Revalidation is answered from the row's metadata alone
+        validators = published_portfolios(username).values('id', *VALIDATOR_FIELDS).first()
+        if validators and can_revalidate(validators):
+            response = public_not_modified(request, validators, fmt)
+            if response:
+                view_counter.record(validators['id'])
+                return response, None
+    # One indexed join loading only what is served
+    portfolio = published_portfolios(username).select_related('user').only(*PUBLIC_PORTFOLIO_FIELDS).first()
+    if portfolio is None or not portfolio.user_code:
+        if filter_enabled:
+            username_filter.record_false_positive()
+        return None, 'Portfolio not found'
+    portfolio = refresh_stale_portfolio(portfolio)
+    etag, last_modified = public_validators({
+        'content_hash': portfolio.content_hash,
+        'updated_at': portfolio.updated_at,
+    })
+    body = public_body(portfolio.user_code, fmt)
+    variants = {}
+    # Bodies under the compression threshold never have stored variants
+    if len(body) >= settings.PORTFOLIO_COMPRESSION_MIN_BYTES:
+        variants = {
+            encoding: bytes(encoded) for encoding, encoded in
+            portfolio.variants.filter(format=fmt, content_hash=portfolio.content_hash)
+            .values_list('encoding', 'body')
+        }
+    payload = {
+        'portfolio_id': portfolio.id,
+        'body': body,
+        'variants': variants,
+        'etag': etag,
+        'last_modified': last_modified,
+    }
+    if not portfolio.is_stale(SANITIZATION_POLICY.version):
+        store_public_payload(username, SANITIZER_RULES_VERSION, payload, fmt)
+    view_counter.record(portfolio.id)
+    return public_response(request, payload, fmt), None
+
 @api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def get_code(request):
     try:
         user = request.user
-        portfolio = Portfolio.objects.filter(user=user).first()
+        if is_conditional(request):
+            # Revalidation is answered from the row's metadata alone
+            validators = Portfolio.objects.filter(user_id=user.id).values(*VALIDATOR_FIELDS).first()
+            if validators and can_revalidate(validators):
+                etag, last_modified = owner_validators(validators)
+                response = not_modified(request, etag, last_modified, private=True)
+                if response:
+                    return response
+
+        portfolio = Portfolio.objects.filter(user_id=user.id).first()
 
         if portfolio:
-            return Response({
+            portfolio = refresh_stale_portfolio(portfolio)
+            etag, last_modified = owner_validators({
+                'content_hash': portfolio.content_hash,
+                'updated_at': portfolio.updated_at,
+            })
+            response = Response({
                 'user_code': portfolio.user_code,
                 'user_code_status': True,
-                'sanitization_log': portfolio.sanitization_log,
+                'sanitization_log': [
+                    event.as_log_entry()
+                    for event in portfolio.sanitization_events.all()[:settings.PORTFOLIO_SANITIZATION_EVENTS_LISTED]
+                ],
                 'sanitization_summary': portfolio.get_sanitization_summary(),
                 'created_at': portfolio.created_at,
                 'updated_at': portfolio.updated_at
             })
+            return set_validators(response, etag, last_modified, private=True)
         else:
             return Response({
                 'user_code': '',
@@ -288,6 +705,38 @@ def get_code(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def portfolio_views(request):
+    """
+    Public view counts of the user's portfolio: the all-time total and daily
+    totals (UTC) for the last ?days= days. Counts lag live traffic by up to
+    PORTFOLIO_VIEW_COUNT_FLUSH_SECONDS.
+    """
+    try:
+        days = int(request.query_params.get('days', settings.PORTFOLIO_VIEW_COUNT_DAYS_LISTED))
+    except ValueError:
+        return Response({'error': 'days must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    days = min(max(days, 1), 366)
+    try:
+        portfolio_id = Portfolio.objects.filter(user_id=request.user.id).values_list('id', flat=True).first()
+        if portfolio_id is None:
+            return Response({'error': 'Portfolio not found'}, status=status.HTTP_404_NOT_FOUND)
+        counts = PortfolioViewCount.objects.filter(portfolio_id=portfolio_id)
+        since = timezone.now().date() - timedelta(days=days - 1)
+        return Response({
+            'total': counts.aggregate(total=Sum('count'))['total'] or 0,
+            'days': list(counts.filter(day__gte=since).order_by('day').values('day', 'count')),
+            'flush_interval_seconds': settings.PORTFOLIO_VIEW_COUNT_FLUSH_SECONDS,
+        })
+    except Exception as e:
+        logger.error(f"Error getting view counts for user {request.user.username}: {str(e)}")
+        return Response(
+            {'error': 'An error occurred while retrieving your view counts'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -307,12 +756,104 @@ def csp_report(request):
 @permission_classes([AllowAny])
 def public_portfolio(request, username):
     try:
-        user = User.objects.filter(username=username).first()
-        if not user:
-            return Response({'error': 'User not found'}, status=404)
-        portfolio = Portfolio.objects.filter(user=user).first()
-        if not portfolio or not portfolio.user_code:
-            return Response({'error': 'Portfolio not found'}, status=404)
-        return Response({'user_code': portfolio.user_code})
+        response, error = serve_public_portfolio(request, username, 'json')
+        if error:
+            return Response({'error': error}, status=404)
+        return response
     except Exception as e:
         return Response({'error': f'An error occurred'}, status=500)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def gallery(request):
+    """
+    Published portfolios, most recently updated first. Pass the returned
+    next_cursor as ?cursor= for the following page.
+    """
+    try:
+        limit = int(request.query_params.get('limit', settings.PORTFOLIO_GALLERY_PAGE_SIZE))
+    except ValueError:
+        return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = min(max(limit, 1), settings.PORTFOLIO_GALLERY_MAX_PAGE_SIZE)
+    try:
+        # Rows left empty by registration or a cleared editor are not published
+        rows, next_cursor = gallery_page(Portfolio.objects.exclude(user_code=''), request.query_params.get('cursor'), limit)
+    except InvalidCursor:
+        return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error listing the gallery: {str(e)}")
+        return Response({'error': 'An error occurred'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response({
+        'results': [
+            {
+                'username': row['user__username'],
+                # Never the account's real name, which the owner did not publish
+                'title': row['title'] or row['user__username'],
+                'updated_at': row['updated_at'],
+            }
+            for row in rows
+        ],
+        'next_cursor': next_cursor,
+    })
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def public_portfolio_metadata(request, username):
+    """
+    Title, description, preview image, OpenGraph properties and external
+    resources of a published portfolio, as extracted at save time, for link
+    previews and listings. Never loads user_code.
+    """
+    try:
+        portfolio = published_portfolios(username).values(
+            'title', 'description', 'preview_image', 'metadata', 'updated_at', 'user__username'
+        ).first()
+    except Exception as e:
+        logger.error(f"Error getting portfolio metadata for {username}: {str(e)}")
+        return Response({'error': 'An error occurred'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if portfolio is None:
+        return Response({'error': 'Portfolio not found'}, status=status.HTTP_404_NOT_FOUND)
+    metadata = portfolio['metadata'] or {}
+    return Response({
+        'username': portfolio['user__username'],
+        'title': portfolio['title'],
+        'description': portfolio['description'],
+        'preview_image': portfolio['preview_image'],
+        'properties': metadata.get('properties', {}),
+        'resources': metadata.get('resources', []),
+        'updated_at': portfolio['updated_at'],
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def username_filter_stats(request):
+    """Hit and false-positive rates of this process's published-username filter"""
+    return Response({
+        'enabled': settings.PORTFOLIO_USERNAME_FILTER_ENABLED,
+        **username_filter.get_stats(),
+    })
+
+@xframe_options_exempt
+@csp_replace(settings.PUBLIC_PORTFOLIO_CSP_REPLACE)
+@csp_replace(settings.PUBLIC_PORTFOLIO_CSP_REPLACE, REPORT_ONLY=True)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def public_portfolio_raw(request, username):
+    """
+    The published document itself as text/html, for loading into an iframe
+    with src. It is sandboxed by its own Content-Security-Policy, so it runs
+    in an opaque origin even when opened directly.
+    """
+    try:
+        response, error = serve_public_portfolio(request, username, 'html')
+        if error:
+            response = HttpResponseNotFound(
+                f'<!DOCTYPE html><title>{error}</title><p>{error}</p>',
+                content_type=PUBLIC_FORMATS['html'],
+            )
+    except Exception as e:
+        logger.error(f"Error serving raw portfolio of {username}: {str(e)}")
+        response = HttpResponseServerError('An error occurred', content_type='text/plain')
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Referrer-Policy'] = 'no-referrer'
+    return response
@@ -1,5 +1,9 @@
 #!/bin/bash
 
+# Stop on the first failing step, so the server never starts on a database
+# that deduping or migrating left half done
+set -e
+
 # Wait for database to be ready
 echo "Waiting for database..."
 while ! nc -z db 5432 2>/dev/null; do
@@ -31,7 +35,18 @@ echo "Running database migrations..."
 python manage.py makemigrations accounts
 python manage.py makemigrations portfolio
 python manage.py makemigrations
+# Portfolios become one per user; drop older duplicates before the constraint is added
+python manage.py dedupe_portfolios
+# Emails become unique whatever their casing; stop before migrate if accounts would block the constraint
+python manage.py find_duplicate_emails
+# Sanitization logs move off the portfolio table; set them aside before its column is dropped...
+python manage.py carry_over_sanitization_logs
 python manage.py migrate
+# ...and fold them into sanitization events and counts once the new tables exist
+python manage.py carry_over_sanitization_logs
+
+# Expired refresh tokens are deleted now and then every AUTH_TOKEN_COMPACTION_SECONDS
+python manage.py compact_token_tables --loop &
 
 # Create superuser if it doesn't exist
 echo "Creating superuser..."
@@ -1,50 +1,40 @@
 import { useParams } from 'react-router-dom';
 import { useEffect, useState } from 'react';
 import axios from 'axios';
+import { API_URL } from '../../config/api';
 
 const PublicPortfolio = () => {
   const { username } = useParams();
-  const [code, setCode] = useState('');
   const [error, setError] = useState('');
   const [loading, setLoading] = useState(true);
+  const [frameLoading, setFrameLoading] = useState(true);
   const [pageTitle, setPageTitle] = useState('Pharaohfolio');
 
-  // Extract <title> from HTML string
-  const extractTitle = (html, fallback) => {
-    if (!html) return fallback;
-    const match = html.match(/<title>(.*?)<\/title>/i);
-    if (match && match[1]) {
-      return match[1].trim();
-    }
-    return fallback;
-  };
+  // The backend serves the sanitized document itself, sandboxed by its own
+  // Content-Security-Policy, so the iframe loads it with src instead of
+  // fetching JSON and writing it into srcDoc
+  const src = `${API_URL}/api/portfolio/u/${encodeURIComponent(username)}/raw/`;
 
   useEffect(() => {
     setLoading(true);
+    setFrameLoading(true);
     setError('');
-    axios.get(`/api/portfolio/u/${username}/`)
+    // The metadata endpoint is small and tells a missing portfolio apart
+    // from a failure before the iframe is shown, and carries the title
+    // extracted from the portfolio's <title>
+    axios.get(`/api/portfolio/u/${encodeURIComponent(username)}/meta/`)
       .then(res => {
-        if (res.data?.user_code) {
-          setCode(res.data.user_code || '');
-          setError('');
-          // Set page title from HTML <title> or username or fallback
-          const title = extractTitle(res.data.user_code, username || 'Pharaohfolio');
-          setPageTitle(title);
-          document.title = title;
-        } else {
-          setError(res.data.error || 'Portfolio not found');
-          setPageTitle('Pharaohfolio');
-          document.title = 'Pharaohfolio';
-        }
+        const title = res.data?.title || username || 'Pharaohfolio';
+        setPageTitle(title);
+        document.title = title;
         setLoading(false);
       })
-      .catch(() => {
-        setError('Failed to load portfolio');
+      .catch(err => {
+        setError(err.response?.status === 404 ? 'Portfolio not found' : 'Failed to load portfolio');
         setPageTitle('Pharaohfolio');
         document.title = 'Pharaohfolio';
         setLoading(false);
       });
-    // eslint-disable-next-line
   }, [username]);
 
   if (loading) {
@@ -67,10 +57,16 @@ const PublicPortfolio = () => {
 
   return (
     <div className="h-screen w-screen overflow-hidden bg-gray-100 relative">
+      {frameLoading && (
+        <div className="absolute inset-0 flex items-center justify-center bg-gradient-to-br from-purple-100 via-indigo-100 to-blue-100">
+          <div className="text-lg text-gray-700">Loading portfolio...</div>
+        </div>
+      )}
       <iframe
         title={pageTitle}
-        srcDoc={code}
+        src={src}
         sandbox="allow-scripts"
+        onLoad={() => setFrameLoading(false)}
         className="w-full h-full border-0"
         style={{ height: '100vh', width: '100%', display: 'block' }}
       />